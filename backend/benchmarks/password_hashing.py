@@ -0,0 +1,82 @@
+"""
+Password hashing benchmark
+
+Measures bcrypt verification throughput at the configured cost, first on a
+single thread (logins per second per core) and then through the bounded pool
+used by the login endpoints. While the pool is saturated, a ticker on the
+event loop records how late it wakes up, which shows how much login load
+delays the other endpoints of the same worker.
+
+Run from the backend directory:
+
+    python -m benchmarks.password_hashing
+    BCRYPT_ROUNDS=10 PASSWORD_HASH_WORKERS=2 python -m benchmarks.password_hashing --logins 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from utils.passwords import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, pwd_context, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+def bench_single_thread(stored: str, count: int) -> float:
+    """Verifications per second on one core"""
+    start = time.perf_counter()
+    for _ in range(count):
+        pwd_context.verify(PASSWORD, stored)
+    return count / (time.perf_counter() - start)
+
+async def bench_pool(stored: str, logins: int, concurrency: int):
+    """Verifications per second through the pool, and event loop lag meanwhile"""
+    lags = []
+    stop = asyncio.Event()
+
+    async def ticker(interval: float = 0.01):
+        while not stop.is_set():
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            ok, _ = await verify_password(PASSWORD, stored)
+            assert ok
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker_task
+
+    lags.sort()
+    return {
+        "logins_per_second": logins / elapsed,
+        "loop_lag_p50_ms": statistics.median(lags) if lags else 0.0,
+        "loop_lag_p99_ms": lags[int(len(lags) * 0.99) - 1] if lags else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password verification")
+    parser.add_argument("--logins", type=int, default=100, help="verifications to run through the pool")
+    parser.add_argument("--single", type=int, default=20, help="verifications to run on one thread")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent login requests")
+    args = parser.parse_args()
+
+    stored = pwd_context.hash(PASSWORD)
+    print(f"bcrypt rounds: {BCRYPT_ROUNDS}, pool workers: {PASSWORD_HASH_WORKERS}")
+
+    per_core = bench_single_thread(stored, args.single)
+    print(f"single thread: {per_core:.1f} logins/s per core ({1000 / per_core:.1f} ms per verification)")
+
+    result = asyncio.run(bench_pool(stored, args.logins, args.concurrency))
+    print(f"pool: {result['logins_per_second']:.1f} logins/s "
+          f"({result['logins_per_second'] / PASSWORD_HASH_WORKERS:.1f} per worker thread)")
+    print(f"event loop lag while saturated: p50 {result['loop_lag_p50_ms']:.2f} ms, p99 {result['loop_lag_p99_ms']:.2f} ms")
+
+if __name__ == "__main__":
+    main()
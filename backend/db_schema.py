@@ -544,7 +544,7 @@ def insert_sample_data():
     # Insert or update account
     db.accounts.update_one(
         {"user_id": account["user_id"]},
-        {"$set": account},
+        {"$set": account, "$inc": {"permissions_version": 1}},
         upsert=True
     )
     
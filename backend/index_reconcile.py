@@ -0,0 +1,267 @@
+"""
+Index reconciliation and collection-scan detection for Xinete
+
+The indexes each collection needs are declared next to the queries that use
+them, in the `indexes` attribute of every repository in repositories/. This
+module:
+
+1. Declares the query shapes each route issues (QUERY_SHAPES)
+2. Runs explain() for every shape against a live database and reports
+   collection scans (COLLSCAN) and in-memory sorts (SORT)
+3. Creates declared indexes that are missing and, optionally, drops indexes
+   that are no longer declared
+
+Run it at deploy time, after the new code is in place:
+
+    python index_reconcile.py            # report only
+    python index_reconcile.py --apply    # create missing indexes, then verify
+    python index_reconcile.py --apply --drop
+    python index_reconcile.py --apply --drop --drop-unique email_1
+
+An index whose key is declared but whose options (unique, sparse, TTL,
+partial filter, collation) differ is reported as mismatched; --apply --drop
+rebuilds it with the declared options. Undeclared unique indexes, and unique
+indexes declared without it, are constraints, not just query aids; --drop
+leaves them in place unless they are named with --drop-unique.
+
+The exit status is non-zero when any query shape still scans a collection or
+could not be explained, or when an index is left with mismatched options.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+from pymongo import IndexModel
+from repositories import REPOSITORY_CLASSES
+from utils.mongodb import get_database
+
+# Query shapes issued by the routes. Filter values are placeholders; only the
+# shape of the filter and sort matters to the query planner.
+QUERY_SHAPES = [
+    # auth / storage / verification / download
+    {"route": "auth: user lookup", "collection": "users", "filter": {"username": "u"}},
+    {"route": "POST /auth/enterprise/login", "collection": "login_identities", "filter": {"username": "u", "enterprise_id": {"$in": ["e", "*"]}}, "sort": [("enterprise_id", -1), ("source", 1)]},
+    {"route": "rbac: permission check", "collection": "accounts", "filter": {"user_id": "u"}},
+    {"route": "GET /storage/files (individual)", "collection": "file_metadata", "filter": {"user_id": "u", "user_type": "individual"}, "sort": [("upload_date", -1), ("_id", -1)]},
+    {"route": "GET /storage/files (enterprise)", "collection": "file_metadata", "filter": {"enterprise_id": "e", "user_id": "u"}, "sort": [("upload_date", -1), ("_id", -1)]},
+    {"route": "GET /storage/files?sort=size", "collection": "file_metadata", "filter": {"enterprise_id": "e", "user_id": "u"}, "sort": [("size", 1), ("_id", 1)]},
+    {"route": "GET /storage/files?sort=filename", "collection": "file_metadata", "filter": {"user_id": "u", "user_type": "individual"}, "sort": [("filename", 1), ("_id", 1)]},
+    {"route": "GET /auth/all-users (files)", "collection": "file_metadata", "filter": {"user_id": {"$in": ["u", "v"]}}},
+    {"route": "DELETE /storage/delete (shared content)", "collection": "file_metadata", "filter": {"file_hash": "h"}},
+    {"route": "metadata: file lookup", "collection": "file_metadata", "filter": {"file_hash": "h", "user_id": "u"}},
+    {"route": "POST /storage/upload (dedup)", "collection": "file_metadata", "filter": {"content_digest": "d", "cid": {"$ne": None}}},
+    {"route": "anchoring: batch status update", "collection": "file_metadata", "filter": {"manifest_hash": "h"}},
+    {"route": "anchoring: status update", "collection": "file_metadata", "filter": {"file_hash": "h", "manifest_hash": None}},
+    {"route": "GET /storage/anchor-status/{file_hash}", "collection": "anchor_jobs", "filter": {"file_hash": "h"}},
+    {"route": "download / verify-cid: CID lookup", "collection": "cid_index", "filter": {"file_hash": "h"}},
+    {"route": "/storage/uploads/{upload_id}", "collection": "upload_sessions", "filter": {"upload_id": "u", "user_id": "u"}},
+    {"route": "upload session sweep", "collection": "upload_sessions", "filter": {"expires_at": {"$lt": datetime(2000, 1, 1)}}},
+    {"route": "anchoring: claim next job", "collection": "anchor_jobs", "filter": {"status": {"$in": ["pending", "submitted"]}, "next_attempt_at": {"$lte": datetime(2000, 1, 1)}}, "sort": [("next_attempt_at", 1)]},
+
+    # enterprise / product
+    {"route": "GET /enterprise/profile/{enterprise_id}", "collection": "enterprises", "filter": {"id": "e"}},
+    {"route": "GET /enterprise/profile", "collection": "enterprises", "filter": {"enterprise_id": "e"}},
+    {"route": "POST /enterprise/register (name)", "collection": "enterprises", "filter": {"enterprise_name": "n"}},
+    {"route": "POST /enterprise/register (email)", "collection": "enterprises", "filter": {"admin_details.email": "a@b.c"}},
+    {"route": "GET /product/{product_id}", "collection": "products", "filter": {"id": "p"}},
+    {"route": "POST /product/add", "collection": "products", "filter": {"enterprise_id": "e", "product_name": "n"}},
+    {"route": "GET /product/list/{enterprise_id}", "collection": "products", "filter": {"enterprise_id": "e"}},
+
+    # batch
+    {"route": "GET /batch/{batch_id}", "collection": "batches", "filter": {"id": "b"}},
+    {"route": "POST /batch/create (latest batch)", "collection": "batches", "filter": {"product_id": "p"}, "sort": [("creation_date", -1)]},
+    {"route": "GET /batch/list/{enterprise_id}", "collection": "batches", "filter": {"enterprise_id": "e"}, "sort": [("creation_date", -1), ("id", -1)]},
+
+    # traceability
+    {"route": "GET /trace/{event_id}", "collection": "trace_events", "filter": {"id": "t"}},
+    {"route": "GET /trace/list/{batch_id}", "collection": "trace_events", "filter": {"batch_id": "b"}, "sort": [("timestamp", 1), ("id", 1)]},
+    {"route": "GET /trace/history/{enterprise_id}", "collection": "trace_events", "filter": {"enterprise_id": "e"}, "sort": [("timestamp", -1), ("id", -1)]},
+
+    # inventory
+    {"route": "PATCH /inventory/update", "collection": "inventory", "filter": {"product_id": "p", "location": "l", "enterprise_id": "e"}},
+    {"route": "GET /inventory/{product_id}", "collection": "inventory", "filter": {"product_id": "p", "enterprise_id": "e"}},
+    {"route": "GET /inventory/audit/{product_id}", "collection": "inventory_audit_logs", "filter": {"product_id": "p", "enterprise_id": "e"}, "sort": [("timestamp", -1), ("id", -1)]},
+
+    # audit
+    {"route": "GET /audit/entity/{entity_type}/{entity_id}", "collection": "audit_logs", "filter": {"entity_type": "batch", "entity_id": "b"}, "sort": [("timestamp", -1), ("_id", -1)]},
+    {"route": "GET /audit/search (changed_by)", "collection": "audit_logs", "filter": {"changed_by": "u", "timestamp": {"$gte": datetime(2000, 1, 1)}}, "sort": [("timestamp", -1), ("_id", -1)]},
+    {"route": "GET /audit/search", "collection": "audit_logs", "filter": {}, "sort": [("timestamp", -1), ("_id", -1)]},
+]
+
+# Index options that change what an index enforces or holds
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression", "collation")
+
+def declared_indexes() -> Dict[str, List[IndexModel]]:
+    """Indexes declared by the repositories, keyed by collection name"""
+    declared = {}
+    for repository_class in REPOSITORY_CLASSES:
+        declared.setdefault(repository_class.collection_name, []).extend(repository_class.indexes)
+    return declared
+
+def _index_options(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """The options of an index document or index_information() entry"""
+    options = {option: spec[option] for option in INDEX_OPTIONS if option in spec}
+    # False is the default for both flags
+    for flag in ("unique", "sparse"):
+        if not options.get(flag, True):
+            del options[flag]
+    return options
+
+def _options_match(declared: Dict[str, Any], existing: Dict[str, Any]) -> bool:
+    """Whether an existing index has a declared index's options"""
+    declared_options, existing_options = _index_options(declared), _index_options(existing)
+    # Existing indexes report every collation field; compare the declared ones
+    declared_collation = declared_options.pop("collation", None)
+    existing_collation = existing_options.pop("collation", None)
+    if declared_collation is not None:
+        if existing_collation is None or any(existing_collation.get(k) != v for k, v in declared_collation.items()):
+            return False
+    elif existing_collation is not None and existing_collation.get("locale") != "simple":
+        return False
+    return declared_options == existing_options
+
+def _plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """Collect every stage name in an explain() plan tree"""
+    stages = []
+    if not isinstance(plan, dict):
+        return stages
+    if "stage" in plan:
+        stages.append(plan["stage"])
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+def explain_shape(db, shape: Dict[str, Any]) -> List[str]:
+    """Run explain() for a query shape and return the winning plan's stages"""
+    cursor = db[shape["collection"]].find(shape["filter"])
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    explanation = cursor.limit(100).explain()
+    return _plan_stages(explanation.get("queryPlanner", {}).get("winningPlan", {}))
+
+def verify_query_shapes(db) -> List[Dict[str, Any]]:
+    """
+    Explain every declared query shape
+
+    Returns:
+        List[Dict]: One entry per shape with its plan stages and any problems
+    """
+    results = []
+    for shape in QUERY_SHAPES:
+        try:
+            stages = explain_shape(db, shape)
+            problems = [stage for stage in stages if stage in ("COLLSCAN", "SORT")]
+        except Exception as e:
+            stages, problems = [], [f"explain failed: {str(e)}"]
+        results.append({
+            "route": shape["route"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "problems": problems,
+        })
+    return results
+
+def reconcile_indexes(db, apply: bool = False, drop: bool = False, drop_unique: List[str] = ()) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare existing indexes with the declared ones
+
+    Args:
+        db: A pymongo Database
+        apply: Create missing indexes
+        drop: Also drop indexes that are not declared (requires apply)
+        drop_unique: Names of undeclared unique indexes that may be dropped
+
+    Returns:
+        Dict: Per collection, the names of missing, mismatched (declared key,
+        different options), undeclared and kept (unique, and only dropped
+        when named in drop_unique) indexes
+    """
+    report = {}
+    for collection_name, indexes in declared_indexes().items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        existing_keys = {name: [tuple(key) for key in info["key"]] for name, info in existing.items()}
+        declared_keys = [list(index.document["key"].items()) for index in indexes]
+
+        missing, mismatched = [], {}
+        for index, keys in zip(indexes, declared_keys):
+            names = [name for name, existing_key in existing_keys.items() if existing_key == keys]
+            if not names:
+                missing.append(index)
+            elif not any(_options_match(index.document, existing[name]) for name in names):
+                mismatched[names[0]] = index
+        undeclared = [name for name, keys in existing_keys.items() if name != "_id_" and keys not in declared_keys]
+        # A unique index enforces a constraint; only drop it when asked by name
+        kept = [name for name in [*undeclared, *mismatched]
+                if existing[name].get("unique") and name not in drop_unique]
+        undeclared = [name for name in undeclared if name not in kept]
+
+        report[collection_name] = {
+            "missing": [index.document["name"] for index in missing],
+            "mismatched": list(mismatched),
+            "undeclared": undeclared,
+            "kept": kept,
+        }
+
+        if apply and missing:
+            collection.create_indexes(missing)
+        if apply and drop:
+            for name in undeclared:
+                collection.drop_index(name)
+            for name, index in mismatched.items():
+                if name not in kept:
+                    collection.drop_index(name)
+                    collection.create_indexes([index])
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile MongoDB indexes with the queries the routes issue")
+    parser.add_argument("--apply", action="store_true", help="create missing indexes")
+    parser.add_argument("--drop", action="store_true", help="with --apply, drop indexes that are not declared")
+    parser.add_argument("--drop-unique", action="append", default=[], metavar="NAME",
+                        help="with --drop, also drop this undeclared unique index (repeatable)")
+    args = parser.parse_args(argv)
+
+    db = get_database()
+
+    index_report = reconcile_indexes(db, apply=args.apply, drop=args.drop, drop_unique=args.drop_unique)
+    rebuilt = args.apply and args.drop
+    mismatches = 0
+    for collection_name, entry in index_report.items():
+        action = "created" if args.apply else "missing"
+        for name in entry["missing"]:
+            print(f"[{collection_name}] {action}: {name}")
+        for name in entry["mismatched"]:
+            if name in entry["kept"]:
+                mismatches += 1
+                print(f"[{collection_name}] options differ from the declaration, unique, kept: {name}")
+            else:
+                mismatches += not rebuilt
+                print(f"[{collection_name}] {'rebuilt' if rebuilt else 'options differ from the declaration'}: {name}")
+        for name in entry["undeclared"]:
+            print(f"[{collection_name}] {'dropped' if rebuilt else 'undeclared'}: {name}")
+        for name in entry["kept"]:
+            if name not in entry["mismatched"]:
+                print(f"[{collection_name}] undeclared unique, kept: {name}")
+
+    scans = 0
+    failures = 0
+    for result in verify_query_shapes(db):
+        if result["problems"]:
+            scans += "COLLSCAN" in result["problems"]
+            failures += any(problem.startswith("explain failed") for problem in result["problems"])
+            print(f"PROBLEM {result['route']} on {result['collection']}: {', '.join(result['problems'])} (plan: {' <- '.join(result['stages'])})")
+        else:
+            print(f"ok      {result['route']} on {result['collection']}")
+
+    print(f"{scans} query shape(s) use a collection scan")
+    print(f"{failures} query shape(s) could not be explained")
+    print(f"{mismatches} index(es) left with options that differ from the declaration")
+    return 1 if scans or failures or mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -96,7 +96,7 @@ def create_sample_data():
     for account in accounts:
         db.accounts.update_one(
             {"user_id": account["user_id"]},
-            {"$set": account},
+            {"$set": account, "$inc": {"permissions_version": 1}},
             upsert=True
         )
     
@@ -4,10 +4,16 @@ This script helps set up the initial test data for the application.
 """
 
 import os
+import asyncio
 from datetime import datetime
 import uuid
 from pymongo import MongoClient
 from utils.mongodb import get_mongo_connection
+from utils.passwords import hash_password
+
+def seed_password(password: str) -> str:
+    """Hash a test password the way registration does"""
+    return asyncio.run(hash_password(password))
 
 def create_test_users():
     print("Creating test users in MongoDB...")
@@ -23,9 +29,8 @@ def create_test_users():
         if not users_collection.find_one({"username": "ashutosh"}):
             users_collection.insert_one({
                 "username": "ashutosh",
-                "password": "Anand@123",
+                "password": seed_password("Anand@123"),
                 "wallet_address": None,
-                "files": [],
                 "user_type": "individual",
                 "created_at": datetime.now()
             })
@@ -35,9 +40,8 @@ def create_test_users():
         if not users_collection.find_one({"username": "tanmay"}):
             users_collection.insert_one({
                 "username": "tanmay",
-                "password": "Tanmay@123",
+                "password": seed_password("Tanmay@123"),
                 "wallet_address": "0xb17E8DCeA7B18B0bbA91Cd33540B38Aff8217dd7",
-                "files": [],
                 "user_type": "individual",
                 "created_at": datetime.now()
             })
@@ -69,7 +73,7 @@ def create_test_users():
                     "enterprise_id": enterprise_id,
                     "name": "John Doe",
                     "email": "admin@acmecorp.com",
-                    "password": "Admin123",  # Store password here for enterprise accounts
+                    "password": seed_password("Admin123"),  # Store password here for enterprise accounts
                     "role": "admin",
                     "permissions": ["create_batch", "update_inventory", "manage_users", "create_trace_event", "delete_batch", "create_product"],
                     "created_at": datetime.now()
@@ -80,7 +84,7 @@ def create_test_users():
             if not accounts_collection.find_one({"username": "acmeuser"}):
                 accounts_collection.insert_one({
                     "username": "acmeuser",
-                    "password": "Acme@123",
+                    "password": seed_password("Acme@123"),
                     "user_id": str(uuid.uuid4()),
                     "enterprise_id": enterprise_id,
                     "name": "Acme Test User",
@@ -113,7 +117,7 @@ def create_test_users():
                     "enterprise_id": enterprise_id,
                     "name": "Jane Smith",
                     "email": "admin@xyzltd.com",
-                    "password": "Admin456",  # Store password here for enterprise accounts
+                    "password": seed_password("Admin456"),  # Store password here for enterprise accounts
                     "role": "admin",
                     "permissions": ["create_batch", "update_inventory", "manage_users", "create_trace_event", "delete_batch", "create_product"],
                     "created_at": datetime.now()
@@ -1,24 +1,14 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from pathlib import Path
+import asyncio
 import os
-import pymongo
-from pymongo import MongoClient
-from urllib.parse import urlparse
-from dotenv import load_dotenv
-from pathlib import Path
-import os
-import pymongo
-from pymongo import MongoClient
-from urllib.parse import urlparse
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Xinete Storage Platform")
-
 # Configure logging
 import logging
 logging.basicConfig(
@@ -27,54 +17,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Function to extract database name from MongoDB URI
-def extract_db_name_from_uri(uri):
-    """
-    Parse MongoDB URI to extract database name, handling cases with
-    authentication credentials and query parameters properly.
-    
-    Returns the database name or a default value if not found
-    """
-    default_db = "xinete_storage"
-    
-    if not uri:
-        return default_db
-        
-    try:
-        # Parse the URI
-        parsed = urlparse(uri)
-        
-        # Extract path and remove leading slash
-        path = parsed.path
-        if path.startswith('/'):
-            path = path[1:]
-            
-        # If path has query parameters, extract just the DB name
-        if '?' in path:
-            path = path.split('?')[0]
-            
-        # Return the extracted database name or default
-        return path if path else default_db
-    except Exception as e:
-        logger.error(f"Error parsing MongoDB URI: {e}")
-        return default_db
-
-# Connect to MongoDB using our utility module
-from utils.mongodb import get_mongo_connection
-
-# Connect to MongoDB
-try:
-    client, db = get_mongo_connection()
-    
-    # Test connection
-    client.admin.command('ping')
-    logger.info("Successfully connected to MongoDB")
-    
-    # Log the database being used
-    logger.info(f"Using database: {db.name}")
-except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {str(e)}")
-    raise
+from utils.mongodb import connect_async, close_mongo_connection, get_async_database, get_pool_stats
+from utils.startup import run_startup_steps, cancel_background_steps
+from utils.query_monitor import query_monitor_middleware
+from utils.request_context import request_context_middleware
+
+# How long startup may take before the worker reports ready; slower steps
+# keep running in the background
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "0.75"))
+
+# Collections the application expects to exist
+REQUIRED_COLLECTIONS = ["users", "enterprises", "products", "batches", "trace_events", "inventory", "audit_logs", "file_metadata"]
 
 # Configure CORS
 # When allow_credentials=True, cannot use wildcard "*" for origins
@@ -138,24 +91,91 @@ all_allowed_headers = [
     "X-API-Key"  # Common for API authentication
 ]
 
-# In development environments, we might need to be more permissive
-# CORS configuration - use a more permissive setup in all environments to debug issues
-logger.info("Configuring CORS to handle preflight requests properly")
-
-# Always allow all origins temporarily to debug CORS issues
-# This is a permissive configuration that should work in all cases
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins 
-    allow_credentials=False,  # Must be False when using wildcard origins
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-    allow_headers=["*"],  # Allow all headers
-    expose_headers=["Content-Length", "Access-Control-Allow-Origin", "Access-Control-Allow-Credentials"],
-    max_age=600,  # Cache preflight requests for 10 minutes
-)
+async def _init_mongodb():
+    """
+    Connect to MongoDB and ensure collections and indexes exist
+
+    Returns the indexes that could not be created, which the startup report
+    shows on the step
+    """
+    await connect_async()
+    db = get_async_database()
+    logger.info(f"Using database: {db.name}")
+
+    # Create MongoDB collections if they don't exist
+    existing = set(await db.list_collection_names())
+    for collection_name in REQUIRED_COLLECTIONS + ["inventory_audit_logs", "login_identities", "anchor_jobs", "upload_sessions", "cid_index", "leases"]:
+        if collection_name not in existing:
+            logger.info(f"Creating MongoDB collection: {collection_name}")
+            await db.create_collection(collection_name)
+
+    # Create the indexes the repositories' queries rely on
+    from repositories import ensure_indexes, LoginIdentityRepository
+    index_failures = await ensure_indexes()
+
+    # Build the enterprise login lookup table on first start; of the workers
+    # starting together, one builds it
+    identity_repo = LoginIdentityRepository()
+    if await identity_repo.is_empty():
+        written = await identity_repo.rebuild(only_if_empty=True)
+        if written is not None:
+            logger.info(f"Built {written} login identities")
+    logger.info("MongoDB collections initialized")
+    return index_failures
+
+async def _init_blockchain():
+    """Construct the blockchain service off the event loop"""
+    from services.blockchain import get_blockchain_service
+    await asyncio.to_thread(get_blockchain_service)
+
+async def _init_ipfs():
+    """Construct the IPFS service off the event loop"""
+    from services.ipfs import get_ipfs_service
+    await asyncio.to_thread(get_ipfs_service)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Independent startup steps run concurrently within the startup budget
+    report = await run_startup_steps(
+        {
+            "mongodb": _init_mongodb,
+            "blockchain": _init_blockchain,
+            "ipfs": _init_ipfs,
+        },
+        STARTUP_BUDGET_SECONDS,
+    )
+    app.state.startup_report = report
+
+    # Anchor uploaded files on-chain in the background
+    from services.anchoring import get_anchor_worker, ANCHOR_WORKER_ENABLED
+    if ANCHOR_WORKER_ENABLED:
+        get_anchor_worker().start()
+
+    # Drop cached ownership answers when the contract's ownership events say so
+    from services.ownership import get_ownership_cache, OWNERSHIP_WATCHER_ENABLED
+    if OWNERSHIP_WATCHER_ENABLED:
+        get_ownership_cache().start_watcher()
+
+    # Remove abandoned resumable uploads
+    from services.upload_sessions import get_upload_session_service
+    get_upload_session_service().start_sweeper()
+
+    # Move file lists still embedded in user documents to file_metadata
+    from services.file_migration import run_file_migration
+    file_migration = asyncio.create_task(run_file_migration())
+    yield
+    file_migration.cancel()
+    await asyncio.gather(file_migration, return_exceptions=True)
+    await get_upload_session_service().stop_sweeper()
+    await get_ownership_cache().stop_watcher()
+    if ANCHOR_WORKER_ENABLED:
+        await get_anchor_worker().stop()
+    await cancel_background_steps(report)
+    from services.ipfs import close_ipfs_service
+    await close_ipfs_service()
+    close_mongo_connection()
 
 # Add logging middleware
-@app.middleware("http")
 async def log_requests(request, call_next):
     logger.info(f"Incoming request: {request.method} {request.url}")
     logger.debug(f"Request headers: {request.headers}")
@@ -164,7 +184,6 @@ async def log_requests(request, call_next):
     return response
 
 # Middleware to debug CORS issues and add headers when needed
-@app.middleware("http")
 async def cors_debug_middleware(request, call_next):
     """
     Middleware to debug CORS issues and add headers when needed.
@@ -203,41 +222,18 @@ async def cors_debug_middleware(request, call_next):
     return response
 
 # Health check endpoint
-@app.get("/")
 async def read_root():
     return {"status": "healthy", "service": "Xinete Storage Platform"}
 
-# Ensure MongoDB collections exist
-try:
-    # Create MongoDB collections if they don't exist
-    collections_to_check = ["users", "enterprises", "products", "batches", "trace_events", "inventory", "audit_logs", "file_metadata"]
-    
-    for collection_name in collections_to_check:
-        if collection_name not in db.list_collection_names():
-            logger.info(f"Creating MongoDB collection: {collection_name}")
-            db.create_collection(collection_name)
-    
-    logger.info("MongoDB collections initialized")
-except Exception as e:
-    logger.error(f"Error initializing MongoDB collections: {str(e)}")
-
-# Import routes after app initialization to avoid circular imports
-from routes import auth, storage, download, verification, enterprise, product, batch, traceability, inventory, audit
-
-# Include routers
-app.include_router(auth.router, prefix="/auth", tags=["auth"])
-app.include_router(storage.router, prefix="/storage", tags=["storage"])
-app.include_router(download.router, prefix="/api", tags=["download"])
-app.include_router(verification.router, prefix="/api/verification", tags=["verification"])
-app.include_router(enterprise.router, prefix="/enterprise", tags=["enterprise"])
-app.include_router(product.router, prefix="/product", tags=["product"])
-app.include_router(batch.router, prefix="/batch", tags=["batch"])
-app.include_router(traceability.router, prefix="/trace", tags=["traceability"])
-app.include_router(inventory.router, prefix="/inventory", tags=["inventory"])
-app.include_router(audit.router, prefix="/audit", tags=["audit"])
-
-# Register global OPTIONS handler at the highest level
-@app.options("/{full_path:path}")
+# MongoDB connection pool statistics for this worker
+async def mongo_pool_health():
+    return get_pool_stats()
+
+# Startup timing breakdown for this worker
+async def startup_health(request: Request):
+    report = getattr(request.app.state, "startup_report", None)
+    return report.as_dict() if report else {"status": "starting"}
+
 async def global_options_catch_all(request: Request, full_path: str):
     """
     Global catch-all handler for OPTIONS preflight requests.
@@ -270,6 +266,64 @@ async def global_options_catch_all(request: Request, full_path: str):
         },
     )
 
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI application.
+
+    Importing this module performs no network I/O: database connections and
+    service construction happen in the lifespan startup phase.
+    """
+    app = FastAPI(title="Xinete Storage Platform", lifespan=lifespan)
+
+    # In development environments, we might need to be more permissive
+    # CORS configuration - use a more permissive setup in all environments to debug issues
+    logger.info("Configuring CORS to handle preflight requests properly")
+
+    # Always allow all origins temporarily to debug CORS issues
+    # This is a permissive configuration that should work in all cases
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow all origins 
+        allow_credentials=False,  # Must be False when using wildcard origins
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+        allow_headers=["*"],  # Allow all headers
+        expose_headers=["Content-Length", "Access-Control-Allow-Origin", "Access-Control-Allow-Credentials", "X-Next-Cursor", "Content-Range", "Accept-Ranges", "ETag", "Content-Disposition"],
+        max_age=600,  # Cache preflight requests for 10 minutes
+    )
+
+    app.middleware("http")(log_requests)
+    app.middleware("http")(cors_debug_middleware)
+    app.middleware("http")(query_monitor_middleware)
+    app.middleware("http")(request_context_middleware)
+
+    app.get("/")(read_root)
+    app.get("/health/mongo")(mongo_pool_health)
+    app.get("/health/startup")(startup_health)
+
+    # Import routes inside the factory to avoid circular imports
+    from routes import auth, storage, uploads, download, verification, enterprise, product, batch, traceability, inventory, audit, internal
+
+    # Include routers
+    app.include_router(auth.router, prefix="/auth", tags=["auth"])
+    app.include_router(uploads.router, prefix="/storage/uploads", tags=["storage"])
+    app.include_router(storage.router, prefix="/storage", tags=["storage"])
+    app.include_router(download.router, prefix="/api", tags=["download"])
+    app.include_router(verification.router, prefix="/api/verification", tags=["verification"])
+    app.include_router(enterprise.router, prefix="/enterprise", tags=["enterprise"])
+    app.include_router(product.router, prefix="/product", tags=["product"])
+    app.include_router(batch.router, prefix="/batch", tags=["batch"])
+    app.include_router(traceability.router, prefix="/trace", tags=["traceability"])
+    app.include_router(inventory.router, prefix="/inventory", tags=["inventory"])
+    app.include_router(audit.router, prefix="/audit", tags=["audit"])
+    app.include_router(internal.router, prefix="/internal", tags=["internal"])
+
+    # Register global OPTIONS handler at the highest level
+    app.options("/{full_path:path}")(global_options_catch_all)
+
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     # Get port from environment variable or use default
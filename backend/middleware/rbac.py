@@ -1,39 +1,55 @@
 from fastapi import HTTPException, Depends, Request
 from functools import wraps
+import inspect
 import jwt
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import os
-from pymongo import MongoClient
+from utils.tokens import decode_access_token
+from services.permissions import get_permission_resolver
+from utils.request_context import get_request_context
 
 security = HTTPBearer()
-SECRET_KEY = os.getenv("SECRET_KEY", os.getenv("JWT_SECRET"))
-ALGORITHM = "HS256"
-
-# Setup MongoDB connection
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/xinete_storage")
-client = MongoClient(MONGODB_URL)
-db = client.xinete_storage
 
 def verify_user_role(required_roles):
     """
     Middleware to verify if the user has the required role(s)
-    required_roles can be a string or a list of roles (any one role is sufficient)
+    required_roles can be a string or a list of roles (any one role is sufficient).
+    An entry "permission:<name>" is met by holding that permission, resolved
+    through the cached PermissionResolver only when no listed role matches.
     """
+    # Convert required_roles to list if it's a string
+    roles_list = [required_roles] if isinstance(required_roles, str) else required_roles
+    roles = [role for role in roles_list if not role.startswith("permission:")]
+    permissions = [role.replace("permission:", "", 1) for role in roles_list if role.startswith("permission:")]
+
     def decorator(func):
+        # FastAPI reads the endpoint's parameters from this signature, so the
+        # request and credentials the wrapper needs are added to it
+        signature = inspect.signature(func)
+        wants_request = "request" in signature.parameters
+        wants_credentials = "credentials" in signature.parameters
+        parameters = list(signature.parameters.values())
+        if not wants_request:
+            parameters.append(inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+        if not wants_credentials:
+            parameters.append(inspect.Parameter(
+                "credentials", inspect.Parameter.KEYWORD_ONLY,
+                annotation=HTTPAuthorizationCredentials, default=Depends(security)
+            ))
+
         @wraps(func)
-        async def wrapper(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security), *args, **kwargs):
+        async def wrapper(*args, **kwargs):
+            request = kwargs["request"] if wants_request else kwargs.pop("request")
+            credentials = kwargs["credentials"] if wants_credentials else kwargs.pop("credentials")
             try:
                 token = credentials.credentials
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                
+                payload = decode_access_token(token)
+                get_request_context().set_claims(payload)
+
                 # Extract user ID and role from token
                 user_id = payload.get("sub")
                 user_role = payload.get("role", "individual")
                 enterprise_id = payload.get("enterprise_id")
-                
-                # Convert required_roles to list if it's a string
-                roles_list = [required_roles] if isinstance(required_roles, str) else required_roles
-                
+
                 # For enterprise-specific endpoints, verify user belongs to the enterprise
                 path_params = request.path_params
                 if "enterprise_id" in path_params and enterprise_id != path_params["enterprise_id"]:
@@ -41,43 +57,45 @@ def verify_user_role(required_roles):
                         status_code=403,
                         detail="Access denied: You don't belong to this enterprise"
                     )
-                
-                # Check if the user has any of the required roles
-                if "admin" == user_role or user_role in roles_list:
-                    # Admin has access to everything
-                    # Or user has one of the required roles
-                    # Add user info to request state for use in endpoint handlers
-                    request.state.user = {
-                        "user_id": user_id,
-                        "role": user_role,
-                        "enterprise_id": enterprise_id
-                    }
-                    
-                    # For specific permissions, check the database
-                    if any(perm.startswith("permission:") for perm in roles_list):
-                        required_permission = next(perm.replace("permission:", "") for perm in roles_list if perm.startswith("permission:"))
-                        user = db.accounts.find_one({"user_id": user_id})
-                        
-                        if not user or required_permission not in user.get("permissions", []):
-                            raise HTTPException(
-                                status_code=403,
-                                detail=f"Access denied: Required permission '{required_permission}' not found"
-                            )
-                    
-                    return await func(*args, request=request, **kwargs)
-                else:
+
+                # Admin has access to everything; otherwise one of the
+                # required roles or, failing that, one of the permissions
+                allowed = "admin" == user_role or user_role in roles
+                if not allowed:
+                    resolver = get_permission_resolver()
+                    for permission in permissions:
+                        if await resolver.has_permission(payload, permission):
+                            allowed = True
+                            break
+
+                if not allowed:
+                    if permissions and not roles:
+                        raise HTTPException(
+                            status_code=403,
+                            detail=f"Access denied: Required permission '{permissions[0]}' not found"
+                        )
                     raise HTTPException(
-                        status_code=403, 
+                        status_code=403,
                         detail=f"Access denied: Requires one of these roles: {roles_list}"
                     )
+
+                # Add user info to request state for use in endpoint handlers
+                request.state.user = {
+                    "user_id": user_id,
+                    "role": user_role,
+                    "enterprise_id": enterprise_id
+                }
+                return await func(*args, **kwargs)
             except jwt.PyJWTError as e:
                 raise HTTPException(
                     status_code=401,
                     detail=f"Invalid authentication token: {str(e)}"
                 )
+
+        wrapper.__signature__ = signature.replace(parameters=parameters)
         return wrapper
     return decorator
-    
+
 def verify_permission(required_permission):
     """
     Middleware to verify if the user has the required permission
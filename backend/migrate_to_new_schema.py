@@ -119,7 +119,7 @@ def migrate_users_to_accounts():
             # Insert or update account
             db.accounts.update_one(
                 {"user_id": account["user_id"]},
-                {"$set": account},
+                {"$set": account, "$inc": {"permissions_version": 1}},
                 upsert=True
             )
             
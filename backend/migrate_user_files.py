@@ -0,0 +1,36 @@
+"""
+Move the file lists embedded in user documents into file_metadata
+
+The API drains them in the background on startup; run this to do it ahead
+of a deploy or to check that nothing is left:
+
+    python migrate_user_files.py
+
+File lists it cannot move are left in the user document and logged: those
+with unreadable entries, and those of enterprise users whose enterprise
+cannot be resolved from their login identities.
+"""
+
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables before the modules that read them
+load_dotenv()
+
+from utils.mongodb import connect_async, close_mongo_connection
+from repositories import UserRepository
+from services.file_migration import drain_embedded_files
+
+async def main():
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    await connect_async()
+    try:
+        migrated = await drain_embedded_files()
+        remaining = len(await UserRepository().find_with_embedded_files(limit=0))
+        print(f"Migrated the file lists of {migrated} users; {remaining} still embedded")
+    finally:
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
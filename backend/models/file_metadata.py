@@ -13,6 +13,11 @@ class FileMetadata(BaseModel):
     user_type: Optional[str] = "individual"  # "individual" or "enterprise"
     enterprise_id: Optional[str] = None  # Only for enterprise users
     user_id: Optional[str] = None  # Normalized user identifier
+    cid: Optional[str] = None  # IPFS content identifier
+    content_digest: Optional[str] = None  # SHA-256 of the file content
+    anchor_status: Optional[str] = None  # Blockchain anchoring: "pending", "submitted", "confirmed" or "failed"
+    manifest_cid: Optional[str] = None  # Batch manifest listing this file, when anchored as part of a batch
+    manifest_hash: Optional[str] = None  # Hash the batch manifest is anchored under
 
     @root_validator(pre=True)
     def process_user_data(cls, values):
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class UploadSessionCreate(BaseModel):
+    """
+    Model for starting a resumable upload.
+    """
+    filename: str = Field(..., description="Name of the file being uploaded")
+    size: int = Field(..., description="Total size of the file in bytes")
+    content_type: Optional[str] = Field(None, description="MIME type of the file")
+    chunk_size: Optional[int] = Field(None, description="Size of every chunk but the last, in bytes; the server picks one if omitted")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filename": "shipment-invoices.zip",
+                "size": 734003200,
+                "content_type": "application/zip",
+                "chunk_size": 8388608
+            }
+        }
@@ -48,7 +48,6 @@ class Enterprise(User):
             "example": {
                 "username": "enterprise_user",
                 "wallet_address": "0x1234567890abcdef...",
-                "files": [],
                 "user_type": "enterprise",
                 "company_name": "Acme Corp",
                 "business_email": "contact@acme.com",
@@ -0,0 +1,36 @@
+"""
+Rebuild the login_identities table used by /auth/enterprise/login
+
+The API keeps the table in sync with its own writes to the users and
+accounts collections. Run this after changing those collections outside the
+API, e.g. after init_test_users.py or migrate_to_new_schema.py:
+
+    python rebuild_login_identities.py
+"""
+
+import sys
+import asyncio
+from dotenv import load_dotenv
+
+# Load environment variables before the modules that read them
+load_dotenv()
+
+from utils.mongodb import connect_async, close_mongo_connection
+from repositories import LoginIdentityRepository
+
+async def main():
+    await connect_async()
+    try:
+        identity_repo = LoginIdentityRepository()
+        await identity_repo.ensure_indexes()
+        written = await identity_repo.rebuild()
+        if written is None:
+            print("Another process is rebuilding login_identities; try again once it has finished")
+            return 1
+        print(f"Rebuilt login_identities: {written} identities")
+        return 0
+    finally:
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,84 @@
+"""
+Async (Motor) data access layer for the Xinete platform.
+
+Route handlers use these repositories instead of calling pymongo directly so
+that database I/O never blocks the event loop.
+"""
+
+import logging
+from repositories.base import AsyncRepository
+from repositories.users import UserRepository
+from repositories.accounts import AccountRepository, EnterpriseRepository
+from repositories.products import ProductRepository
+from repositories.batches import BatchRepository
+from repositories.trace_events import TraceEventRepository
+from repositories.inventory import InventoryRepository, InventoryAuditLogRepository
+from repositories.file_metadata import FileMetadataRepository
+from repositories.audit_logs import AuditLogRepository
+from repositories.login_identities import LoginIdentityRepository
+from repositories.anchor_jobs import AnchorJobRepository
+from repositories.upload_sessions import UploadSessionRepository
+from repositories.cid_index import CidIndexRepository
+from repositories.leases import LeaseRepository
+from repositories.unit_of_work import run_in_transaction, supports_transactions
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY_CLASSES = [
+    UserRepository,
+    AccountRepository,
+    EnterpriseRepository,
+    ProductRepository,
+    BatchRepository,
+    TraceEventRepository,
+    InventoryRepository,
+    InventoryAuditLogRepository,
+    FileMetadataRepository,
+    AuditLogRepository,
+    LoginIdentityRepository,
+    AnchorJobRepository,
+    UploadSessionRepository,
+    CidIndexRepository,
+    LeaseRepository,
+]
+
+async def ensure_indexes():
+    """
+    Create the indexes declared by every repository
+
+    A failure in one repository does not stop the others.
+
+    Returns:
+        List[Dict]: The indexes that could not be created, with the error
+    """
+    failures = []
+    for repository_class in REPOSITORY_CLASSES:
+        try:
+            failures.extend(await repository_class().ensure_indexes())
+        except Exception as e:
+            failures.append({"collection": repository_class.collection_name, "index": "*", "error": str(e)})
+            logger.error(f"Could not create the indexes of {repository_class.collection_name}: {str(e)}")
+    return failures
+
+__all__ = [
+    "REPOSITORY_CLASSES",
+    "ensure_indexes",
+    "run_in_transaction",
+    "supports_transactions",
+    "AsyncRepository",
+    "UserRepository",
+    "AccountRepository",
+    "EnterpriseRepository",
+    "ProductRepository",
+    "BatchRepository",
+    "TraceEventRepository",
+    "InventoryRepository",
+    "InventoryAuditLogRepository",
+    "FileMetadataRepository",
+    "AuditLogRepository",
+    "LoginIdentityRepository",
+    "AnchorJobRepository",
+    "UploadSessionRepository",
+    "CidIndexRepository",
+    "LeaseRepository",
+]
@@ -0,0 +1,63 @@
+"""
+Async repositories for the enterprises and accounts collections.
+"""
+
+from typing import Any, Dict, List, Optional
+from pymongo import IndexModel
+from repositories.base import AsyncRepository
+
+class EnterpriseRepository(AsyncRepository):
+    collection_name = "enterprises"
+    indexes = [
+        IndexModel([("id", 1)]),
+        # Not unique: enterprises registered through the API have no enterprise_id
+        IndexModel([("enterprise_id", 1)]),
+        IndexModel([("enterprise_name", 1)]),
+        IndexModel([("admin_details.email", 1)]),
+    ]
+
+    async def get_by_id(self, enterprise_id: str) -> Optional[Dict]:
+        return await self.find_one({"id": enterprise_id})
+
+    async def get_by_object_id(self, enterprise_id: str) -> Optional[Dict]:
+        return await self.find_one({"_id": enterprise_id})
+
+    async def get_by_enterprise_id(self, enterprise_id: str) -> Optional[Dict]:
+        return await self.find_one({"enterprise_id": enterprise_id})
+
+    async def get_by_name(self, enterprise_name: str) -> Optional[Dict]:
+        return await self.find_one({"enterprise_name": enterprise_name})
+
+    async def get_by_admin_email(self, email: str) -> Optional[Dict]:
+        return await self.find_one({"admin_details.email": email})
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def update_fields(self, enterprise_id: str, fields: Dict[str, Any]):
+        return await self.update_one({"id": enterprise_id}, {"$set": fields})
+
+    async def list_all(self) -> List[Dict]:
+        return await self.find_many({})
+
+class AccountRepository(AsyncRepository):
+    collection_name = "accounts"
+    indexes = [
+        # Unique, as created by db_schema.py
+        IndexModel([("user_id", 1)], unique=True),
+        IndexModel([("email", 1)], unique=True),
+        IndexModel([("enterprise_id", 1), ("role", 1)]),
+    ]
+
+    async def get_by_user_id(self, user_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        return await self.find_one({"user_id": user_id}, projection)
+
+    async def get_permissions(self, user_id: str) -> Optional[Dict]:
+        return await self.get_by_user_id(user_id, {"_id": 0, "permissions": 1, "permissions_version": 1})
+
+    async def set_permissions(self, user_id: str, permissions: List[str]):
+        # Every permissions change bumps the version so older token claims are ignored
+        return await self.update_one(
+            {"user_id": user_id},
+            {"$set": {"permissions": permissions}, "$inc": {"permissions_version": 1}}
+        )
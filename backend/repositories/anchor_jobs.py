@@ -0,0 +1,107 @@
+"""
+Async repository for the anchor_jobs collection.
+
+Each job anchors one (cid, file_hash) pair on the blockchain and moves
+through pending -> submitted -> confirmed, or to failed once its attempts
+are used up. Workers claim jobs with a lease, so a job held by a worker
+that died is picked up again when the lease expires.
+"""
+
+import pymongo
+from datetime import datetime, timedelta
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError
+from typing import Any, Dict, Optional
+from repositories.base import AsyncRepository
+
+ANCHOR_PENDING = "pending"
+ANCHOR_SUBMITTED = "submitted"
+ANCHOR_CONFIRMED = "confirmed"
+ANCHOR_FAILED = "failed"
+
+class AnchorJobRepository(AsyncRepository):
+    collection_name = "anchor_jobs"
+    indexes = [
+        # The contract rejects a hash that is already stored, so one job per hash
+        IndexModel([("file_hash", pymongo.ASCENDING)], unique=True),
+        # Claiming the next due job
+        IndexModel([("status", pymongo.ASCENDING), ("next_attempt_at", pymongo.ASCENDING)]),
+    ]
+
+    async def enqueue(self, cid: str, file_hash: str, requested_by: Optional[str] = None) -> Dict:
+        """Create the job for a file hash unless one exists; returns the job"""
+        now = datetime.utcnow()
+        try:
+            return await self.find_one_and_update(
+                {"file_hash": file_hash},
+                {"$setOnInsert": {
+                    "cid": cid,
+                    "file_hash": file_hash,
+                    "requested_by": requested_by,
+                    "status": ANCHOR_PENDING,
+                    "attempts": 0,
+                    "tx_hash": None,
+                    "error": None,
+                    "created_at": now,
+                    "updated_at": now,
+                    "next_attempt_at": now,
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent upload of the same content inserted it first
+            return await self.find_one({"file_hash": file_hash})
+
+    async def get_by_file_hash(self, file_hash: str) -> Optional[Dict]:
+        return await self.find_one({"file_hash": file_hash}, {"_id": 0})
+
+    async def claim_next(self, worker_id: str, lease_seconds: float) -> Optional[Dict]:
+        """
+        Lease the next job that is due: a pending job whose retry time has
+        come, or a job whose previous holder's lease ran out
+        """
+        now = datetime.utcnow()
+        return await self.find_one_and_update(
+            {
+                "status": {"$in": [ANCHOR_PENDING, ANCHOR_SUBMITTED]},
+                "next_attempt_at": {"$lte": now},
+            },
+            {"$set": {
+                "worker_id": worker_id,
+                "next_attempt_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            }},
+            sort=[("next_attempt_at", pymongo.ASCENDING)]
+        )
+
+    async def _transition(self, job_id: Any, fields: Dict[str, Any], inc: Optional[Dict[str, Any]] = None):
+        fields["updated_at"] = datetime.utcnow()
+        update = {"$set": fields}
+        if inc:
+            update["$inc"] = inc
+        return await self.update_one({"_id": job_id}, update)
+
+    async def mark_submitted(self, job_id: Any, tx_hash: str, lease_seconds: float):
+        return await self._transition(
+            job_id,
+            {"status": ANCHOR_SUBMITTED, "tx_hash": tx_hash, "error": None,
+             "next_attempt_at": datetime.utcnow() + timedelta(seconds=lease_seconds)},
+            inc={"attempts": 1}
+        )
+
+    async def mark_confirmed(self, job_id: Any, tx_hash: Optional[str], block_number: Optional[int] = None):
+        return await self._transition(job_id, {
+            "status": ANCHOR_CONFIRMED, "tx_hash": tx_hash, "block_number": block_number,
+            "error": None, "confirmed_at": datetime.utcnow()
+        })
+
+    async def schedule_retry(self, job_id: Any, error: str, delay_seconds: float, count_attempt: bool = False):
+        return await self._transition(
+            job_id,
+            {"status": ANCHOR_PENDING, "error": error,
+             "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay_seconds)},
+            inc={"attempts": 1} if count_attempt else None
+        )
+
+    async def mark_failed(self, job_id: Any, error: str):
+        return await self._transition(job_id, {"status": ANCHOR_FAILED, "error": error})
@@ -0,0 +1,32 @@
+"""
+Async repository for the audit_logs collection.
+"""
+
+import os
+import pymongo
+from pymongo import IndexModel
+from typing import Any, Dict, List, Optional, Tuple
+from repositories.base import AsyncRepository
+
+class AuditLogRepository(AsyncRepository):
+    collection_name = os.getenv("MONGO_AUDIT_COLLECTION", "audit_logs")
+    indexes = [
+        # Keyset pagination for entity trails and unfiltered searches
+        IndexModel([("entity_type", pymongo.ASCENDING), ("entity_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+        IndexModel([("changed_by", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+        IndexModel([("timestamp", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)]),
+    ]
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def list_logs(self, query: Dict[str, Any], skip: int = 0, limit: int = 0) -> List[Dict]:
+        # Exclude MongoDB _id, newest first
+        return await self.find_many(query, {"_id": 0}, sort=[("timestamp", -1)], skip=skip, limit=limit)
+
+    async def list_page(self, query: Dict[str, Any], limit: int, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[Dict], Optional[str]]:
+        """Newest first, keyed on (timestamp, _id); _id is stripped from the results"""
+        logs, next_cursor = await self.find_page(query, "timestamp", pymongo.DESCENDING, limit, cursor=cursor, skip=skip, id_field="_id")
+        for log in logs:
+            log.pop("_id", None)
+        return logs, next_cursor
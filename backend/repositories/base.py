@@ -0,0 +1,114 @@
+"""
+Base class for the async (Motor) repositories.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import IndexModel, ReturnDocument
+from utils.mongodb import get_async_collection
+from utils.pagination import keyset_query, next_cursor
+
+logger = logging.getLogger(__name__)
+
+class AsyncRepository:
+    """
+    Thin async wrapper around a single MongoDB collection.
+
+    Subclasses set `collection_name` and add query methods for the shapes
+    their routes issue, and list the indexes those queries need in
+    `indexes`. The collection handle is resolved lazily from the shared
+    Motor client, so constructing a repository performs no I/O.
+    """
+
+    collection_name: str = None
+    indexes: List[IndexModel] = []
+
+    @property
+    def collection(self):
+        return get_async_collection(self.collection_name)
+
+    async def find_one(self, query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None, **kwargs) -> Optional[Dict]:
+        return await self.collection.find_one(query, projection, **kwargs)
+
+    async def find_many(
+        self,
+        query: Dict[str, Any],
+        projection: Optional[Dict[str, Any]] = None,
+        sort: Optional[List] = None,
+        skip: int = 0,
+        limit: int = 0,
+    ) -> List[Dict]:
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(length=limit or None)
+
+    async def find_page(
+        self,
+        query: Dict[str, Any],
+        sort_field: str,
+        direction: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        id_field: str = "id",
+        projection: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Fetch one page ordered by (sort_field, id_field)
+
+        Pages after the first are selected with the keyset cursor; skip is
+        only honoured for backwards compatibility when no cursor is given.
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The documents and the cursor for
+            the next page (None on the last page)
+        """
+        documents = await self.find_many(
+            keyset_query(query, sort_field, direction, cursor, id_field),
+            projection,
+            sort=[(sort_field, direction), (id_field, direction)],
+            skip=0 if cursor else skip,
+            limit=limit,
+        )
+        return documents, next_cursor(documents, limit, sort_field, id_field)
+
+    async def ensure_indexes(self) -> List[Dict[str, str]]:
+        """
+        Create the indexes declared in `indexes` (run at startup)
+
+        Each index is created on its own, so one that conflicts with an
+        existing index does not keep the others from being created.
+
+        Returns:
+            List[Dict]: The indexes that could not be created, with the error
+        """
+        failures = []
+        for index in self.indexes:
+            try:
+                await self.collection.create_indexes([index])
+            except Exception as e:
+                failures.append({"collection": self.collection_name, "index": index.document["name"], "error": str(e)})
+                logger.error(f"Could not create index {index.document['name']} on {self.collection_name}: {str(e)}")
+        return failures
+
+    async def insert_one(self, document: Dict[str, Any], **kwargs):
+        return await self.collection.insert_one(document, **kwargs)
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], **kwargs):
+        return await self.collection.update_one(query, update, **kwargs)
+
+    async def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], **kwargs) -> Optional[Dict]:
+        """Apply an update and return the updated document in one round trip"""
+        kwargs.setdefault("return_document", ReturnDocument.AFTER)
+        return await self.collection.find_one_and_update(query, update, **kwargs)
+
+    async def delete_one(self, query: Dict[str, Any], **kwargs):
+        return await self.collection.delete_one(query, **kwargs)
+
+    async def count(self, query: Dict[str, Any]) -> int:
+        return await self.collection.count_documents(query)
@@ -0,0 +1,49 @@
+"""
+Async repository for the batches collection.
+"""
+
+import pymongo
+from pymongo import IndexModel
+from typing import Any, Dict, List, Optional, Tuple
+from repositories.base import AsyncRepository
+
+class BatchRepository(AsyncRepository):
+    collection_name = "batches"
+    indexes = [
+        IndexModel([("id", pymongo.ASCENDING)]),
+        # Latest batch of a product, for batch number generation
+        IndexModel([("product_id", pymongo.ASCENDING), ("creation_date", pymongo.DESCENDING)]),
+        # Keyset pagination for /batch/list/{enterprise_id}
+        IndexModel([("enterprise_id", pymongo.ASCENDING), ("creation_date", pymongo.DESCENDING), ("id", pymongo.DESCENDING)]),
+    ]
+
+    async def get_by_id(self, batch_id: str) -> Optional[Dict]:
+        return await self.find_one({"id": batch_id})
+
+    async def get_latest_for_product(self, product_id: str) -> Optional[Dict]:
+        return await self.find_one(
+            {"product_id": product_id},
+            sort=[("creation_date", pymongo.DESCENDING)]
+        )
+
+    async def list_for_enterprise(self, query: Dict[str, Any], skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self.find_page(query, "creation_date", pymongo.DESCENDING, limit, cursor=cursor, skip=skip)
+
+    async def count_for_enterprise(self, enterprise_id: str) -> int:
+        return await self.count({"enterprise_id": enterprise_id})
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def get_for_event(self, batch_id: str) -> Optional[Dict]:
+        """The batch fields a trace event copies, or None if there is no such batch"""
+        return await self.find_one(
+            {"id": batch_id},
+            {"_id": 0, "enterprise_id": 1, "product_id": 1, "batch_number": 1}
+        )
+
+    async def set_status(self, batch_id: str, status: str, session=None):
+        return await self.update_one({"id": batch_id}, {"$set": {"status": status}}, session=session)
+
+    async def set_quantity(self, batch_id: str, quantity: float):
+        return await self.update_one({"id": batch_id}, {"$set": {"current_quantity": quantity}})
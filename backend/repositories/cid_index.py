@@ -0,0 +1,46 @@
+"""
+Async repository for the cid_index collection.
+
+Maps a file hash to the CID it is anchored with, so downloads and
+verification do not have to ask the contract. Entries come from uploads
+(the hash is derived from the CID, but the anchor may still be pending)
+and from chain reads, and are removed when a file is removed from the
+chain. `source` records which: "upload" or "chain".
+"""
+
+import pymongo
+from datetime import datetime
+from pymongo import IndexModel, UpdateOne
+from typing import Dict, List, Optional, Tuple
+from repositories.base import AsyncRepository
+
+class CidIndexRepository(AsyncRepository):
+    collection_name = "cid_index"
+    indexes = [
+        IndexModel([("file_hash", pymongo.ASCENDING)], unique=True),
+    ]
+
+    async def get(self, file_hash: str) -> Optional[Dict]:
+        return await self.find_one({"file_hash": file_hash}, {"_id": 0, "cid": 1, "source": 1})
+
+    async def record_many(self, pairs: List[Tuple[str, str]], source: str, overwrite: bool = True):
+        """
+        Upsert many (file_hash, cid) pairs in one round trip
+
+        With overwrite=False, existing entries (which may already be
+        confirmed by the chain) are left as they are.
+        """
+        now = datetime.utcnow()
+        operations = []
+        for file_hash, cid in pairs:
+            fields = {"cid": cid, "source": source, "updated_at": now}
+            if overwrite:
+                update = {"$set": fields, "$setOnInsert": {"created_at": now}}
+            else:
+                update = {"$setOnInsert": {**fields, "created_at": now}}
+            operations.append(UpdateOne({"file_hash": file_hash}, update, upsert=True))
+        return await self.collection.bulk_write(operations, ordered=False)
+
+    async def remove(self, file_hash: str) -> bool:
+        result = await self.delete_one({"file_hash": file_hash})
+        return result.deleted_count > 0
@@ -0,0 +1,128 @@
+"""
+Async repository for the file_metadata collection.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import IndexModel, UpdateOne
+from repositories.base import AsyncRepository
+from utils.pagination import keyset_query
+
+# Fields a file listing can be sorted by
+FILE_SORT_FIELDS = ("upload_date", "size", "filename")
+
+class FileMetadataRepository(AsyncRepository):
+    collection_name = "file_metadata"
+    indexes = [
+        IndexModel([("user_id", 1), ("file_hash", 1)], unique=True),
+        IndexModel([("enterprise_id", 1)]),
+        # Anchoring status updates address every row of a file hash
+        IndexModel([("file_hash", 1)]),
+        # Finding an earlier upload of the same content
+        IndexModel([("content_digest", 1)]),
+        # Rows anchored through a batch manifest
+        IndexModel([("manifest_hash", 1)]),
+        # Keyset-paginated listings of one user's files, per sort field
+        *[IndexModel([("user_id", 1), (field, 1), ("_id", 1)]) for field in FILE_SORT_FIELDS],
+    ]
+
+    async def upsert(self, query: Dict[str, Any], fields: Dict[str, Any]):
+        return await self.update_one(query, {"$set": fields}, upsert=True)
+
+    async def upsert_many(self, rows: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """Upsert many (query, fields) pairs in one round trip"""
+        return await self.collection.bulk_write(
+            [UpdateOne(query, {"$set": fields}, upsert=True) for query, fields in rows],
+            ordered=False
+        )
+
+    async def insert_missing(self, rows: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        """Insert (query, fields) pairs whose row does not exist yet, leaving existing rows as they are"""
+        return await self.collection.bulk_write(
+            [UpdateOne(query, {"$setOnInsert": fields}, upsert=True) for query, fields in rows],
+            ordered=False
+        )
+
+    async def find_files(self, query: Dict[str, Any]) -> List[Dict]:
+        # Exclude MongoDB _id
+        return await self.find_many(query, {"_id": 0})
+
+    async def list_page(
+        self,
+        query: Dict[str, Any],
+        sort_field: str,
+        direction: int,
+        limit: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """One page ordered by (sort_field, _id); _id is stripped from the results"""
+        files, next_cursor = await self.find_page(query, sort_field, direction, limit, cursor=cursor, id_field="_id", projection=projection)
+        for file in files:
+            file.pop("_id", None)
+        return files, next_cursor
+
+    def iter_files(
+        self,
+        query: Dict[str, Any],
+        sort_field: str,
+        direction: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Dict[str, Any]] = None,
+        limit: int = 0,
+        batch_size: int = 500,
+    ):
+        """An async cursor over the files from a keyset position, for streaming"""
+        return self.collection.find(
+            keyset_query(query, sort_field, direction, cursor, "_id"),
+            projection,
+            sort=[(sort_field, direction), ("_id", direction)],
+            limit=limit,
+            batch_size=batch_size,
+        )
+
+    async def summarize(self, query: Dict[str, Any]) -> Dict[str, int]:
+        """The number and total size of the files matching a query, computed by the server"""
+        pipeline = [
+            {"$match": query},
+            {"$group": {"_id": None, "count": {"$sum": 1}, "total_size": {"$sum": {"$ifNull": ["$size", 0]}}}},
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not rows:
+            return {"count": 0, "total_size": 0}
+        return {"count": rows[0]["count"], "total_size": rows[0]["total_size"]}
+
+    async def find_file(self, query: Dict[str, Any]) -> Optional[Dict]:
+        return await self.find_one(query, {"_id": 0})
+
+    async def find_by_content_digest(self, content_digest: str) -> Optional[Dict]:
+        """An earlier upload of the same content that was pinned, if any"""
+        return await self.find_one(
+            {"content_digest": content_digest, "cid": {"$ne": None}},
+            {"_id": 0, "cid": 1, "file_hash": 1, "size": 1}
+        )
+
+    async def find_by_content_digests(self, content_digests: List[str]) -> Dict[str, Dict]:
+        """Earlier uploads of any of the given contents, keyed by digest"""
+        rows = await self.find_many(
+            {"content_digest": {"$in": content_digests}, "cid": {"$ne": None}},
+            {"_id": 0, "cid": 1, "file_hash": 1, "size": 1, "content_digest": 1}
+        )
+        return {row["content_digest"]: row for row in rows}
+
+    async def set_anchor_status(self, file_hash: str, status: str, transaction_hash: Optional[str] = None):
+        """Update the rows anchored by a hash, directly or through a batch manifest"""
+        fields = {"anchor_status": status}
+        if transaction_hash:
+            fields["transaction_hash"] = transaction_hash
+        return await self.collection.update_many(
+            {"$or": [{"file_hash": file_hash, "manifest_hash": None}, {"manifest_hash": file_hash}]},
+            {"$set": fields}
+        )
+
+    async def is_referenced(self, file_hash: str) -> bool:
+        """Whether any row still points at a file hash"""
+        return await self.find_one({"file_hash": file_hash}, {"_id": 1}) is not None
+
+    async def remove(self, query: Dict[str, Any]) -> bool:
+        result = await self.delete_one(query)
+        return result.deleted_count > 0
@@ -0,0 +1,84 @@
+"""
+Async repositories for the inventory and inventory_audit_logs collections.
+"""
+
+import pymongo
+from pymongo import IndexModel
+from typing import Any, Dict, List, Optional, Tuple
+from repositories.base import AsyncRepository
+
+class InventoryRepository(AsyncRepository):
+    collection_name = "inventory"
+    indexes = [
+        IndexModel([("id", pymongo.ASCENDING)]),
+        # One record per product, enterprise and location
+        IndexModel([("product_id", pymongo.ASCENDING), ("enterprise_id", pymongo.ASCENDING), ("location", pymongo.ASCENDING)], unique=True),
+    ]
+
+    async def get_by_id(self, inventory_id: str) -> Optional[Dict]:
+        return await self.find_one({"id": inventory_id})
+
+    async def get_at_location(self, product_id: str, location: str, enterprise_id: str) -> Optional[Dict]:
+        return await self.find_one({
+            "product_id": product_id,
+            "location": location,
+            "enterprise_id": enterprise_id
+        })
+
+    async def list_items(self, query: Dict[str, Any]) -> List[Dict]:
+        return await self.find_many(query)
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def set_quantity(self, inventory_id: str, quantity: float, last_updated):
+        return await self.update_one(
+            {"id": inventory_id},
+            {"$set": {"quantity": quantity, "last_updated": last_updated}}
+        )
+
+    async def add_at_location(self, product_id: str, location: str, enterprise_id: str, amount: float, last_updated, new_id: str, session=None) -> Dict:
+        """
+        Atomically add to the quantity at a location, creating the record if
+        needed. Returns the record after the change.
+        """
+        return await self.find_one_and_update(
+            {"product_id": product_id, "location": location, "enterprise_id": enterprise_id},
+            {
+                "$inc": {"quantity": amount},
+                "$set": {"last_updated": last_updated},
+                "$setOnInsert": {"id": new_id},
+            },
+            projection={"_id": 0},
+            upsert=True,
+            session=session
+        )
+
+    async def remove_at_location(self, product_id: str, location: str, enterprise_id: str, amount: float, last_updated, session=None) -> Optional[Dict]:
+        """
+        Atomically remove from the quantity at a location. Returns the record
+        after the change, or None if it does not exist or holds less than
+        `amount`.
+        """
+        return await self.find_one_and_update(
+            {"product_id": product_id, "location": location, "enterprise_id": enterprise_id, "quantity": {"$gte": amount}},
+            {
+                "$inc": {"quantity": -amount},
+                "$set": {"last_updated": last_updated},
+            },
+            projection={"_id": 0},
+            session=session
+        )
+
+class InventoryAuditLogRepository(AsyncRepository):
+    collection_name = "inventory_audit_logs"
+    indexes = [
+        # Keyset pagination for /inventory/audit/{product_id}
+        IndexModel([("product_id", pymongo.ASCENDING), ("enterprise_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING), ("id", pymongo.DESCENDING)]),
+    ]
+
+    async def create(self, document: Dict[str, Any], session=None):
+        return await self.insert_one(document, session=session)
+
+    async def list_logs(self, query: Dict[str, Any], skip: int = 0, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self.find_page(query, "timestamp", pymongo.DESCENDING, limit, cursor=cursor, skip=skip)
@@ -0,0 +1,32 @@
+"""
+Async repository for the leases collection.
+
+A lease makes one process the holder of a named role, such as signing the
+anchoring transactions, until it expires. The holder renews it well before
+then; when a holder dies, another process takes the role over once its
+lease runs out.
+"""
+
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from repositories.base import AsyncRepository
+
+class LeaseRepository(AsyncRepository):
+    collection_name = "leases"
+
+    async def acquire(self, name: str, holder: str, lease_seconds: float) -> bool:
+        """Take or renew the lease `name` for `holder`; False if another process holds it"""
+        now = datetime.utcnow()
+        try:
+            await self.find_one_and_update(
+                {"_id": name, "$or": [{"holder": holder}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease exists and is held by someone else
+            return False
+
+    async def release(self, name: str, holder: str):
+        await self.delete_one({"_id": name, "holder": holder})
@@ -0,0 +1,164 @@
+"""
+Async repository for the login_identities collection.
+
+login_identities is a lookup table derived from the accounts and users
+collections: one document per (username, enterprise_id) a user can log in
+to, carrying the credential and a pointer back to the source record.
+Users with role "enterprise" may log in to any enterprise and get a single
+identity with enterprise_id "*". The table is kept in sync on every write
+to a source record and can be rebuilt from scratch with rebuild(), which
+holds a lease so that workers starting together do not interleave rebuilds.
+"""
+
+import uuid
+import pymongo
+from pymongo import IndexModel, InsertOne
+from typing import Any, Dict, List, Optional
+from pymongo.errors import BulkWriteError
+from repositories.base import AsyncRepository
+from repositories.leases import LeaseRepository
+from repositories.users import UserRepository
+from utils.mongodb import get_async_collection
+
+# Matches any enterprise
+WILDCARD_ENTERPRISE = "*"
+
+# Where identities come from; accounts take precedence over users
+SOURCE_ACCOUNTS = "accounts"
+SOURCE_USERS = "users"
+
+# Held while the table is rebuilt; renewed after every batch written
+REBUILD_LEASE_NAME = "login_identities_rebuild"
+REBUILD_LEASE_SECONDS = 300
+
+def identities_for(source: str, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Derive the login identities of an accounts or users document"""
+    username = document.get("username")
+    if not username:
+        return []
+
+    if source == SOURCE_ACCOUNTS:
+        enterprise_ids = [document["enterprise_id"]] if document.get("enterprise_id") else []
+    elif document.get("role") == "enterprise":
+        enterprise_ids = [WILDCARD_ENTERPRISE]
+    else:
+        enterprise_ids = []
+        if document.get("enterprise_id"):
+            enterprise_ids.append(document["enterprise_id"])
+        enterprise_ids.extend(document.get("enterprises", []))
+
+    return [
+        {
+            "username": username.lower(),
+            "enterprise_id": str(enterprise_id),
+            "source": source,
+            "record_id": document["_id"],
+            "password": document.get("password"),
+            "wallet_addresses": list(document.get("wallet_addresses", [])),
+        }
+        for enterprise_id in dict.fromkeys(enterprise_ids)
+    ]
+
+class LoginIdentityRepository(AsyncRepository):
+    collection_name = "login_identities"
+    indexes = [
+        # Login lookup; enterprise_id descending puts exact matches before "*"
+        IndexModel([("username", pymongo.ASCENDING), ("enterprise_id", pymongo.DESCENDING), ("source", pymongo.ASCENDING)], unique=True),
+        # Updating the identities of one source record
+        IndexModel([("source", pymongo.ASCENDING), ("record_id", pymongo.ASCENDING)]),
+    ]
+
+    async def resolve(self, username: str, enterprise_id: str) -> Optional[Dict]:
+        """
+        Find the credential a user logs in to an enterprise with, together
+        with whether the enterprise exists, in one round trip
+
+        Returns:
+            Optional[Dict]: The identity with an "enterprise_exists" flag, or
+            None if the user has no identity for this enterprise
+        """
+        pipeline = [
+            {"$match": {"username": username, "enterprise_id": {"$in": [enterprise_id, WILDCARD_ENTERPRISE]}}},
+            {"$sort": {"enterprise_id": pymongo.DESCENDING, "source": pymongo.ASCENDING}},
+            {"$limit": 1},
+            {"$lookup": {
+                "from": "enterprises",
+                "pipeline": [{"$match": {"_id": enterprise_id}}, {"$project": {"_id": 1}}],
+                "as": "enterprise",
+            }},
+        ]
+        documents = await self.collection.aggregate(pipeline).to_list(length=1)
+        if not documents:
+            return None
+        identity = documents[0]
+        identity["enterprise_exists"] = bool(identity.pop("enterprise"))
+        return identity
+
+    async def enterprises_of(self, username: str) -> List[str]:
+        """The enterprises a user may log in to by name, other than the wildcard"""
+        return await self.collection.distinct(
+            "enterprise_id", {"username": username.lower(), "enterprise_id": {"$ne": WILDCARD_ENTERPRISE}}
+        )
+
+    async def create_for(self, source: str, document: Dict[str, Any]):
+        """Add the identities of a newly inserted source record"""
+        identities = identities_for(source, document)
+        if identities:
+            await self.collection.insert_many(identities)
+
+    async def set_password(self, source: str, record_id: Any, password: str):
+        return await self.collection.update_many({"source": source, "record_id": record_id}, {"$set": {"password": password}})
+
+    async def add_wallet_address(self, source: str, record_id: Any, wallet_address: str):
+        return await self.collection.update_many({"source": source, "record_id": record_id}, {"$addToSet": {"wallet_addresses": wallet_address}})
+
+    async def is_empty(self) -> bool:
+        return await self.find_one({}, {"_id": 1}) is None
+
+    async def _insert_batch(self, batch: List[InsertOne]) -> int:
+        try:
+            await self.collection.bulk_write(batch, ordered=False)
+            return len(batch)
+        except BulkWriteError as e:
+            # Duplicate source records for the same login keep the first one
+            return e.details.get("nInserted", 0)
+
+    async def rebuild(self, only_if_empty: bool = False) -> Optional[int]:
+        """
+        Rebuild the whole table from the accounts and users collections
+
+        Only one process rebuilds at a time; the others return at once.
+
+        Args:
+            only_if_empty: Leave a table that already has identities alone
+
+        Returns:
+            Optional[int]: The number of identities written, or None if
+            another process is rebuilding or, with only_if_empty, the table
+            was not empty
+        """
+        leases = LeaseRepository()
+        holder = uuid.uuid4().hex
+        if not await leases.acquire(REBUILD_LEASE_NAME, holder, REBUILD_LEASE_SECONDS):
+            return None
+        try:
+            # Checked under the lease: another process may have just finished
+            if only_if_empty and not await self.is_empty():
+                return None
+            await self.collection.delete_many({})
+            written = 0
+            sources = [(SOURCE_ACCOUNTS, "accounts"), (SOURCE_USERS, UserRepository.collection_name)]
+            for source, collection_name in sources:
+                batch = []
+                async for document in get_async_collection(collection_name).find({}, {"files": 0}):
+                    batch.extend(InsertOne(identity) for identity in identities_for(source, document))
+                    if len(batch) >= 1000:
+                        written += await self._insert_batch(batch)
+                        batch = []
+                        if not await leases.acquire(REBUILD_LEASE_NAME, holder, REBUILD_LEASE_SECONDS):
+                            raise RuntimeError("Lost the login_identities rebuild lease; another process took over")
+                if batch:
+                    written += await self._insert_batch(batch)
+            return written
+        finally:
+            await leases.release(REBUILD_LEASE_NAME, holder)
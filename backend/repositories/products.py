@@ -0,0 +1,35 @@
+"""
+Async repository for the products collection.
+"""
+
+from typing import Any, Dict, List, Optional
+from pymongo import IndexModel
+from repositories.base import AsyncRepository
+
+class ProductRepository(AsyncRepository):
+    collection_name = "products"
+    indexes = [
+        IndexModel([("id", 1)]),
+        IndexModel([("enterprise_id", 1), ("product_name", 1)]),
+    ]
+
+    async def get_by_id(self, product_id: str) -> Optional[Dict]:
+        return await self.find_one({"id": product_id})
+
+    async def get_by_name(self, enterprise_id: str, product_name: str) -> Optional[Dict]:
+        return await self.find_one({"enterprise_id": enterprise_id, "product_name": product_name})
+
+    async def list_for_enterprise(self, enterprise_id: str) -> List[Dict]:
+        return await self.find_many({"enterprise_id": enterprise_id})
+
+    async def count_for_enterprise(self, enterprise_id: str) -> int:
+        return await self.count({"enterprise_id": enterprise_id})
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def update_fields(self, product_id: str, fields: Dict[str, Any]):
+        return await self.update_one({"id": product_id}, {"$set": fields})
+
+    async def delete(self, product_id: str):
+        return await self.delete_one({"id": product_id})
@@ -0,0 +1,30 @@
+"""
+Async repository for the trace_events collection.
+"""
+
+import pymongo
+from pymongo import IndexModel
+from typing import Any, Dict, List, Optional, Tuple
+from repositories.base import AsyncRepository
+
+class TraceEventRepository(AsyncRepository):
+    collection_name = "trace_events"
+    indexes = [
+        IndexModel([("id", pymongo.ASCENDING)]),
+        # Keyset pagination for /trace/list/{batch_id}
+        IndexModel([("batch_id", pymongo.ASCENDING), ("timestamp", pymongo.ASCENDING), ("id", pymongo.ASCENDING)]),
+        # Keyset pagination for /trace/history/{enterprise_id}
+        IndexModel([("enterprise_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING), ("id", pymongo.DESCENDING)]),
+    ]
+
+    async def get_by_id(self, event_id: str) -> Optional[Dict]:
+        return await self.find_one({"id": event_id})
+
+    async def list_for_batch(self, query: Dict[str, Any], skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self.find_page(query, "timestamp", pymongo.ASCENDING, limit, cursor=cursor, skip=skip)
+
+    async def list_history(self, query: Dict[str, Any], skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        return await self.find_page(query, "timestamp", pymongo.DESCENDING, limit, cursor=cursor, skip=skip)
+
+    async def create(self, document: Dict[str, Any], session=None):
+        return await self.insert_one(document, session=session)
@@ -0,0 +1,50 @@
+"""
+Unit of work for writes that span several collections.
+
+Callers put all the writes of one logical operation in a coroutine function
+that takes a session and pass it to run_in_transaction(). On a replica set or
+sharded cluster the writes run in a multi-document transaction, retried on
+transient errors and committed together. On a standalone server, which does
+not support transactions, the function is called with session=None and each
+write is applied on its own.
+"""
+
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from utils.mongodb import get_async_client
+
+logger = logging.getLogger(__name__)
+
+# Cached result of the topology check; None until checked
+_transactions_supported = None
+
+async def supports_transactions() -> bool:
+    """Whether the connected deployment supports multi-document transactions"""
+    global _transactions_supported
+    if _transactions_supported is None:
+        try:
+            hello = await get_async_client().admin.command("hello")
+            _transactions_supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception as e:
+            logger.warning(f"Could not determine MongoDB topology, transactions disabled: {str(e)}")
+            return False
+        if not _transactions_supported:
+            logger.info("MongoDB is a standalone server; multi-collection writes run without transactions")
+    return _transactions_supported
+
+async def run_in_transaction(callback: Callable[[Optional[Any]], Awaitable[Any]]) -> Any:
+    """
+    Run `callback(session)` as one unit of work
+
+    Args:
+        callback: Coroutine function performing the writes; it must pass the
+            session it receives to every repository call
+
+    Returns:
+        The callback's return value
+    """
+    if not await supports_transactions():
+        return await callback(None)
+
+    async with await get_async_client().start_session() as session:
+        return await session.with_transaction(callback)
@@ -0,0 +1,93 @@
+"""
+Async repository for the upload_sessions collection.
+
+A session tracks one resumable upload: the declared size and chunk size,
+which chunks have been written to the local spool file, and once
+finalized, the upload result. Sessions move from open to finalizing to
+completed; a failed finalize returns the session to open. Each chunk write
+in progress holds an entry in `writers` until it ends or its lease runs
+out, and a session is only finalized while it has none.
+"""
+
+import pymongo
+from datetime import datetime, timedelta
+from pymongo import IndexModel
+from typing import Any, Dict, List, Optional
+from repositories.base import AsyncRepository
+
+UPLOAD_OPEN = "open"
+UPLOAD_FINALIZING = "finalizing"
+UPLOAD_COMPLETED = "completed"
+
+class UploadSessionRepository(AsyncRepository):
+    collection_name = "upload_sessions"
+    indexes = [
+        IndexModel([("upload_id", pymongo.ASCENDING)], unique=True),
+        # Expiry sweep
+        IndexModel([("expires_at", pymongo.ASCENDING)]),
+    ]
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def get_for_user(self, upload_id: str, user_id: str) -> Optional[Dict]:
+        return await self.find_one({"upload_id": upload_id, "user_id": user_id}, {"_id": 0})
+
+    async def begin_write(self, upload_id: str, user_id: str, writer_id: str, lease_seconds: float) -> Optional[Dict]:
+        """
+        Register a chunk write on an open session, keeping the session from
+        expiring before the write's lease does; returns the session
+        """
+        now = datetime.utcnow()
+        lease_expires_at = now + timedelta(seconds=lease_seconds)
+        return await self.find_one_and_update(
+            {"upload_id": upload_id, "user_id": user_id, "status": UPLOAD_OPEN},
+            {"$push": {"writers": {"id": writer_id, "expires_at": lease_expires_at}},
+             "$max": {"expires_at": lease_expires_at},
+             "$set": {"updated_at": now}},
+            projection={"_id": 0, "writers": 0}
+        )
+
+    async def add_chunk(self, upload_id: str, index: int, writer_id: str, expires_at: datetime) -> Optional[Dict]:
+        """Record a written chunk and end its write; returns the session"""
+        return await self.find_one_and_update(
+            {"upload_id": upload_id, "status": UPLOAD_OPEN, "writers.id": writer_id},
+            {"$addToSet": {"received": index}, "$pull": {"writers": {"id": writer_id}},
+             "$set": {"expires_at": expires_at, "updated_at": datetime.utcnow()}},
+            projection={"_id": 0, "writers": 0}
+        )
+
+    async def end_write(self, upload_id: str, writer_id: str, discard_index: Optional[int] = None):
+        """End a write that failed, forgetting its chunk if it left partial data"""
+        update = {"$pull": {"writers": {"id": writer_id}}}
+        if discard_index is not None:
+            update["$pull"]["received"] = discard_index
+        return await self.update_one({"upload_id": upload_id, "status": UPLOAD_OPEN}, update)
+
+    async def claim_for_finalize(self, upload_id: str, user_id: str, expires_at: datetime) -> Optional[Dict]:
+        """
+        Move an open session to finalizing so only one request finalizes it,
+        provided no chunk write is still in progress
+        """
+        return await self.find_one_and_update(
+            {"upload_id": upload_id, "user_id": user_id, "status": UPLOAD_OPEN,
+             "writers": {"$not": {"$elemMatch": {"expires_at": {"$gt": datetime.utcnow()}}}}},
+            {"$set": {"status": UPLOAD_FINALIZING, "expires_at": expires_at, "updated_at": datetime.utcnow()}},
+            projection={"_id": 0}
+        )
+
+    async def set_status(self, upload_id: str, status: str, fields: Optional[Dict[str, Any]] = None):
+        update = {"status": status, "updated_at": datetime.utcnow()}
+        update.update(fields or {})
+        return await self.update_one({"upload_id": upload_id}, {"$set": update})
+
+    async def find_expired(self, now: datetime, limit: int = 100) -> List[Dict]:
+        return await self.find_many(
+            {"expires_at": {"$lt": now}},
+            {"_id": 0, "upload_id": 1},
+            limit=limit
+        )
+
+    async def remove(self, upload_id: str) -> bool:
+        result = await self.delete_one({"upload_id": upload_id})
+        return result.deleted_count > 0
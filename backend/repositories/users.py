@@ -0,0 +1,47 @@
+"""
+Async repository for the users collection.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+from pymongo import IndexModel
+from repositories.base import AsyncRepository
+
+# File lists live in file_metadata; documents not yet migrated may still
+# carry an embedded "files" array, which readers never load
+USER_PROJECTION = {"files": 0}
+
+class UserRepository(AsyncRepository):
+    collection_name = os.getenv("MONGO_USERS_COLLECTION", "users")
+    indexes = [
+        IndexModel([("username", 1)]),
+    ]
+
+    async def get_by_username(self, username: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict]:
+        """Find a user by (already normalized) username"""
+        return await self.find_one({"username": username}, projection or USER_PROJECTION)
+
+    async def exists(self, username: str) -> bool:
+        return await self.find_one({"username": username}, {"_id": 1}) is not None
+
+    async def create(self, document: Dict[str, Any]):
+        return await self.insert_one(document)
+
+    async def update_fields(self, username: str, fields: Dict[str, Any]):
+        return await self.update_one({"username": username}, {"$set": fields})
+
+    async def list_all(self) -> List[Dict]:
+        return await self.find_many({}, USER_PROJECTION)
+
+    async def find_with_embedded_files(self, limit: int) -> List[Dict]:
+        """Users whose documents still carry a legacy files array"""
+        return await self.find_many(
+            {"files.0": {"$exists": True}},
+            {"username": 1, "enterprise_id": 1, "role": 1, "user_type": 1, "enterprises": 1, "files": 1},
+            limit=limit
+        )
+
+    async def clear_embedded_files(self, user_id: Any, count: int) -> bool:
+        """Drop a migrated files array, unless entries were added since it was read"""
+        result = await self.update_one({"_id": user_id, "files": {"$size": count}}, {"$unset": {"files": ""}})
+        return result.modified_count > 0
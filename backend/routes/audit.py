@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from typing import List, Optional
 from datetime import datetime
 from services.audit import AuditService
@@ -10,7 +10,7 @@ router = APIRouter()
 audit_service = AuditService()
 
 @router.get("/entity/{entity_type}/{entity_id}", response_model=List[AuditLog])
-@verify_user_role(["admin", "inventory_manager", "supply_chain_head"])
+@verify_user_role(["admin", "inventory_manager", "supply_chain_head", "permission:update_inventory"])
 async def get_entity_audit_logs(
     entity_type: str,
     entity_id: str,
@@ -18,8 +18,9 @@ async def get_entity_audit_logs(
 ):
     """
     Get audit logs for a specific entity
+    Accounts that may update inventory can read audit trails whatever their role
     """
-    return audit_service.get_entity_audit_trail(entity_type, entity_id)
+    return await audit_service.get_entity_audit_trail(entity_type, entity_id)
 
 @router.get("/search", response_model=List[AuditLog])
 @verify_user_role(["admin"])
@@ -29,20 +30,26 @@ async def search_audit_logs(
     changed_by: Optional[str] = None,
     from_date: Optional[datetime] = None,
     to_date: Optional[datetime] = None,
+    response: Response = None,
     limit: int = Query(100, ge=1, le=1000),
-    skip: int = Query(0, ge=0),
+    skip: int = Query(0, ge=0, description="Deprecated: use cursor instead"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     """
     Search audit logs with various filters
     This endpoint is admin-only
     """
-    return audit_service.get_audit_trail(
+    logs, next_cursor = await audit_service.get_audit_trail_page(
         entity_type=entity_type,
         entity_id=entity_id,
         changed_by=changed_by,
         from_date=from_date,
         to_date=to_date,
         limit=limit,
-        skip=skip
+        skip=skip,
+        cursor=cursor
     )
+    if next_cursor and response is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return logs
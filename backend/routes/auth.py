@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Form, Header, Request, Body
+from fastapi import APIRouter, HTTPException, Depends, Form, Header, Request, Body, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, Union
@@ -8,40 +8,26 @@ from datetime import datetime, timedelta
 import jwt
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models.user import User, FileMetadata, Enterprise
-from services.metadata import MetadataService
-from pymongo import MongoClient
-from utils.mongodb import get_mongo_connection, get_users_collection
+from repositories import UserRepository, AccountRepository, EnterpriseRepository, LoginIdentityRepository
+from repositories.login_identities import SOURCE_ACCOUNTS, SOURCE_USERS
+from utils.tokens import SECRET_KEY, ALGORITHM, decode_access_token
+from services.user_profiles import get_user_profile_service
+from services.metadata import get_metadata_service
+from services.permissions import get_permission_resolver
+from utils.request_context import get_request_context
+from utils.passwords import hash_password, verify_password
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 security = HTTPBearer()
-metadata_service = MetadataService()
 
-# Get MongoDB connection and collections
-try:
-    from utils.mongodb import get_mongo_connection, get_users_collection
-    mongo_client, db = get_mongo_connection()
-    users_collection = get_users_collection()
-    print("Auth route connected to MongoDB successfully")
-except Exception as e:
-    print(f"Auth route failed to connect to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception but we'll still attempt to initialize
-    # Get MongoDB connection directly for authentication routes
-    try:
-        mongo_client = MongoClient(
-            host=f'mongodb://100.123.165.22:27017/',
-            username="admin",
-            password="@dminXinetee@123",
-            authSource='admin',
-            connectTimeoutMS=5000
-        )
-        db = mongo_client["xinetee"]
-        users_collection = db["users"]
-        print("Auth route connected to MongoDB with fallback method")
-    except Exception as fallback_err:
-        print(f"All MongoDB connection attempts failed: {str(fallback_err)}")
+# Async repositories backed by the shared Motor client
+user_repo = UserRepository()
+account_repo = AccountRepository()
+enterprise_repo = EnterpriseRepository()
+identity_repo = LoginIdentityRepository()
 
 class UserCreate(BaseModel):
     username: str
@@ -75,13 +61,11 @@ class Token(BaseModel):
     token_type: str
 
 # JWT configuration
-SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable is not set")
-ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def create_access_token(data: dict, user_role: str = "individual", enterprise_id: str = None):
+def create_access_token(data: dict, user_role: str = "individual", enterprise_id: str = None, permission_claims: dict = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({
@@ -89,16 +73,20 @@ def create_access_token(data: dict, user_role: str = "individual", enterprise_id
         "role": user_role,  # Add user role to token
         "enterprise_id": enterprise_id  # Add enterprise ID if present
     })
+    # Permissions and their version, checked by the RBAC decorator
+    if permission_claims:
+        to_encode.update(permission_claims)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid authentication token")
+        get_request_context().set_claims(payload)
         
         # Extract additional information from token
         role = payload.get("role", "individual")
@@ -118,9 +106,9 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
         logger.error(f"Error validating token: {str(e)}")
         raise HTTPException(status_code=401, detail="Invalid authentication token")
         
-def get_current_active_user(current_user: Dict = Depends(get_current_user)) -> Dict:
+async def get_current_active_user(current_user: Dict = Depends(get_current_user)) -> Dict:
     normalized_username = current_user["username"].lower()
-    db_user = users_collection.find_one({"username": normalized_username})
+    db_user = await get_user_profile_service().get_profile(normalized_username)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -142,19 +130,22 @@ def get_current_active_user(current_user: Dict = Depends(get_current_user)) -> D
             if field in db_user:
                 user_data[field] = db_user[field]
     
+    get_request_context().set_user(user_data)
     return user_data
 
 @router.post("/register", response_model=Token)
 async def register(user: UserCreate):
     normalized_username = user.username.lower()
-    if users_collection.find_one({"username": normalized_username}):
+    if await user_repo.exists(normalized_username):
         raise HTTPException(status_code=400, detail="Username already registered")
-    users_collection.insert_one({
+    new_user = {
         "username": normalized_username,
-        "password": user.password,
-        "wallet_address": user.wallet_address,
-        "files": []
-    })
+        "password": await hash_password(user.password),
+        "wallet_address": user.wallet_address
+    }
+    result = await user_repo.create(new_user)
+    await identity_repo.create_for(SOURCE_USERS, {**new_user, "_id": result.inserted_id})
+    get_user_profile_service().invalidate(normalized_username)
     access_token = create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -164,22 +155,21 @@ async def register_enterprise(enterprise: EnterpriseCreate):
     normalized_username = enterprise.business_email.lower().split('@')[0]
     
     # Check if username already exists
-    if users_collection.find_one({"username": normalized_username}):
+    if await user_repo.exists(normalized_username):
         # Try with company name if email username is taken
         normalized_username = enterprise.company_name.lower().replace(' ', '_')
         
         # Check again with this new username
-        if users_collection.find_one({"username": normalized_username}):
+        if await user_repo.exists(normalized_username):
             # Add random numbers if both are taken
             import random
             normalized_username += f"_{random.randint(1000, 9999)}"
     
     # Create enterprise user in database
-    users_collection.insert_one({
+    new_user = {
         "username": normalized_username,
-        "password": enterprise.password,
+        "password": await hash_password(enterprise.password),
         "wallet_address": enterprise.wallet_address or "",  # Optional for enterprise users initially
-        "files": [],
         "user_type": "enterprise",
         "company_name": enterprise.company_name,
         "business_email": enterprise.business_email,
@@ -187,7 +177,10 @@ async def register_enterprise(enterprise: EnterpriseCreate):
         "employee_count": enterprise.employee_count,
         "contact_person": enterprise.contact_person,
         "contact_phone": enterprise.contact_phone or ""
-    })
+    }
+    result = await user_repo.create(new_user)
+    await identity_repo.create_for(SOURCE_USERS, {**new_user, "_id": result.inserted_id})
+    get_user_profile_service().invalidate(normalized_username)
     
     # Create access token
     access_token = create_access_token(data={"sub": normalized_username})
@@ -241,18 +234,9 @@ async def login(
         normalized_username = login_username.lower()
         logger.info(f"Normalized username for login: {normalized_username}")
         
-        # Ensure we have a valid MongoDB connection and users collection
-        from utils.mongodb import get_users_collection
-        try:
-            users_collection = get_users_collection()
-            logger.debug("Connected to users collection for login attempt")
-        except Exception as e:
-            logger.error(f"MongoDB connection error during login: {str(e)}")
-            raise HTTPException(status_code=500, detail="Database connection error")
-            
         # Attempt to find the user
         try:
-            db_user = users_collection.find_one({"username": normalized_username})
+            db_user = await user_repo.get_by_username(normalized_username)
             if db_user:
                 logger.info(f"User found in database: {normalized_username}")
             else:
@@ -265,9 +249,15 @@ async def login(
             logger.warning(f"Login failed - user not registered: {login_username}")
             raise HTTPException(status_code=401, detail=f"Username '{login_username}' is not registered")
             
-        if db_user['password'] != login_password:
+        password_ok, new_hash = await verify_password(login_password, db_user.get('password'))
+        if not password_ok:
             logger.warning(f"Login failed - incorrect password for user: {normalized_username}")
             raise HTTPException(status_code=401, detail="Invalid password")
+        if new_hash:
+            # Upgrade legacy plaintext or outdated hashes
+            await user_repo.update_fields(normalized_username, {"password": new_hash})
+            await identity_repo.set_password(SOURCE_USERS, db_user["_id"], new_hash)
+            logger.info(f"Rehashed password for user {normalized_username}")
             
         # Get user role and enterprise ID if available
         user_role = db_user.get("role", db_user.get("user_type", "individual"))
@@ -286,7 +276,8 @@ async def login(
         access_token = create_access_token(
             data={"sub": normalized_username}, 
             user_role=user_role, 
-            enterprise_id=enterprise_id
+            enterprise_id=enterprise_id,
+            permission_claims=await get_permission_resolver().token_claims(normalized_username)
         )
         logger.info(f"Generated access token for user: {normalized_username}")
         return {"access_token": access_token, "token_type": "bearer"}
@@ -327,9 +318,28 @@ async def enterprise_login_options():
         },
     )
 
+def _source_repo(source: str):
+    """Repository holding the source record of a login identity"""
+    return account_repo if source == SOURCE_ACCOUNTS else user_repo
+
+async def append_wallet_address(identity: Dict, wallet_address: str, username: str):
+    """Add a wallet address to a login's source record (run as a background task)"""
+    try:
+        await _source_repo(identity["source"]).update_one(
+            {"_id": identity["record_id"]},
+            {"$addToSet": {"wallet_addresses": wallet_address}}
+        )
+        await identity_repo.add_wallet_address(identity["source"], identity["record_id"], wallet_address)
+        get_user_profile_service().invalidate(username)
+        logger.info(f"Updated wallet address for user {username}")
+    except Exception as e:
+        # Not critical for the login that triggered it
+        logger.error(f"Error updating wallet address: {str(e)}")
+
 @router.post("/enterprise/login", response_model=Token)
 async def enterprise_login(
     request: Request,
+    background_tasks: BackgroundTasks,
     enterprise_login: Optional[EnterpriseLogin] = None
 ):
     """
@@ -370,73 +380,38 @@ async def enterprise_login(
         normalized_username = login_username.lower()
         logger.info(f"Normalized username for enterprise login: {normalized_username}")
         
-        # Ensure we have a valid MongoDB connection and collections
-        try:
-            users_collection = get_users_collection()
-            enterprises_collection = db["enterprises"] 
-            accounts_collection = db["accounts"]
-            logger.debug("Connected to MongoDB collections for enterprise login attempt")
-        except Exception as e:
-            logger.error(f"MongoDB connection error during enterprise login: {str(e)}")
-            raise HTTPException(status_code=500, detail="Database connection error")
-            
-        # First check if the enterprise exists
-        enterprise = enterprises_collection.find_one({"_id": enterprise_id})
-        if not enterprise:
-            logger.warning(f"Enterprise login failed - enterprise ID not found: {enterprise_id}")
-            raise HTTPException(status_code=401, detail=f"Enterprise ID '{enterprise_id}' not found")
-            
-        # Then find the user account within this enterprise
-        db_user = accounts_collection.find_one({
-            "username": normalized_username,
-            "enterprise_id": enterprise_id
-        })
+        # Resolve the credential and check the enterprise in one indexed read
+        identity = await identity_repo.resolve(normalized_username, enterprise_id)
         
-        if not db_user:
-            # Also check the users collection in case this is a system user with enterprise access
-            db_user = users_collection.find_one({
-                "username": normalized_username, 
-                "$or": [
-                    {"role": "enterprise"}, 
-                    {"enterprise_id": enterprise_id},
-                    {"enterprises": {"$in": [enterprise_id]}}
-                ]
-            })
-            
-        if not db_user:
+        if not identity or not identity["enterprise_exists"]:
+            # Only failed logins look further, to report what is missing
+            enterprise_exists = identity["enterprise_exists"] if identity else await enterprise_repo.get_by_object_id(enterprise_id) is not None
+            if not enterprise_exists:
+                logger.warning(f"Enterprise login failed - enterprise ID not found: {enterprise_id}")
+                raise HTTPException(status_code=401, detail=f"Enterprise ID '{enterprise_id}' not found")
             logger.warning(f"Enterprise login failed - user not found: {normalized_username} for enterprise: {enterprise_id}")
             raise HTTPException(status_code=401, detail=f"User '{login_username}' not found for this enterprise")
             
-        if db_user['password'] != login_password:
+        password_ok, new_hash = await verify_password(login_password, identity.get('password'))
+        if not password_ok:
             logger.warning(f"Enterprise login failed - incorrect password for user: {normalized_username}")
             raise HTTPException(status_code=401, detail="Invalid password")
+        if new_hash:
+            # Upgrade legacy plaintext or outdated hashes
+            await _source_repo(identity["source"]).update_one({"_id": identity["record_id"]}, {"$set": {"password": new_hash}})
+            await identity_repo.set_password(identity["source"], identity["record_id"], new_hash)
+            logger.info(f"Rehashed password for user {normalized_username}")
             
-        # If wallet address is provided, update the user record with it
-        if wallet_address and wallet_address not in db_user.get('wallet_addresses', []):
-            try:
-                # Create or append to the wallet_addresses array
-                if 'wallet_addresses' not in db_user:
-                    db_user['wallet_addresses'] = [wallet_address]
-                else:
-                    db_user['wallet_addresses'].append(wallet_address)
-                    
-                # Update the user record
-                if '_id' in db_user:
-                    collection = accounts_collection if 'enterprise_id' in db_user else users_collection
-                    collection.update_one(
-                        {"_id": db_user["_id"]},
-                        {"$set": {"wallet_addresses": db_user['wallet_addresses']}}
-                    )
-                    logger.info(f"Updated wallet address for user {normalized_username}")
-            except Exception as e:
-                logger.error(f"Error updating wallet address: {str(e)}")
-                # Continue anyway - this is not critical
+        # If wallet address is provided, record it after the response is sent
+        if wallet_address and wallet_address not in identity.get('wallet_addresses', []):
+            background_tasks.add_task(append_wallet_address, identity, wallet_address, normalized_username)
         
         # Create token with enterprise role information
         access_token = create_access_token(
             data={"sub": normalized_username}, 
             user_role="enterprise",
-            enterprise_id=enterprise_id
+            enterprise_id=enterprise_id,
+            permission_claims=await get_permission_resolver().token_claims(normalized_username)
         )
         logger.info(f"Generated enterprise access token for user: {normalized_username}, enterprise: {enterprise_id}")
         return {"access_token": access_token, "token_type": "bearer"}
@@ -451,31 +426,34 @@ async def enterprise_login(
 @router.get("/me", response_model=User)
 async def read_users_me(current_user: dict = Depends(get_current_user)):
     normalized_username = current_user["username"].lower()
-    db_user = users_collection.find_one({"username": normalized_username})
+    db_user = await user_repo.get_by_username(normalized_username)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     wallet_address = db_user.get("wallet_address", None)
-    files = db_user.get("files", [])
-    file_objs = [FileMetadata(**f) if not isinstance(f, FileMetadata) else f for f in files]
+    files = await get_metadata_service().get_user_files(current_user)
+    file_objs = [FileMetadata(**f) for f in files]
     return User(username=current_user["username"], wallet_address=wallet_address, files=file_objs)
 
 @router.get("/profile", response_model=User)
 async def get_profile(current_user: dict = Depends(get_current_user)):
     normalized_username = current_user["username"].lower()
-    db_user = users_collection.find_one({"username": normalized_username})
+    db_user = await user_repo.get_by_username(normalized_username)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     wallet_address = db_user.get("wallet_address", None)
-    files = db_user.get("files", [])
-    file_objs = [FileMetadata(**f) if not isinstance(f, FileMetadata) else f for f in files]
+    files = await get_metadata_service().get_user_files(current_user)
+    file_objs = [FileMetadata(**f) for f in files]
     return User(username=current_user["username"], wallet_address=wallet_address, files=file_objs)
 
 @router.get("/all-users", response_model=list[User])
 async def get_all_users():
     users = []
-    for db_user in users_collection.find():
-        files = db_user.get("files", [])
-        file_objs = [FileMetadata(**f) if not isinstance(f, FileMetadata) else f for f in files]
+    db_users = await user_repo.list_all()
+    # One query for every user's files
+    files_by_user = await get_metadata_service().get_files_by_user_ids([db_user["username"].lower() for db_user in db_users])
+    for db_user in db_users:
+        files = files_by_user.get(db_user["username"].lower(), [])
+        file_objs = [FileMetadata(**f) for f in files]
         users.append(User(username=db_user["username"], wallet_address=db_user.get("wallet_address"), files=file_objs))
     return users
 
@@ -490,15 +468,15 @@ class EnterpriseUpdate(BaseModel):
 @router.put("/enterprise/update", response_model=User)
 async def update_enterprise_profile(enterprise: EnterpriseUpdate, current_user: dict = Depends(get_current_user)):
     normalized_username = current_user["username"].lower()
-    db_user = users_collection.find_one({"username": normalized_username})
+    db_user = await user_repo.get_by_username(normalized_username)
     
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Update enterprise fields
-    users_collection.update_one(
-        {"username": normalized_username},
-        {"$set": {
+    await user_repo.update_fields(
+        normalized_username,
+        {
             "company_name": enterprise.company_name,
             "business_email": enterprise.business_email,
             "industry": enterprise.industry,
@@ -506,17 +484,18 @@ async def update_enterprise_profile(enterprise: EnterpriseUpdate, current_user:
             "contact_person": enterprise.contact_person,
             "contact_phone": enterprise.contact_phone or "",
             "user_type": "enterprise"  # Ensure user_type is set to enterprise
-        }}
+        }
     )
+    get_user_profile_service().invalidate(normalized_username)
     
     # Get updated user
-    updated_user = users_collection.find_one({"username": normalized_username})
+    updated_user = await user_repo.get_by_username(normalized_username)
     if not updated_user:
         raise HTTPException(status_code=404, detail="Failed to retrieve updated profile")
     
     wallet_address = updated_user.get("wallet_address", None)
-    files = updated_user.get("files", [])
-    file_objs = [FileMetadata(**f) if not isinstance(f, FileMetadata) else f for f in files]
+    files = await get_metadata_service().get_user_files(current_user)
+    file_objs = [FileMetadata(**f) for f in files]
     
     # Convert MongoDB document to Pydantic model
     return User(
@@ -537,32 +516,8 @@ def get_token_data(current_user: Dict) -> Dict:
     Returns:
         Dict: All data from the JWT token
     """
-    try:
-        # Extract the Authorization header
-        from fastapi import Request
-        from starlette.concurrency import run_in_threadpool
-        import inspect
-        
-        # Get the current active request from the context
-        # This is a bit hacky but allows us to get the request
-        for frame_info in inspect.stack():
-            request = frame_info.frame.f_locals.get("request")
-            if isinstance(request, Request):
-                break
-                
-        if not request:
-            return {"username": current_user.get("username")}
-            
-        # Extract the token from the Authorization header
-        auth_header = request.headers.get("Authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return {"username": current_user.get("username")}
-            
-        token = auth_header.split(" ")[1]
-        
-        # Decode the token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except Exception as e:
-        logger.error(f"Error extracting token data: {str(e)}")
-        return {"username": current_user.get("username")}
\ No newline at end of file
+    # The claims were verified once by get_current_user for this request
+    claims = get_request_context().claims
+    if not claims:
+        return {"username": current_user.get("username")}
+    return dict(claims)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Query
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Response
 from typing import Dict, Any, List, Optional
 import uuid
 from datetime import datetime
@@ -11,19 +11,11 @@ from models.batch import Batch, BatchCreate
 from models.product import Product
 from routes.auth import get_current_active_user
 import ipfs_utils
-from utils.mongodb import get_mongo_connection
+from repositories import BatchRepository, ProductRepository
 
-# Setup MongoDB client
-try:
-    client, db = get_mongo_connection()
-except Exception as e:
-    print(f"Error in batch route connecting to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
-db = client.xinete_storage
-
-# Create collections if not exist
-if "batches" not in db.list_collection_names():
-    db.create_collection("batches")
+# Async repositories backed by the shared Motor client
+batch_repo = BatchRepository()
+product_repo = ProductRepository()
 
 # Setup router
 router = APIRouter()
@@ -94,7 +86,7 @@ async def create_batch(
         HTTPException 500: If blockchain registration fails
     """
     # Verify product exists
-    product = db.products.find_one({"id": batch_data.product_id})
+    product = await product_repo.get_by_id(batch_data.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
         
@@ -115,10 +107,7 @@ async def create_batch(
     batch_number = batch_data.batch_number
     if not batch_number:
         # Find the latest batch number for this product
-        latest_batch = db.batches.find_one(
-            {"product_id": batch_data.product_id},
-            sort=[("creation_date", pymongo.DESCENDING)]
-        )
+        latest_batch = await batch_repo.get_latest_for_product(batch_data.product_id)
         sequence = 1
         if latest_batch:
             try:
@@ -164,8 +153,8 @@ async def create_batch(
     # Process blockchain transaction - this is now mandatory
     try:
         # Import here to avoid circular imports
-        from services.blockchain import BlockchainService
-        blockchain_service = BlockchainService()
+        from services.blockchain import get_blockchain_service
+        blockchain_service = get_blockchain_service()
         
         # Register batch in blockchain
         tx_hash = await blockchain_service.register_batch(
@@ -187,7 +176,7 @@ async def create_batch(
         )
     
     # Insert batch into database
-    db.batches.insert_one(batch.dict())
+    await batch_repo.create(batch.dict())
     
     # Generate IPFS view link
     ipfs_view_link = ipfs_utils.get_ipfs_view_link(batch.ipfs_cid)
@@ -208,12 +197,17 @@ async def list_batches(
     enterprise_id: str,
     product_id: Optional[str] = None,
     status: Optional[str] = None,
+    response: Response = None,
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, description="Deprecated: use cursor instead"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     current_user: Dict = Depends(get_current_active_user)
 ):
     """
     List all batches for an enterprise, with optional filters.
+    
+    Newest first. The X-Next-Cursor response header holds the cursor for
+    the next page and is absent on the last page.
     """
     # Build query
     query = {"enterprise_id": enterprise_id}
@@ -223,7 +217,9 @@ async def list_batches(
         query["status"] = status
     
     # Get batches
-    batches = list(db.batches.find(query).sort("creation_date", -1).skip(offset).limit(limit))
+    batches, next_cursor = await batch_repo.list_for_enterprise(query, skip=offset, limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [Batch(**batch) for batch in batches]
 
@@ -235,7 +231,7 @@ async def get_batch(
     """
     Get batch details by ID.
     """
-    batch = db.batches.find_one({"id": batch_id})
+    batch = await batch_repo.get_by_id(batch_id)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
@@ -251,15 +247,12 @@ async def update_batch_status(
     Update batch status.
     """
     # Verify batch exists
-    batch = db.batches.find_one({"id": batch_id})
+    batch = await batch_repo.get_by_id(batch_id)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
     # Update batch status
-    db.batches.update_one(
-        {"id": batch_id},
-        {"$set": {"status": status}}
-    )
+    await batch_repo.set_status(batch_id, status)
     
     return {"message": f"Batch status updated to {status}"}
 
@@ -273,7 +266,7 @@ async def update_batch_quantity(
     Update batch current quantity.
     """
     # Verify batch exists
-    batch = db.batches.find_one({"id": batch_id})
+    batch = await batch_repo.get_by_id(batch_id)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
@@ -281,9 +274,6 @@ async def update_batch_quantity(
         raise HTTPException(status_code=400, detail="Quantity cannot be negative")
     
     # Update batch quantity
-    db.batches.update_one(
-        {"id": batch_id},
-        {"$set": {"current_quantity": quantity}}
-    )
+    await batch_repo.set_quantity(batch_id, quantity)
     
     return {"message": f"Batch quantity updated to {quantity}"}
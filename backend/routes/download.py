@@ -1,63 +1,240 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-from services.blockchain import BlockchainService
-from services.ipfs import IPFSService
-from services.metadata import MetadataService
+from services.blockchain import get_blockchain_service
+from services.cid_resolver import get_cid_resolver, VERIFY_STRICT
+from services.ownership import get_ownership_cache
+from services.user_profiles import get_user_profile_service
+from services.ipfs import get_ipfs_service, GatewayStream
+from services.blob_cache import get_blob_cache, CachedBlob, BLOB_CACHE_ENABLED
+from services.metadata import get_metadata_service
+from repositories.anchor_jobs import ANCHOR_PENDING, ANCHOR_SUBMITTED
 from routes.auth import get_current_user
-from fastapi.responses import StreamingResponse, JSONResponse, JSONResponse
-import io
+from fastapi.responses import Response, StreamingResponse, JSONResponse, FileResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Optional
 import logging
 from models.user import User, FileMetadata
+from repositories import UserRepository
+from utils.http_range import (
+    DOWNLOAD_CACHE_CONTROL, MultipartByteranges, RangeNotSatisfiable,
+    byte_slice, content_range, etag_for, etag_matches, parse_range, unsatisfied_range
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-blockchain_service = BlockchainService()
-ipfs_service = IPFSService()
+user_repo = UserRepository()
+
+async def _range_body(upstream: GatewayStream, start: int, end: int) -> AsyncIterator[bytes]:
+    """The bytes start..end of a gateway response opened with a Range header"""
+    try:
+        chunks = upstream.iter_chunks()
+        if upstream.status != 206:
+            # The gateway ignored the Range header and is sending the whole file
+            chunks = byte_slice(chunks, start, end - start + 1)
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        upstream.close()
+
+async def _open_range(cid: str, start: int, end: int) -> GatewayStream:
+    return await get_ipfs_service().open_stream(cid, headers={"Range": f"bytes={start}-{end}"})
+
+async def _send_file(cid: str, blob: Optional[CachedBlob], range_header: Optional[str], range_requested: bool,
+                     metadata: dict, headers: dict, cache_headers: dict) -> Response:
+    """
+    The file's content, whole or the requested ranges, from the blob cache or IPFS
+
+    range_requested is whether the request carried a Range header at all,
+    even one range_header no longer holds; FileResponse would act on it.
+    """
+    # Closes the cached copy however the response ends
+    background = BackgroundTask(blob.close) if blob is not None else None
+
+    ranges = None
+    if range_header:
+        try:
+            # Rows written with their CID carry the exact byte count
+            if blob is not None:
+                size = blob.size
+            else:
+                size = metadata.get("size") if metadata.get("cid") == cid else None
+            if size is None:
+                size = await get_ipfs_service().get_size(cid)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error downloading file content: {str(e)}")
+        if size is not None:
+            try:
+                ranges = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                return Response(
+                    status_code=416,
+                    headers={"Content-Range": unsatisfied_range(size), **cache_headers},
+                    background=background
+                )
+        if ranges and blob is None and BLOB_CACHE_ENABLED:
+            # Ranged readers (e.g. media players) never read the whole file
+            # through us, so fetch it in the background for their next request
+            get_blob_cache().prefetch(cid)
+
+    try:
+        if ranges and len(ranges) == 1:
+            # One range maps to one ranged request to the gateway
+            start, end = ranges[0]
+            headers["Content-Range"] = content_range(start, end, size)
+            headers["Content-Length"] = str(end - start + 1)
+            if blob is not None:
+                body = get_blob_cache().iter_range(blob, start, end)
+            else:
+                upstream = await _open_range(cid, start, end)
+                body, background = _range_body(upstream, start, end), BackgroundTask(upstream.close)
+            return StreamingResponse(
+                body,
+                status_code=206,
+                media_type="application/octet-stream",
+                headers=headers,
+                background=background
+            )
+        if ranges:
+            # Several ranges: each part is read as the multipart body
+            # reaches it, from one ranged gateway request apiece
+            async def open_part(start: int, end: int) -> AsyncIterator[bytes]:
+                if blob is not None:
+                    return get_blob_cache().iter_range(blob, start, end)
+                return _range_body(await _open_range(cid, start, end), start, end)
+
+            body = MultipartByteranges(ranges, size, "application/octet-stream", open_part)
+            headers["Content-Length"] = str(body.content_length)
+            return StreamingResponse(body, status_code=206, media_type=body.media_type, headers=headers, background=background)
+
+        if blob is not None and not range_requested:
+            # Sent by path, through the server's pathsend extension where
+            # it has one; the cache keeps the file until the blob is closed
+            return FileResponse(
+                blob.path,
+                media_type="application/octet-stream",
+                headers=headers,
+                stat_result=blob.stat,
+                background=background
+            )
+        if blob is not None:
+            # A Range header we do not honour (e.g. malformed)
+            headers["Content-Length"] = str(blob.size)
+            return StreamingResponse(
+                get_blob_cache().iter_range(blob, 0, blob.size - 1),
+                media_type="application/octet-stream",
+                headers=headers,
+                background=background
+            )
+
+        # Only the response headers are read here; the body is streamed below.
+        # Through the cache, concurrent misses for a CID share one gateway
+        # fetch, each reading the copy being written to disk.
+        if BLOB_CACHE_ENABLED:
+            content_length, body = await get_blob_cache().fetch(cid)
+            background = None
+        else:
+            upstream = await get_ipfs_service().open_stream(cid)
+            content_length, body = upstream.content_length, upstream.iter_chunks()
+            background = BackgroundTask(upstream.close)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error downloading file content: {str(e)}")
+
+    if content_length is not None:
+        headers["Content-Length"] = str(content_length)
+
+    # Chunks are forwarded as they arrive, so memory stays bounded by the
+    # read buffer; a client disconnect stops iteration, which releases the
+    # upstream connection or stops following the cache's copy
+    return StreamingResponse(
+        body,
+        media_type="application/octet-stream",
+        headers=headers,
+        background=background
+    )
 
 @router.get("/storage/download/{file_hash}")
-async def download_file(file_hash: str, current_user: dict = Depends(get_current_user)):
+async def download_file(file_hash: str, request: Request, verify: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     try:
         try:
-            # Get CID from blockchain using file hash
-            cid = await blockchain_service.get_cid_by_hash(file_hash)
+            # Resolve the CID from the index; verify=strict reads the contract
+            cid = await get_cid_resolver().resolve(file_hash, strict=verify == VERIFY_STRICT)
         except Exception as e:
             if "File not found" in str(e):
                 raise HTTPException(status_code=404, detail="File not found in blockchain. The file may have been deleted.")
             raise HTTPException(status_code=500, detail=f"Error retrieving file: {str(e)}")
             
-        # Verify ownership
+        # The caller's metadata row for the file, if any
+        metadata = await get_metadata_service().get_file_metadata(current_user, file_hash) or {}
+
+        # Verify ownership: the contract records whoever stored the CID. That
+        # is the user's wallet if they anchored it themselves, or the
+        # platform's account for files uploaded here, which the user may
+        # download if they have a row for it. Batch members are anchored
+        # through their manifest. Until the anchor transaction is mined the
+        # contract has no record yet; the metadata row, which is looked up
+        # by the caller's username, records them as the owner meanwhile.
         try:
-            is_owner = await blockchain_service.verify_ownership(current_user["address"], cid)
+            strict = verify == VERIFY_STRICT
+            candidates = []
+            is_owner = metadata.get("anchor_status") in (ANCHOR_PENDING, ANCHOR_SUBMITTED)
+            if not is_owner:
+                profile = await get_user_profile_service().get_profile(current_user["username"].lower()) or {}
+                if profile.get("wallet_address"):
+                    candidates.append((profile["wallet_address"], cid))
+                if metadata:
+                    anchored_cid = metadata.get("manifest_cid") if metadata.get("manifest_hash") else cid
+                    candidates.append((get_blockchain_service().account.address, anchored_cid))
+            for address, anchored_cid in candidates:
+                if await get_ownership_cache().is_owner(address, anchored_cid, strict=strict):
+                    is_owner = True
+                    break
             if not is_owner:
                 raise HTTPException(status_code=403, detail="Not authorized to download this file")
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error verifying file ownership: {str(e)}")
+
+        # The content behind a CID never changes, so the CID is the ETag and
+        # a client holding it can reuse its copy
+        etag = etag_for(cid)
+        cache_headers = {
+            "ETag": etag,
+            "Cache-Control": DOWNLOAD_CACHE_CONTROL,
+            "Accept-Ranges": "bytes"
+        }
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=cache_headers)
         
+        filename = metadata.get("filename") or file_hash
+
+        headers = {
+            "Content-Disposition": f"attachment; filename={filename}",
+            **cache_headers
+        }
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if if_range and if_range.strip() != etag:
+            # The client's partial copy is of other content; send the whole file
+            range_header = None
+
+        # Hot files are served from local disk. The copy is opened here, and
+        # the cache keeps its file until the response closes it.
+        blob = None
+        if BLOB_CACHE_ENABLED:
+            try:
+                blob = await get_blob_cache().get(cid)
+            except Exception as e:
+                logger.warning(f"Error reading cached {cid}, proxying from IPFS: {str(e)}")
         try:
-            # Get filename from blockchain
-            filename = await blockchain_service.get_filename_by_hash(file_hash)
-            if not filename:
-                filename = file_hash
+            return await _send_file(cid, blob, range_header, "range" in request.headers, metadata, headers, cache_headers)
+        except BaseException:
+            if blob is not None:
+                blob.close()
+            raise
 
-            # Get file from IPFS
-            file_content = await ipfs_service.get_file(cid)
-            
-            # Create a stream from the file content
-            stream = io.BytesIO(file_content)
-            
-            # Return the file as a streaming response with filename in headers
-            headers = {
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
-            return StreamingResponse(
-                stream,
-                media_type="application/octet-stream",
-                headers=headers
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error downloading file content: {str(e)}")
-        
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -66,14 +243,11 @@ async def download_file(file_hash: str, current_user: dict = Depends(get_current
 @router.get("/user/{username}", response_model=User)
 async def get_user_by_username(username: str):
     try:
-        from utils.mongodb import get_users_collection
-        users_collection = get_users_collection()
-        
         # Normalize username
         normalized_username = username.lower()
         
         # Get user from MongoDB
-        db_user = users_collection.find_one({"username": normalized_username})
+        db_user = await user_repo.get_by_username(normalized_username)
         if not db_user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -81,8 +255,7 @@ async def get_user_by_username(username: str):
         wallet_address = db_user.get("wallet_address", None)
         
         # Get user files using metadata service
-        from services.metadata import MetadataService
-        metadata_service = MetadataService()
+        metadata_service = get_metadata_service()
         
         # Get files - first try with username string for B2C users
         files = await metadata_service.get_user_files(normalized_username)
@@ -91,10 +264,7 @@ async def get_user_by_username(username: str):
         if not files and "enterprise_id" in db_user:
             user_dict = {"username": normalized_username, "enterprise_id": db_user["enterprise_id"]}
             files = await metadata_service.get_user_files(user_dict)
-        
-        # If still no files, check the legacy storage in user document
-        if not files:
-            files = db_user.get("files", [])
+
         
         # Convert all files to proper FileMetadata objects
         file_objs = []
@@ -124,6 +294,6 @@ async def download_options_handler(path: str):
         status_code=200,
         headers={
             "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, Content-Language, Accept-Language",
+            "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, Accept, Origin, Content-Language, Accept-Language, Range, If-Range, If-None-Match",
         },
     )
\ No newline at end of file
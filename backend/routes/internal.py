@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Optional
+import hmac
+import os
+from utils.mongodb import get_pool_stats
+from utils.query_monitor import get_route_stats, reset_route_stats, SLOW_QUERY_MS
+from utils.cache import get_cache_stats
+from services.blob_cache import get_blob_cache
+from services.cid_resolver import get_cid_resolver
+from services.ownership import get_ownership_cache
+
+router = APIRouter()
+
+# Internal endpoints require a matching X-API-Key header. While it is unset
+# they are disabled and answer 404.
+INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY", "")
+
+def verify_internal_key(x_api_key: Optional[str] = Header(None)):
+    if not INTERNAL_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_api_key or not hmac.compare_digest(x_api_key, INTERNAL_API_KEY):
+        raise HTTPException(status_code=403, detail="Invalid internal API key")
+
+@router.get("/db-stats", dependencies=[Depends(verify_internal_key)])
+async def db_stats():
+    """
+    MongoDB command statistics per route for this worker, busiest routes first
+    """
+    return {
+        "slow_query_ms": SLOW_QUERY_MS,
+        "pool": get_pool_stats(),
+        "routes": get_route_stats(),
+    }
+
+@router.delete("/db-stats", dependencies=[Depends(verify_internal_key)])
+async def clear_db_stats():
+    """
+    Reset the per-route statistics, e.g. before a load test
+    """
+    reset_route_stats()
+    return {"message": "Statistics reset"}
+
+@router.get("/cache-stats", dependencies=[Depends(verify_internal_key)])
+async def cache_stats():
+    """
+    Hit/miss counters of the in-process caches of this worker
+    """
+    return get_cache_stats()
+
+@router.get("/blob-cache-stats", dependencies=[Depends(verify_internal_key)])
+async def blob_cache_stats():
+    """
+    Size and hit/miss/eviction counters of this worker's on-disk file cache
+    """
+    return get_blob_cache().stats()
+
+@router.get("/cid-index-stats", dependencies=[Depends(verify_internal_key)])
+async def cid_index_stats():
+    """
+    How this worker resolved file hashes: in-process hits, index hits, chain reads
+    """
+    return get_cid_resolver().stats()
+
+@router.get("/ownership-stats", dependencies=[Depends(verify_internal_key)])
+async def ownership_stats():
+    """
+    Ownership cache counters and how far this worker trails the chain's ownership events
+    """
+    return get_ownership_cache().stats()
@@ -1,32 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Query, Path
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, Path, Response
 from typing import Dict, Any, List, Optional
 import uuid
 from datetime import datetime
 import pymongo
+from pymongo.errors import DuplicateKeyError
 import os
 from models.inventory import InventoryUpdate, InventoryItem, InventoryAuditLog
 from routes.auth import get_current_active_user
+from repositories import InventoryRepository, InventoryAuditLogRepository, ProductRepository, run_in_transaction
 
-# Setup MongoDB client
-try:
-    from utils.mongodb import get_mongo_connection
-    client, db = get_mongo_connection()
-    print("Inventory route connected to MongoDB successfully")
-    
-    # Create collections if not exist
-    if "inventory" not in db.list_collection_names():
-        db.create_collection("inventory")
-except Exception as e:
-    print(f"Inventory route failed to connect to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
-    db.create_collection("inventory")
-    # Create a compound index on product_id and location for faster lookups
-    db.inventory.create_index([("product_id", pymongo.ASCENDING), ("location", pymongo.ASCENDING)], unique=True)
-
-if "inventory_audit_logs" not in db.list_collection_names():
-    db.create_collection("inventory_audit_logs")
-    # Create an index for faster audit log queries
-    db.inventory_audit_logs.create_index([("product_id", pymongo.ASCENDING), ("timestamp", pymongo.DESCENDING)])
+# Async repositories backed by the shared Motor client
+inventory_repo = InventoryRepository()
+inventory_audit_repo = InventoryAuditLogRepository()
+product_repo = ProductRepository()
 
 # Setup router
 router = APIRouter()
@@ -49,9 +35,10 @@ async def update_inventory(
     Raises:
         HTTPException 400: If trying to remove more inventory than available
         HTTPException 404: If the product is not found
+        HTTPException 409: If the record collides with an existing one
     """
     # Verify product exists
-    product = db.products.find_one({"id": update_data.product_id})
+    product = await product_repo.get_by_id(update_data.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -60,99 +47,74 @@ async def update_inventory(
     if not enterprise_id:
         raise HTTPException(status_code=400, detail="User not associated with an enterprise")
     
-    # Check if inventory record exists for this product and location
-    inventory = db.inventory.find_one({
-        "product_id": update_data.product_id,
-        "location": update_data.location,
-        "enterprise_id": enterprise_id
-    })
-    
     # Current timestamp
     now = datetime.now()
-    
-    # Generate a unique ID for new inventory records
-    inventory_id = None
-    
-    if inventory:
-        # Record exists, update it
-        previous_quantity = inventory["quantity"]
-        
-        # Calculate new quantity based on operation
+    audit_log_id = f"log_{uuid.uuid4().hex[:8]}"
+    amount = update_data.change_in_quantity
+
+    async def apply_update(session):
+        # Change the quantity atomically and get the record back in one round trip
         if update_data.operation == "add":
-            new_quantity = previous_quantity + update_data.change_in_quantity
+            inventory = await inventory_repo.add_at_location(
+                update_data.product_id, update_data.location, enterprise_id,
+                amount, now, f"inv_{uuid.uuid4().hex[:8]}", session=session
+            )
         else:  # remove
-            if previous_quantity < update_data.change_in_quantity:
+            inventory = await inventory_repo.remove_at_location(
+                update_data.product_id, update_data.location, enterprise_id,
+                amount, now, session=session
+            )
+            if inventory is None:
+                # Nothing matched: find out whether the record is missing or too small
+                existing = await inventory_repo.get_at_location(update_data.product_id, update_data.location, enterprise_id)
+                if not existing:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Cannot remove from non-existent inventory. Please add inventory first."
+                    )
                 raise HTTPException(
                     status_code=400, 
-                    detail=f"Not enough inventory. Current: {previous_quantity}, Attempting to remove: {update_data.change_in_quantity}"
+                    detail=f"Not enough inventory. Current: {existing['quantity']}, Attempting to remove: {amount}"
                 )
-            new_quantity = previous_quantity - update_data.change_in_quantity
-        
-        # Update the inventory record
-        db.inventory.update_one(
-            {"id": inventory["id"]},
-            {"$set": {
-                "quantity": new_quantity,
-                "last_updated": now
-            }}
-        )
-        
-        inventory_id = inventory["id"]
-    else:
-        # Record doesn't exist, create a new one
-        if update_data.operation == "remove":
-            raise HTTPException(
-                status_code=400,
-                detail="Cannot remove from non-existent inventory. Please add inventory first."
-            )
-        
-        # For new records, the new quantity is simply the change amount (since we're adding)
-        previous_quantity = 0
-        new_quantity = update_data.change_in_quantity
-        
-        # Generate a unique ID
-        inventory_id = f"inv_{uuid.uuid4().hex[:8]}"
-        
-        # Create new inventory record
-        new_inventory = InventoryItem(
-            id=inventory_id,
+
+        new_quantity = inventory["quantity"]
+        previous_quantity = new_quantity - amount if update_data.operation == "add" else new_quantity + amount
+
+        # Create audit log entry
+        audit_log = InventoryAuditLog(
+            id=audit_log_id,
+            inventory_id=inventory["id"],
             product_id=update_data.product_id,
             enterprise_id=enterprise_id,
             location=update_data.location,
-            quantity=new_quantity,
-            last_updated=now
+            previous_quantity=previous_quantity,
+            new_quantity=new_quantity,
+            change_amount=amount,
+            operation=update_data.operation,
+            timestamp=now,
+            user_id=current_user.get("id", "unknown"),
+            notes=update_data.notes
         )
         
-        # Insert into database
-        db.inventory.insert_one(new_inventory.dict())
-    
-    # Create audit log entry
-    audit_log = InventoryAuditLog(
-        id=f"log_{uuid.uuid4().hex[:8]}",
-        inventory_id=inventory_id,
-        product_id=update_data.product_id,
-        enterprise_id=enterprise_id,
-        location=update_data.location,
-        previous_quantity=previous_quantity,
-        new_quantity=new_quantity,
-        change_amount=update_data.change_in_quantity,
-        operation=update_data.operation,
-        timestamp=now,
-        user_id=current_user.get("id", "unknown"),
-        notes=update_data.notes
-    )
-    
-    # Insert audit log
-    db.inventory_audit_logs.insert_one(audit_log.dict())
-    
-    # Get updated inventory
-    updated_inventory = db.inventory.find_one({"id": inventory_id})
+        # Insert audit log
+        await inventory_audit_repo.create(audit_log.dict(), session=session)
+        return inventory
+
+    try:
+        updated_inventory = await run_in_transaction(apply_update)
+    except DuplicateKeyError:
+        # A concurrent request created the record first; the retry updates it
+        try:
+            updated_inventory = await run_in_transaction(apply_update)
+        except DuplicateKeyError:
+            # Not that race: the record collides with another unique index
+            raise HTTPException(status_code=409, detail="Inventory record conflicts with an existing record")
     
     return {
         "inventory": InventoryItem(**updated_inventory).dict(),
         "message": f"Inventory {update_data.operation}ed successfully",
         "product_name": product.get("product_name", "Unknown product"),
-        "audit_log_id": audit_log.id
+        "audit_log_id": audit_log_id
     }
 
 @router.get("/{product_id}", response_model=List[InventoryItem])
@@ -174,7 +136,7 @@ async def get_live_inventory(
         HTTPException 404: If the product is not found
     """
     # Verify product exists
-    product = db.products.find_one({"id": product_id})
+    product = await product_repo.get_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -194,7 +156,7 @@ async def get_live_inventory(
         query["location"] = location
     
     # Get inventory
-    inventory_items = list(db.inventory.find(query))
+    inventory_items = await inventory_repo.list_items(query)
     
     if not inventory_items and not location:
         # Return empty list but not an error - it's valid to have no inventory
@@ -210,15 +172,18 @@ async def get_live_inventory(
 async def get_inventory_audit(
     product_id: str = Path(..., description="ID of the product to get audit logs for"),
     location: Optional[str] = Query(None, description="Optional location filter"),
+    response: Response = None,
     limit: int = Query(50, ge=1, le=1000, description="Maximum number of audit logs to return"),
-    offset: int = Query(0, ge=0, description="Number of audit logs to skip"),
+    offset: int = Query(0, ge=0, description="Number of audit logs to skip (deprecated: use cursor instead)"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     current_user: Dict = Depends(get_current_active_user)
 ):
     """
     Get inventory audit logs for a product.
     
     Returns a history of inventory changes for the specified product,
-    optionally filtered by location.
+    optionally filtered by location. The X-Next-Cursor response header holds
+    the cursor for the next page and is absent on the last page.
     
     Returns:
         A list of audit log entries for the specified product.
@@ -239,12 +204,9 @@ async def get_inventory_audit(
         query["location"] = location
     
     # Get audit logs
-    audit_logs = list(
-        db.inventory_audit_logs.find(query)
-        .sort("timestamp", pymongo.DESCENDING)
-        .skip(offset)
-        .limit(limit)
-    )
+    audit_logs, next_cursor = await inventory_audit_repo.list_logs(query, skip=offset, limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     # Convert to Pydantic models
     return [InventoryAuditLog(**log) for log in audit_logs]
@@ -6,18 +6,11 @@ import pymongo
 import os
 from models.product import Product, ProductCreate
 from routes.auth import get_current_active_user
-from utils.mongodb import get_mongo_connection
+from repositories import EnterpriseRepository, ProductRepository
 
-# Setup MongoDB client
-try:
-    client, db = get_mongo_connection()
-    
-    # Create products collection if not exists
-    if "products" not in db.list_collection_names():
-        db.create_collection("products")
-except Exception as e:
-    print(f"Error in product route connecting to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
+# Async repositories backed by the shared Motor client
+enterprise_repo = EnterpriseRepository()
+product_repo = ProductRepository()
 
 # Setup router
 router = APIRouter()
@@ -28,15 +21,12 @@ async def add_product(product_data: ProductCreate = Body(...), current_user=Depe
     Add a new product for an enterprise.
     """
     # Verify enterprise exists
-    enterprise = db.enterprises.find_one({"id": product_data.enterprise_id})
+    enterprise = await enterprise_repo.get_by_id(product_data.enterprise_id)
     if not enterprise:
         raise HTTPException(status_code=404, detail="Enterprise not found")
     
     # Check if product with same name already exists for this enterprise
-    existing = db.products.find_one({
-        "enterprise_id": product_data.enterprise_id,
-        "product_name": product_data.product_name
-    })
+    existing = await product_repo.get_by_name(product_data.enterprise_id, product_data.product_name)
     
     if existing:
         raise HTTPException(status_code=400, detail="Product with this name already exists for this enterprise")
@@ -52,7 +42,7 @@ async def add_product(product_data: ProductCreate = Body(...), current_user=Depe
     )
     
     # Insert product into database
-    db.products.insert_one(product.dict())
+    await product_repo.create(product.dict())
     
     # Optional: Update IPFS and blockchain records
     # This would be implemented in a background task
@@ -67,12 +57,12 @@ async def list_products(enterprise_id: str, current_user=Depends(get_current_act
     List all products for an enterprise.
     """
     # Verify enterprise exists
-    enterprise = db.enterprises.find_one({"id": enterprise_id})
+    enterprise = await enterprise_repo.get_by_id(enterprise_id)
     if not enterprise:
         raise HTTPException(status_code=404, detail="Enterprise not found")
     
     # Get all products for this enterprise
-    products = list(db.products.find({"enterprise_id": enterprise_id}))
+    products = await product_repo.list_for_enterprise(enterprise_id)
     
     return [Product(**product) for product in products]
 
@@ -83,7 +73,7 @@ async def get_product(product_id: str, current_user=Depends(get_current_active_u
     Get product details by ID.
     """
     # Find product by ID
-    product = db.products.find_one({"id": product_id})
+    product = await product_repo.get_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -101,7 +91,7 @@ async def update_product(
     Update product details.
     """
     # Find product by ID
-    product = db.products.find_one({"id": product_id})
+    product = await product_repo.get_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -114,10 +104,7 @@ async def update_product(
             del update_data[field]
     
     # Update product in database
-    result = db.products.update_one(
-        {"id": product_id},
-        {"$set": update_data}
-    )
+    result = await product_repo.update_fields(product_id, update_data)
     
     if result.modified_count:
         return {"message": "Product updated successfully"}
@@ -131,11 +118,11 @@ async def delete_product(product_id: str, current_user=Depends(get_current_activ
     Delete a product.
     """
     # Find product by ID
-    product = db.products.find_one({"id": product_id})
+    product = await product_repo.get_by_id(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Delete product from database
-    db.products.delete_one({"id": product_id})
+    await product_repo.delete(product_id)
     
     return {"message": "Product deleted successfully"}
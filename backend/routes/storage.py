@@ -1,39 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Header, Request
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Header, Request, Response, Query
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from typing import Optional, List, Dict, Any, Union
 import os
 import hashlib
 import json
 import logging
 from datetime import datetime
-from pymongo import MongoClient
 
-from services.ipfs import IPFSService
-from services.blockchain import BlockchainService
-from services.metadata import MetadataService
+from services.ipfs import get_ipfs_service
+from services.blockchain import get_blockchain_service
+from services.cid_resolver import get_cid_resolver, VERIFY_STRICT
+from services.ownership import get_ownership_cache
+from services.metadata import get_metadata_service
+from services.uploads import store_upload, store_batch, UPLOAD_BATCH_MAX_FILES
 from models.user import User
 from .auth import get_current_user
 from models.user import FileMetadata
+from models.file_metadata import FileMetadata as StoredFileMetadata
+from repositories import UserRepository, AnchorJobRepository, FileMetadataRepository
+from repositories.file_metadata import FILE_SORT_FIELDS
+from utils.pagination import decode_cursor
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize services
-ipfs_service = IPFSService()
-blockchain_service = BlockchainService()
-metadata_service = MetadataService()
-
-# Get MongoDB connection and collections
-try:
-    from utils.mongodb import get_mongo_connection, get_users_collection
-    mongo_client, db = get_mongo_connection()
-    users_collection = get_users_collection()
-    logger.info("Storage route connected to MongoDB successfully")
-except Exception as e:
-    logger.error(f"Storage route failed to connect to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
+# Async repositories backed by the shared Motor client
+user_repo = UserRepository()
+anchor_repo = AnchorJobRepository()
+file_metadata_repo = FileMetadataRepository()
 
 @router.post("/upload")
 async def upload_file(
@@ -42,112 +38,161 @@ async def upload_file(
 ):
     try:
         logger.info(f"Processing file upload: {file.filename} for user: {current_user.get('username', 'unknown')}")
-        
-        # Upload file to IPFS
-        cid = await ipfs_service.upload_file(file)
-        file_hash = hashlib.sha256(cid.encode()).hexdigest()
-        
-        # Store in blockchain
-        try:
-            tx_hash = await blockchain_service.store_cid(current_user, cid, file_hash)
-            logger.info(f"File stored in blockchain with tx_hash: {tx_hash}")
-        except Exception as e:
-            logger.error(f"Error storing in blockchain: {str(e)}")
-            tx_hash = "error-" + hashlib.md5(str(datetime.now()).encode()).hexdigest()
-            
-        # Get file size
-        await file.seek(0)
-        file_content = await file.read()
-        file_size = len(file_content)
-        await file.seek(0)
-        
-        # Create metadata object
-        metadata = FileMetadata(
-            filename=file.filename,
-            user=current_user,  # Pass the entire user object
-            size=file_size,
-            upload_date=datetime.now(),
-            content_type=file.content_type,
-            file_hash=file_hash,
-            transaction_hash=tx_hash
-        )
-        
-        # Store metadata using our service - will handle different user types
-        success = await metadata_service.store_metadata(metadata)
-        if not success:
-            logger.warning(f"Failed to store metadata for file {file_hash}")
-            
-        # Also update the user's files list for backward compatibility
-        try:
-            normalized_username = current_user.get("username", "").lower()
-            if normalized_username:
-                users_collection.update_one(
-                    {"username": normalized_username},
-                    {"$push": {"files": metadata.dict()}},
-                    upsert=True
-                )
-        except Exception as e:
-            logger.error(f"Error updating user's files list: {str(e)}")
-            
+        return await store_upload(file, current_user)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/upload-batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload many files at once. They are pinned concurrently and anchored
+    together through one manifest transaction; the response has a result
+    per file, and files that fail do not fail the rest.
+    """
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {UPLOAD_BATCH_MAX_FILES} files per batch")
+    try:
+        logger.info(f"Processing batch upload of {len(files)} files for user: {current_user.get('username', 'unknown')}")
+        return await store_batch(files, current_user)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/anchor-status/{file_hash}")
+async def get_anchor_status(
+    file_hash: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Report how far a file's on-chain anchoring has progressed.
+    """
+    metadata = await get_metadata_service().get_file_metadata(current_user, file_hash)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Batch uploads are anchored through their manifest
+    job = await anchor_repo.get_by_file_hash(metadata.get("manifest_hash") or file_hash)
+    if not job:
+        # Uploaded before anchoring was queued
         return {
-            "status": "success",
-            "filename": file.filename,
-            "upload_date": metadata.upload_date,
-            "size": metadata.size,
             "file_hash": file_hash,
-            "transaction_hash": tx_hash
+            "status": metadata.get("anchor_status") or "unknown",
+            "transaction_hash": metadata.get("transaction_hash"),
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "file_hash": file_hash,
+        "cid": metadata.get("cid") or job.get("cid"),
+        "manifest_cid": metadata.get("manifest_cid"),
+        "status": job.get("status"),
+        "transaction_hash": job.get("tx_hash"),
+        "block_number": job.get("block_number"),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "confirmed_at": job.get("confirmed_at"),
+    }
+
+# Fields a /files listing may select
+FILE_LIST_FIELDS = set(StoredFileMetadata.__fields__) - {"user"}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
 
 @router.get("/files")
 async def get_user_files(
     request: Request, 
+    response: Response,
     current_user: dict = Depends(get_current_user),
-    x_wallet_address: Optional[str] = Header(None, alias="X-Wallet-Address")
+    x_wallet_address: Optional[str] = Header(None, alias="X-Wallet-Address"),
+    limit: int = Query(100, ge=1, le=1000, description="Page size; in NDJSON mode, the maximum number of files streamed"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page"),
+    sort: str = Query("upload_date", description="upload_date, size or filename"),
+    order: str = Query("desc", description="asc or desc"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. filename,size,file_hash"),
+    format: str = Query("json", description="json for one page, ndjson to stream one file per line")
 ):
+    """
+    List the caller's files one page at a time.
+
+    The cursor for the next page is returned as "next_cursor" and in the
+    X-Next-Cursor header; both are absent on the last page. With
+    format=ndjson (or Accept: application/x-ndjson) files are streamed from
+    the database cursor as newline-delimited JSON; without a limit the
+    whole listing is streamed.
+    """
+    username = current_user.get('username', 'unknown')
+    client_ip = request.client.host if request else "unknown"
+    logger.info(f"Getting files for user: {username} from IP: {client_ip}")
+    
+    # Try to get wallet address from multiple possible sources (header variations)
+    wallet_address = x_wallet_address or request.headers.get("x-wallet-address") or request.headers.get("X-Wallet-Address") 
+    
+    # If we found a wallet address, use it
+    if wallet_address:
+        logger.info(f"Wallet address found: {wallet_address}")
+        # Add wallet address to user info if it doesn't already have one
+        if not current_user.get("wallet_address"):
+            current_user["wallet_address"] = wallet_address
+
+    if sort not in FILE_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(FILE_SORT_FIELDS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    direction = 1 if order == "asc" else -1
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    if selected:
+        unknown = set(selected) - FILE_LIST_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    metadata_service = get_metadata_service()
+    streaming = format == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+    if streaming:
+        # Reject a bad cursor before the response starts
+        if cursor:
+            decode_cursor(cursor)
+        stream_limit = limit if "limit" in request.query_params else 0
+
+        async def lines():
+            async for file in metadata_service.stream_user_files(
+                current_user, sort, direction, limit=stream_limit, cursor=cursor, fields=selected
+            ):
+                yield json.dumps(file, default=_json_default) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
     try:
-        username = current_user.get('username', 'unknown')
-        client_ip = request.client.host if request else "unknown"
-        logger.info(f"Getting files for user: {username} from IP: {client_ip}")
-        
-        # Log headers for debugging
-        all_headers = dict(request.headers)
-        logger.info(f"Request headers received in /files: {all_headers}")
-        
-        # Try to get wallet address from multiple possible sources (header variations)
-        wallet_address = x_wallet_address or request.headers.get("x-wallet-address") or request.headers.get("X-Wallet-Address") 
-        
-        # If we found a wallet address, use it
-        if wallet_address:
-            logger.info(f"Wallet address found: {wallet_address}")
-            # Add wallet address to user info if it doesn't already have one
-            if not current_user.get("wallet_address"):
-                current_user["wallet_address"] = wallet_address
-        
-        # Get files using metadata service - handles both B2C and enterprise users
-        files = await metadata_service.get_user_files(current_user)
-        
-        # If no files found in metadata service, try legacy approach from users collection
-        if not files:
-            logger.info("No files found in metadata service, trying legacy approach")
-            normalized_username = current_user.get("username", "").lower()
-            if normalized_username:
-                try:
-                    db_user = users_collection.find_one({"username": normalized_username})
-                    files = db_user.get("files", []) if db_user else []
-                    logger.info(f"Retrieved {len(files)} files from user document for {normalized_username}")
-                except Exception as db_error:
-                    logger.error(f"Error retrieving files from users collection: {str(db_error)}")
-                    files = []
-        else:
-            logger.info(f"Retrieved {len(files)} files from metadata service for {username}")
-                
-        # Always return as { files: [...] } for frontend compatibility
-        return {"files": [f for f in files]}
+        files, next_cursor = await metadata_service.list_user_files(
+            current_user, sort, direction, limit=limit, cursor=cursor, fields=selected
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting user files: {str(e)}", exc_info=True)
-        return {"files": []}
+        raise HTTPException(status_code=500, detail="Error listing files")
+    logger.info(f"Retrieved {len(files)} files from metadata service for {username}")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    # Always return as { files: [...] } for frontend compatibility
+    return {"files": files, "next_cursor": next_cursor}
+
+@router.get("/files/summary")
+async def get_user_files_summary(current_user: dict = Depends(get_current_user)):
+    """
+    The number of the caller's files and their total size in bytes, for
+    dashboards that show totals without listing every file
+    """
+    try:
+        return await get_metadata_service().summarize_user_files(current_user)
+    except Exception as e:
+        logger.error(f"Error summarizing user files: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error summarizing files")
 
 @router.get("/user", response_model=User)
 async def get_user(current_user: dict = Depends(get_current_user)):
@@ -156,16 +201,11 @@ async def get_user(current_user: dict = Depends(get_current_user)):
         normalized_username = current_user.get("username", "").lower()
         
         # Get user data from database
-        db_user = users_collection.find_one({"username": normalized_username}) if normalized_username else None
+        db_user = await user_repo.get_by_username(normalized_username) if normalized_username else None
         wallet_address = db_user.get("wallet_address", None) if db_user else None
         
         # Get files from metadata service
-        files = await metadata_service.get_user_files(current_user)
-        
-        # If no files found in metadata service, try legacy approach
-        if not files and db_user:
-            logger.info("No files found in metadata service, using files from user document")
-            files = db_user.get("files", [])
+        files = await get_metadata_service().get_user_files(current_user)
             
         # Convert all files to FileMetadata objects
         file_objs = []
@@ -194,11 +234,17 @@ async def get_user(current_user: dict = Depends(get_current_user)):
 @router.get("/download/{file_hash}")
 async def download_file(
     file_hash: str,
+    verify: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        # Get CID from blockchain using file hash
-        cid = await blockchain_service.get_cid_by_hash(file_hash)
+        metadata = await get_metadata_service().get_file_metadata(current_user, file_hash)
+        if metadata and metadata.get("manifest_hash"):
+            # Batch members are anchored through their manifest, which lists their CID
+            cid = metadata.get("cid")
+        else:
+            # Resolve the CID from the index; verify=strict reads the contract
+            cid = await get_cid_resolver().resolve(file_hash, strict=verify == VERIFY_STRICT)
         if not cid:
             raise HTTPException(status_code=404, detail="File not found in blockchain")
         # Use self-hosted IPFS gateway for download (ensure correct URL)
@@ -216,19 +262,25 @@ async def delete_file(
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        normalized_username = current_user["username"].lower()
-        db_user = users_collection.find_one({"username": normalized_username})
-        if not db_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        files = db_user.get("files", [])
-        new_files = [f for f in files if (f["file_hash"] if isinstance(f, dict) else f.file_hash) != file_hash]
-        users_collection.update_one(
-            {"username": normalized_username},
-            {"$set": {"files": new_files}}
-        )
-        cid = await blockchain_service.get_cid_by_hash(file_hash)
-        tx_hash = await blockchain_service.remove_cid(None, cid) if cid else None
+        metadata = await get_metadata_service().get_file_metadata(current_user, file_hash)
+        if not metadata or not await get_metadata_service().remove_metadata(current_user, file_hash):
+            raise HTTPException(status_code=404, detail="File not found")
+
+        # Deduplicated content is shared; only the last owner removes it from the chain.
+        # Batch members were never registered on their own.
+        tx_hash = None
+        if not metadata.get("manifest_hash") and not await file_metadata_repo.is_referenced(file_hash):
+            try:
+                cid = await get_cid_resolver().resolve(file_hash)
+                tx_hash = await get_blockchain_service().remove_cid(None, cid) if cid else None
+                # Seen here before the watcher reads the CIDRemoved event
+                get_ownership_cache().invalidate(cid)
+                await get_cid_resolver().forget(file_hash)
+            except Exception as e:
+                logger.warning(f"File {file_hash} removed from metadata but not from blockchain: {str(e)}")
         return {"status": "success", "tx_hash": tx_hash}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Body, Query, File, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, Body, Query, File, UploadFile, Response
 from typing import Dict, Any, List, Optional
 import uuid
 from datetime import datetime
@@ -6,24 +6,23 @@ import pymongo
 import os
 from models.traceability import TraceEvent, TraceEventCreate
 from routes.auth import get_current_active_user
+from repositories import BatchRepository, TraceEventRepository, run_in_transaction
 
-# Setup MongoDB client
-try:
-    from utils.mongodb import get_mongo_connection
-    client, db = get_mongo_connection()
-    print("Traceability route connected to MongoDB successfully")
-    
-    # Create collections if not exist
-    if "trace_events" not in db.list_collection_names():
-        db.create_collection("trace_events")
-except Exception as e:
-    print(f"Traceability route failed to connect to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
-    db.create_collection("trace_events")
+# Async repositories backed by the shared Motor client
+batch_repo = BatchRepository()
+trace_repo = TraceEventRepository()
 
 # Setup router
 router = APIRouter()
 
+# Batch status set by each event type
+BATCH_STATUS_BY_EVENT = {
+    "shipping": "shipped",
+    "receiving": "received",
+    "storage": "in_storage",
+    "sold": "sold",
+}
+
 @router.post("/add", response_model=Dict[str, str])
 async def add_trace_event(
     event_data: TraceEventCreate = Body(...),
@@ -48,18 +47,22 @@ async def add_trace_event(
         HTTPException 400: If IPFS CID is missing or invalid format
         HTTPException 500: If blockchain registration fails
     """
-    # Verify batch exists
-    batch = db.batches.find_one({"id": event_data.batch_id})
-    if not batch:
-        raise HTTPException(status_code=404, detail="Batch not found")
-        
     # Validate IPFS CID - ensure it's properly formatted (starts with Qm for CIDv0 or bafy for CIDv1)
     if not event_data.ipfs_cid:
         raise HTTPException(status_code=400, detail="IPFS CID is required for traceability events")
         
     if not (event_data.ipfs_cid.startswith("Qm") or event_data.ipfs_cid.startswith("bafy")):
         raise HTTPException(status_code=400, detail="Invalid IPFS CID format. Must start with 'Qm' or 'bafy'")
-    
+
+    # Verify the batch exists and read only the fields the event copies
+    batch = await batch_repo.get_for_event(event_data.batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    return await _record_trace_event(event_data, batch)
+
+async def _record_trace_event(event_data: TraceEventCreate, batch: Dict) -> Dict[str, str]:
+    """Register a trace event on the blockchain and store it"""
     # Get enterprise and product IDs from the batch
     enterprise_id = batch.get("enterprise_id")
     product_id = batch.get("product_id")
@@ -95,8 +98,8 @@ async def add_trace_event(
     # Process blockchain transaction for the traceability event - this is now mandatory
     try:
         # Import here to avoid circular imports
-        from services.blockchain import BlockchainService
-        blockchain_service = BlockchainService()
+        from services.blockchain import get_blockchain_service
+        blockchain_service = get_blockchain_service()
         
         # Record trace event in blockchain
         tx_hash = await blockchain_service.record_trace_event(
@@ -117,31 +120,17 @@ async def add_trace_event(
             status_code=500, 
             detail=f"Blockchain registration is required but failed: {str(e)}"
         )
-    
-    # Insert event into database
-    db.trace_events.insert_one(event.dict())
-    
-    # Update batch status based on event type
-    if event_data.event_type == "shipping":
-        db.batches.update_one(
-            {"id": event_data.batch_id},
-            {"$set": {"status": "shipped"}}
-        )
-    elif event_data.event_type == "receiving":
-        db.batches.update_one(
-            {"id": event_data.batch_id},
-            {"$set": {"status": "received"}}
-        )
-    elif event_data.event_type == "storage":
-        db.batches.update_one(
-            {"id": event_data.batch_id},
-            {"$set": {"status": "in_storage"}}
-        )
-    elif event_data.event_type == "sold":
-        db.batches.update_one(
-            {"id": event_data.batch_id},
-            {"$set": {"status": "sold"}}
-        )
+
+    # Batch status that follows from the event type, if any
+    new_status = BATCH_STATUS_BY_EVENT.get(event_data.event_type)
+
+    # Insert the event and update the batch status as one unit of work
+    async def write_event(session):
+        await trace_repo.create(event.dict(), session=session)
+        if new_status:
+            await batch_repo.set_status(event_data.batch_id, new_status, session=session)
+
+    await run_in_transaction(write_event)
     
     return {
         "event_id": event_id,
@@ -154,12 +143,17 @@ async def list_trace_events(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     event_type: Optional[str] = None,
+    response: Response = None,
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, description="Deprecated: use cursor instead"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     current_user: Dict = Depends(get_current_active_user)
 ):
     """
     List all traceability events for a batch, with optional filters.
+    
+    Oldest first. The X-Next-Cursor response header holds the cursor for
+    the next page and is absent on the last page.
     """
     # Build query
     query = {"batch_id": batch_id}
@@ -174,7 +168,9 @@ async def list_trace_events(
         query["event_type"] = event_type
     
     # Get events
-    events = list(db.trace_events.find(query).sort("timestamp", 1).skip(offset).limit(limit))
+    events, next_cursor = await trace_repo.list_for_batch(query, skip=offset, limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [TraceEvent(**event) for event in events]
 
@@ -186,7 +182,7 @@ async def get_trace_event(
     """
     Get traceability event details by ID.
     """
-    event = db.trace_events.find_one({"id": event_id})
+    event = await trace_repo.get_by_id(event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Traceability event not found")
     
@@ -203,7 +199,7 @@ async def upload_trace_document(
     Returns the IPFS CID that can be used when creating a trace event.
     """
     # Verify batch exists
-    batch = db.batches.find_one({"id": batch_id})
+    batch = await batch_repo.get_by_id(batch_id)
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
@@ -230,12 +226,17 @@ async def get_trace_history(
     product_id: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
+    response: Response = None,
     limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
+    offset: int = Query(0, ge=0, description="Deprecated: use cursor instead"),
+    cursor: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
     current_user: Dict = Depends(get_current_active_user)
 ):
     """
     Get traceability history for an enterprise, with optional filters.
+    
+    Newest first. The X-Next-Cursor response header holds the cursor for
+    the next page and is absent on the last page.
     """
     # Build query
     query = {"enterprise_id": enterprise_id}
@@ -250,6 +251,8 @@ async def get_trace_history(
         query["timestamp"] = {"$lte": end_date}
     
     # Get events
-    events = list(db.trace_events.find(query).sort("timestamp", -1).skip(offset).limit(limit))
+    events, next_cursor = await trace_repo.list_history(query, skip=offset, limit=limit, cursor=cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     return [TraceEvent(**event) for event in events]
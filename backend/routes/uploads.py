@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, Body, Query, Request
+from typing import Dict, Any
+import logging
+
+from models.upload_session import UploadSessionCreate
+from services.upload_sessions import get_upload_session_service
+from .auth import get_current_user
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("")
+async def create_upload_session(
+    request: UploadSessionCreate = Body(...),
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Start a resumable upload.
+
+    The response gives the chunk size and the offsets still missing; PUT each
+    chunk to /storage/uploads/{upload_id}?offset=N, in any order and in
+    parallel, then POST /storage/uploads/{upload_id}/finalize.
+    """
+    logger.info(f"Starting resumable upload of {request.filename} ({request.size} bytes) for user: {current_user.get('username', 'unknown')}")
+    return await get_upload_session_service().create(
+        current_user, request.filename, request.size, request.content_type, request.chunk_size
+    )
+
+@router.put("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., description="Byte offset of the chunk; a multiple of the session's chunk size"),
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Write one chunk of a resumable upload. Re-sending a chunk overwrites it.
+    """
+    return await get_upload_session_service().write_chunk(upload_id, current_user, offset, request.stream())
+
+@router.get("/{upload_id}")
+async def get_upload_progress(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Report which chunks of a resumable upload have been received.
+    """
+    service = get_upload_session_service()
+    return service.progress(await service.get(upload_id, current_user))
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Store a fully received upload. Returns the same result as /storage/upload;
+    finalizing a completed session returns its result again.
+    """
+    return await get_upload_session_service().finalize(upload_id, current_user)
+
+@router.delete("/{upload_id}")
+async def abort_upload(
+    upload_id: str,
+    current_user: dict = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Abandon a resumable upload and discard the received chunks.
+    """
+    await get_upload_session_service().abort(upload_id, current_user)
+    return {"status": "success", "upload_id": upload_id}
@@ -1,32 +1,27 @@
 from fastapi import APIRouter, HTTPException, Request
-from services.blockchain import BlockchainService
+from services.cid_resolver import get_cid_resolver, VERIFY_STRICT
 import logging
-from pymongo import MongoClient
 import os
+from typing import Optional
 from models.user import User, FileMetadata
 from fastapi.responses import JSONResponse
+from repositories import UserRepository
+from services.metadata import get_metadata_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-blockchain_service = BlockchainService()
 
-# Get MongoDB connection and collections
-try:
-    from utils.mongodb import get_mongo_connection, get_users_collection
-    mongo_client, db = get_mongo_connection()
-    users_collection = get_users_collection()
-    print("Verification route connected to MongoDB successfully")
-except Exception as e:
-    print(f"Verification route failed to connect to MongoDB: {str(e)}")
-    # Let FastAPI handle the exception
+# Async repositories backed by the shared Motor client
+user_repo = UserRepository()
 
 @router.post("/verify-cid")
-async def verify_cid_from_blockchain(file_hash: str):
+async def verify_cid_from_blockchain(file_hash: str, verify: Optional[str] = None):
     try:
         logging.info(f"Attempting to retrieve CID for hash: {file_hash}")
-        cid = await blockchain_service.get_cid_by_hash(file_hash)
+        # Confirmed answers come from the index; verify=strict reads the contract
+        cid = await get_cid_resolver().resolve(file_hash, strict=verify == VERIFY_STRICT, anchored=True)
         logging.info(f"Successfully verified CID {cid} for hash {file_hash}")
         return {"cid": cid, "status": "verified"}
     except Exception as e:
@@ -36,12 +31,12 @@ async def verify_cid_from_blockchain(file_hash: str):
 @router.get("/verify-user/{username}", response_model=User)
 async def verify_user_and_files(username: str):
     normalized_username = username.lower()
-    db_user = users_collection.find_one({"username": normalized_username})
+    db_user = await user_repo.get_by_username(normalized_username)
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     wallet_address = db_user.get("wallet_address", None)
-    files = db_user.get("files", [])
-    file_objs = [FileMetadata(**f) if not isinstance(f, FileMetadata) else f for f in files]
+    files = (await get_metadata_service().get_files_by_user_ids([normalized_username])).get(normalized_username, [])
+    file_objs = [FileMetadata(**f) for f in files]
     return User(username=username, wallet_address=wallet_address, files=file_objs)
 
 @router.options("/verify-cid")
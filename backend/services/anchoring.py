@@ -0,0 +1,204 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+from typing import Dict, Optional
+from web3.exceptions import TimeExhausted
+from repositories import FileMetadataRepository, LeaseRepository
+from repositories.anchor_jobs import (
+    AnchorJobRepository, ANCHOR_SUBMITTED, ANCHOR_CONFIRMED, ANCHOR_FAILED
+)
+from services.blockchain import get_blockchain_service
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to never anchor from this process. Of the processes that
+# have it enabled, only the holder of the anchoring lease submits transactions.
+ANCHOR_WORKER_ENABLED = os.getenv("ANCHOR_WORKER_ENABLED", "true").lower() != "false"
+# How long the anchoring lease lasts unless renewed; a process that dies
+# holding it delays anchoring by at most this long
+ANCHOR_LEADER_LEASE_SECONDS = float(os.getenv("ANCHOR_LEADER_LEASE_SECONDS", "30"))
+# Transactions awaiting confirmation at the same time
+ANCHOR_MAX_IN_FLIGHT = int(os.getenv("ANCHOR_MAX_IN_FLIGHT", "16"))
+# Attempts before a job is marked failed
+ANCHOR_MAX_ATTEMPTS = int(os.getenv("ANCHOR_MAX_ATTEMPTS", "5"))
+# How long to wait for a receipt before checking the chain and retrying
+ANCHOR_RECEIPT_TIMEOUT = float(os.getenv("ANCHOR_RECEIPT_TIMEOUT", "120"))
+# How long a claimed job stays with its worker; must exceed the receipt timeout
+ANCHOR_LEASE_SECONDS = float(os.getenv("ANCHOR_LEASE_SECONDS", str(ANCHOR_RECEIPT_TIMEOUT + 60)))
+# Idle poll interval when no job is due
+ANCHOR_POLL_SECONDS = float(os.getenv("ANCHOR_POLL_SECONDS", "5"))
+
+ANCHOR_LEASE_NAME = "anchor_worker"
+
+class AnchorWorker:
+    """
+    Background worker that anchors uploaded files on the blockchain.
+
+    Jobs are read from the anchor_jobs collection, so they survive restarts.
+    Only the process holding the anchoring lease claims jobs, so processes
+    sharing the signing account do not race each other for nonces.
+    Transactions are submitted one at a time, which keeps nonces ordered,
+    and up to ANCHOR_MAX_IN_FLIGHT of them await their receipts concurrently.
+    All web3 calls run in worker threads.
+    """
+
+    def __init__(self):
+        self.repository = AnchorJobRepository()
+        self.metadata_repository = FileMetadataRepository()
+        self.lease_repository = LeaseRepository()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task = None
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(ANCHOR_MAX_IN_FLIGHT)
+        self._submit_lock = asyncio.Lock()
+        self._in_flight = set()
+        self._lease_expires_at = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Anchor worker {self.worker_id} started")
+
+    async def stop(self):
+        tasks = [task for task in [self._task, *self._in_flight] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        if self._lease_expires_at:
+            try:
+                await self.lease_repository.release(ANCHOR_LEASE_NAME, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Error releasing the anchoring lease: {str(e)}")
+            self._lease_expires_at = 0.0
+
+    def notify(self):
+        """Wake the worker after a job was enqueued in this process"""
+        self._wake.set()
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=ANCHOR_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def _is_leader(self) -> bool:
+        return time.monotonic() < self._lease_expires_at
+
+    async def _lead(self) -> bool:
+        """Take or renew the anchoring lease once a third of it has passed"""
+        if time.monotonic() < self._lease_expires_at - ANCHOR_LEADER_LEASE_SECONDS * 2 / 3:
+            return True
+        started = time.monotonic()
+        was_leader = self._is_leader()
+        try:
+            acquired = await self.lease_repository.acquire(ANCHOR_LEASE_NAME, self.worker_id, ANCHOR_LEADER_LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Error renewing the anchoring lease: {str(e)}")
+            return self._is_leader()
+        self._lease_expires_at = started + ANCHOR_LEADER_LEASE_SECONDS if acquired else 0.0
+        if acquired != was_leader:
+            logger.info(f"Anchor worker {self.worker_id} " + ("took" if acquired else "lost") + " the anchoring lease")
+        return acquired
+
+    async def _run(self):
+        while True:
+            if not await self._lead():
+                await self._idle()
+                continue
+            await self._slots.acquire()
+            try:
+                job = await self.repository.claim_next(self.worker_id, ANCHOR_LEASE_SECONDS)
+            except Exception as e:
+                self._slots.release()
+                logger.error(f"Error claiming anchor job: {str(e)}")
+                await self._idle()
+                continue
+
+            if job is None:
+                self._slots.release()
+                await self._idle()
+                continue
+
+            task = asyncio.create_task(self._process(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+            task.add_done_callback(lambda _: self._slots.release())
+
+    async def _finish(self, job: Dict, status: str, tx_hash: Optional[str] = None, block_number: Optional[int] = None, error: Optional[str] = None):
+        if status == ANCHOR_CONFIRMED:
+            await self.repository.mark_confirmed(job["_id"], tx_hash, block_number)
+        else:
+            await self.repository.mark_failed(job["_id"], error)
+        await self.metadata_repository.set_anchor_status(job["file_hash"], status, tx_hash)
+        logger.info(f"Anchor job for {job['file_hash']} {status}" + (f": {error}" if error else ""))
+
+    async def _process(self, job: Dict):
+        blockchain = get_blockchain_service()
+        file_hash = job["file_hash"]
+        tx_hash = job.get("tx_hash") if job.get("status") == ANCHOR_SUBMITTED else None
+        submitted = False
+
+        try:
+            if tx_hash is None:
+                # A previous attempt may have been mined after we gave up on it
+                if await asyncio.to_thread(blockchain.is_hash_stored, file_hash):
+                    await self._finish(job, ANCHOR_CONFIRMED, job.get("tx_hash"))
+                    return
+                async with self._submit_lock:
+                    if not self._is_leader():
+                        # Another process may be anchoring now; hand the job to it
+                        await self.repository.schedule_retry(job["_id"], "Anchoring lease lost before submitting", 0)
+                        return
+                    tx_hash = await asyncio.to_thread(blockchain.submit_store_cid, job["cid"], file_hash)
+                submitted = True
+                await self.repository.mark_submitted(job["_id"], tx_hash, ANCHOR_LEASE_SECONDS)
+
+            receipt = await asyncio.to_thread(blockchain.wait_for_receipt, tx_hash, ANCHOR_RECEIPT_TIMEOUT)
+            if receipt.get("status") == 1:
+                await self._finish(job, ANCHOR_CONFIRMED, tx_hash, receipt.get("blockNumber"))
+                return
+            # Reverted: the contract rejects hashes that are already stored
+            if await asyncio.to_thread(blockchain.is_hash_stored, file_hash):
+                await self._finish(job, ANCHOR_CONFIRMED, None)
+                return
+            raise Exception(f"Transaction {tx_hash} reverted")
+
+        except asyncio.CancelledError:
+            # Shutdown: the lease expires and another worker resumes the job
+            raise
+        except TimeExhausted:
+            # Not mined yet; resubmitting is safe because a duplicate reverts
+            error = f"No receipt for {tx_hash} after {ANCHOR_RECEIPT_TIMEOUT}s"
+            await self._retry(job, error, submitted)
+        except Exception as e:
+            await self._retry(job, str(e), submitted)
+
+    async def _retry(self, job: Dict, error: str, submitted: bool):
+        attempts = job.get("attempts", 0) + 1
+        if attempts >= ANCHOR_MAX_ATTEMPTS:
+            await self._finish(job, ANCHOR_FAILED, job.get("tx_hash"), error=error)
+            return
+        delay = min(10 * 2 ** attempts, 600)
+        logger.warning(f"Anchor job for {job['file_hash']} will retry in {delay}s: {error}")
+        # Submissions already counted the attempt
+        await self.repository.schedule_retry(job["_id"], error, delay, count_attempt=not submitted)
+
+_anchor_worker = None
+
+def get_anchor_worker() -> AnchorWorker:
+    """Get the shared AnchorWorker, constructing it on first use."""
+    global _anchor_worker
+    if _anchor_worker is None:
+        _anchor_worker = AnchorWorker()
+    return _anchor_worker
+
+async def enqueue_anchor(cid: str, file_hash: str, requested_by: Optional[str] = None) -> Dict:
+    """Queue a file for anchoring and wake the local worker"""
+    job = await AnchorJobRepository().enqueue(cid, file_hash, requested_by)
+    if _anchor_worker is not None:
+        _anchor_worker.notify()
+    return job
@@ -0,0 +1,458 @@
+import os
+import uuid
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional, Tuple
+from services.ipfs import get_ipfs_service, GatewayStream, DOWNLOAD_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Set to "false" to always proxy downloads from the IPFS gateway
+BLOB_CACHE_ENABLED = os.getenv("BLOB_CACHE_ENABLED", "true").lower() != "false"
+# Where cached file contents are kept, one file per CID
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR", os.path.join(tempfile.gettempdir(), "xinete-blobs"))
+# Total bytes kept on disk; least recently used files are removed beyond it
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Larger files are not cached and are always proxied
+BLOB_CACHE_MAX_FILE_BYTES = int(os.getenv("BLOB_CACHE_MAX_FILE_BYTES", str(32 * 1024 * 1024)))
+
+class CachedBlob:
+    """
+    A file's content on local disk, opened when it was looked up
+
+    While the blob is open the cache defers removing its file, so it can be
+    sent by path (FileResponse). close() once done; it may be called from a
+    worker thread, and only the first call counts.
+    """
+
+    def __init__(self, cache: "BlobCache", cid: str, path: str, size: int, file: BinaryIO):
+        self.cache = cache
+        self.cid = cid
+        self.path = path
+        self.size = size
+        self.file = file
+        self.stat = os.fstat(file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            self.cache._release(self.cid)
+
+class _Fill:
+    """
+    A CID being fetched from IPFS to disk. Every response for the CID reads
+    the growing temporary file (follows it) rather than the gateway.
+    """
+
+    def __init__(self, cid: str):
+        self.cid = cid
+        # Set once the gateway has answered, with reader or bypass set
+        self.opened = asyncio.Event()
+        self.content_length: Optional[int] = None
+        self.reader: Optional[BinaryIO] = None
+        # Not cached: the gateway response, for the first request to take
+        self.bypass = False
+        self.handoff: Optional[GatewayStream] = None
+        self.size = 0  # bytes written so far
+        self.finished = False  # all bytes written
+        self.error: Optional[BaseException] = None
+        self.done = False  # the fill task has ended
+        self.followers = 0
+        self._changed = asyncio.Event()
+
+    def changed(self) -> asyncio.Event:
+        """Set on the next write or when the fill ends"""
+        return self._changed
+
+    def notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+class BlobCache:
+    """
+    Size-bounded on-disk LRU cache of file contents, keyed by CID.
+
+    The content behind a CID never changes, so entries are never
+    invalidated, only evicted. A miss never waits for the whole file: one
+    background fill per CID fetches it from IPFS to a temporary file, and
+    every full download of the CID meanwhile streams that file as it
+    grows, so the gateway is read once however many clients ask. A ranged
+    download starts the fill without following it (prefetch()). The file
+    is renamed into place once complete, so hits never see a partial copy.
+    Files of unknown size or over max_file_bytes are not cached and each
+    download proxies its own gateway response.
+
+    A file evicted while a response still has it open is removed when the
+    last one closes it. Each worker keeps its own index, rebuilt from the
+    directory on first use; workers sharing BLOB_CACHE_DIR may together
+    exceed max_bytes, and only defer removals for their own readers.
+    """
+
+    def __init__(self, directory: str = BLOB_CACHE_DIR, max_bytes: int = BLOB_CACHE_MAX_BYTES,
+                 max_file_bytes: int = BLOB_CACHE_MAX_FILE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries = OrderedDict()  # cid -> size, least recently used first
+        self._total_bytes = 0
+        self._fills: Dict[str, _Fill] = {}  # CIDs being written to disk
+        self._tasks = set()
+        # Open blobs per CID, and evicted CIDs whose file waits for them.
+        # Guarded by a lock since blobs may be closed from worker threads.
+        self._readers: Dict[str, int] = {}
+        self._doomed = set()
+        self._readers_lock = threading.Lock()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fills = 0
+        self.fill_errors = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def _path(self, cid: str) -> str:
+        return os.path.join(self.directory, cid)
+
+    async def _load(self):
+        """Index the files left by earlier processes, oldest use first"""
+        def scan():
+            os.makedirs(self.directory, exist_ok=True)
+            found = []
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(".tmp"):
+                    # A fill that never finished
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                found.append((max(stat.st_atime, stat.st_mtime), entry.name, stat.st_size))
+            return sorted(found)
+
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for _, cid, size in await asyncio.to_thread(scan):
+                self._entries[cid] = size
+                self._total_bytes += size
+            self._loaded = True
+            await self._evict()
+
+    async def get(self, cid: str) -> Optional[CachedBlob]:
+        """
+        The cached content of a CID, opened for reading
+
+        Returns:
+            Optional[CachedBlob]: The local copy, or None on a miss, in which
+            case the caller streams it through fetch() or prefetch()es it
+        """
+        if not self._loaded:
+            await self._load()
+        if not cid.isalnum():
+            # Not a CID; never used as a file name
+            return None
+
+        size = self._entries.get(cid)
+        if size is None:
+            return None
+        # Counted before opening, so an eviction meanwhile defers the removal
+        self._acquire(cid)
+        try:
+            spool = await asyncio.to_thread(open, self._path(cid), "rb")
+        except FileNotFoundError:
+            self._release(cid)
+            # Removed behind our back (e.g. a temp directory cleaner)
+            if self._entries.get(cid) == size:
+                del self._entries[cid]
+                self._total_bytes -= size
+            return None
+        except BaseException:
+            self._release(cid)
+            raise
+        if cid in self._entries:
+            self._entries.move_to_end(cid)
+        self.hits += 1
+        return CachedBlob(self, cid, self._path(cid), size, spool)
+
+    def _acquire(self, cid: str):
+        with self._readers_lock:
+            self._readers[cid] = self._readers.get(cid, 0) + 1
+
+    def _release(self, cid: str):
+        """Drop a reader, removing the file if it was evicted meanwhile"""
+        with self._readers_lock:
+            remaining = self._readers.pop(cid) - 1
+            if remaining:
+                self._readers[cid] = remaining
+                return
+            if cid not in self._doomed:
+                return
+            self._doomed.discard(cid)
+            try:
+                os.remove(self._path(cid))
+            except FileNotFoundError:
+                pass
+
+    async def fetch(self, cid: str) -> Tuple[Optional[int], AsyncIterator[bytes]]:
+        """
+        A missed CID's content, following its fill, which is started if
+        none is underway. Waits only for the gateway's response headers.
+
+        Returns:
+            Tuple[Optional[int], AsyncIterator[bytes]]: The content length,
+            if known, and the body
+
+        Raises:
+            Exception: If the gateway could not be reached
+        """
+        if not cid.isalnum():
+            self.bypassed += 1
+            upstream = await get_ipfs_service().open_stream(cid)
+            return upstream.content_length, upstream.iter_chunks()
+
+        fill = self._fills.get(cid)
+        if fill is None:
+            fill = self._start(cid)
+        else:
+            self.coalesced += 1
+        fill.followers += 1
+        following = False
+        try:
+            await fill.opened.wait()
+            if fill.bypass:
+                self.bypassed += 1
+                upstream, fill.handoff = fill.handoff, None
+                if upstream is None:
+                    upstream = await get_ipfs_service().open_stream(cid)
+                return upstream.content_length, upstream.iter_chunks()
+            if fill.reader is None:
+                raise fill.error or RuntimeError(f"Could not fetch {cid}")
+            following = True
+            return fill.content_length, self._follow(fill)
+        finally:
+            if not following:
+                self._leave(fill)
+
+    def prefetch(self, cid: str):
+        """Fetch a missed CID to disk in the background, unless already underway"""
+        if cid.isalnum() and cid not in self._fills:
+            self._start(cid)
+
+    def _start(self, cid: str) -> _Fill:
+        self.misses += 1
+        fill = _Fill(cid)
+        self._fills[cid] = fill
+        task = asyncio.create_task(self._fill(fill))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return fill
+
+    def _leave(self, fill: _Fill):
+        """A request stops following a fill; the last one out closes it"""
+        fill.followers -= 1
+        if fill.followers == 0 and fill.done:
+            self._close_fill(fill)
+
+    def _close_fill(self, fill: _Fill):
+        if fill.reader is not None:
+            fill.reader.close()
+        if fill.handoff is not None:
+            fill.handoff.close()
+            fill.handoff = None
+
+    async def _follow(self, fill: _Fill) -> AsyncIterator[bytes]:
+        """The content of a fill, read from its temporary file as it is written"""
+        try:
+            descriptor = fill.reader.fileno()
+            position = 0
+            while True:
+                changed = fill.changed()
+                if position < fill.size:
+                    chunk = await asyncio.to_thread(
+                        os.pread, descriptor, min(DOWNLOAD_CHUNK_SIZE, fill.size - position), position
+                    )
+                    if not chunk:
+                        raise IOError(f"Temporary copy of {fill.cid} is shorter than written")
+                    position += len(chunk)
+                    yield chunk
+                elif fill.finished:
+                    return
+                elif fill.error is not None:
+                    raise fill.error
+                else:
+                    await changed.wait()
+        finally:
+            self._leave(fill)
+
+    async def _fill(self, fill: _Fill):
+        """Fetch a CID from IPFS to a temporary file, then into the cache"""
+        cid = fill.cid
+        temporary = None
+        writer = None
+        committed = False
+        try:
+            try:
+                if not self._loaded:
+                    await self._load()
+                upstream = await get_ipfs_service().open_stream(cid)
+            except Exception as e:
+                fill.error = e
+                self.fill_errors += 1
+                logger.warning(f"Error fetching {cid} to cache: {str(e)}")
+                return
+
+            length = upstream.content_length
+            if length is None or length > self.max_file_bytes:
+                fill.bypass = True
+                if fill.followers:
+                    fill.handoff = upstream
+                else:
+                    upstream.close()
+                    self.bypassed += 1
+                return
+
+            try:
+                fill.content_length = length
+                temporary = f"{self._path(cid)}.{uuid.uuid4().hex}.tmp"
+                writer, fill.reader = await asyncio.to_thread(self._open_spool, temporary)
+                fill.opened.set()
+                async for chunk in upstream.iter_chunks():
+                    if fill.size + len(chunk) > length:
+                        raise IOError(f"Gateway sent more than the announced {length} bytes")
+                    await asyncio.to_thread(self._write, writer, chunk)
+                    fill.size += len(chunk)
+                    fill.notify()
+                if fill.size != length:
+                    raise IOError(f"Gateway sent {fill.size} of the announced {length} bytes")
+                writer.close()
+                writer = None
+                fill.finished = True
+                fill.notify()
+                await self._commit(cid, temporary, length)
+                committed = True
+            except Exception as e:
+                fill.error = e
+                self.fill_errors += 1
+                logger.warning(f"Error caching {cid}: {str(e)}")
+            finally:
+                upstream.close()
+        finally:
+            # Synchronous, so it also runs while a cancelled task unwinds
+            self._fills.pop(cid, None)
+            if not fill.finished and fill.error is None and not fill.bypass:
+                fill.error = RuntimeError(f"Fetching {cid} was interrupted")
+            fill.done = True
+            fill.opened.set()
+            fill.notify()
+            if writer is not None:
+                writer.close()
+            if temporary is not None and not committed:
+                # Followers keep reading through their open descriptor
+                self._discard(temporary)
+            if fill.followers == 0:
+                self._close_fill(fill)
+
+    def _open_spool(self, temporary: str) -> Tuple[BinaryIO, BinaryIO]:
+        os.makedirs(self.directory, exist_ok=True)
+        writer = open(temporary, "wb")
+        return writer, open(temporary, "rb")
+
+    @staticmethod
+    def _write(writer: BinaryIO, chunk: bytes):
+        # Flushed, so followers' positional reads see it
+        writer.write(chunk)
+        writer.flush()
+
+    def _discard(self, temporary: str):
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+
+    async def _commit(self, cid: str, temporary: str, size: int):
+        """Rename a complete copy into place and account for it"""
+        try:
+            await asyncio.to_thread(os.replace, temporary, self._path(cid))
+        except BaseException:
+            self._discard(temporary)
+            raise
+        with self._readers_lock:
+            # The same content again, so readers of an evicted copy need not remove it
+            self._doomed.discard(cid)
+        self.fills += 1
+        previous = self._entries.pop(cid, None)
+        if previous is not None:
+            self._total_bytes -= previous
+        self._entries[cid] = size
+        self._total_bytes += size
+        await self._evict(keep=cid)
+
+    async def _evict(self, keep: Optional[str] = None):
+        """
+        Remove least recently used files until the cache fits max_bytes.
+        The file of a blob still open is removed when it is closed.
+        """
+        victims = []
+        for cid in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if cid == keep:
+                continue
+            self._total_bytes -= self._entries.pop(cid)
+            self.evictions += 1
+            with self._readers_lock:
+                if self._readers.get(cid):
+                    self._doomed.add(cid)
+                    continue
+            victims.append(cid)
+        for cid in victims:
+            try:
+                await asyncio.to_thread(os.remove, self._path(cid))
+            except FileNotFoundError:
+                pass
+
+    async def iter_range(self, blob: CachedBlob, start: int, end: int) -> AsyncIterator[bytes]:
+        """The bytes start..end (inclusive) of a cached file"""
+        # Positional reads, so the ranges of a multipart response share one file
+        descriptor = blob.file.fileno()
+        position = start
+        while position <= end:
+            chunk = await asyncio.to_thread(os.pread, descriptor, min(DOWNLOAD_CHUNK_SIZE, end - position + 1), position)
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_file_bytes": self.max_file_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+            "fills": self.fills,
+            "fill_errors": self.fill_errors,
+            "bypassed": self.bypassed,
+            "evictions": self.evictions,
+            "in_flight": len(self._fills),
+            "open_readers": sum(self._readers.values()),
+            "deferred_removals": len(self._doomed),
+        }
+
+_blob_cache = None
+
+def get_blob_cache() -> BlobCache:
+    """Get the shared BlobCache, constructing it on first use."""
+    global _blob_cache
+    if _blob_cache is None:
+        _blob_cache = BlobCache()
+    return _blob_cache
@@ -1,10 +1,17 @@
 from web3 import Web3
+from web3.exceptions import ContractLogicError
 from eth_account import Account
-from typing import List
+from typing import Any, Dict, List
+import asyncio
 import os
 import logging
+import threading
 from dotenv import load_dotenv
 
+# Times a transaction is re-sent with a fresh nonce after another sender
+# using the same account took the one it was built with
+NONCE_RETRIES = int(os.getenv("NONCE_RETRIES", "3"))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -64,6 +71,25 @@ class BlockchainService:
                 "outputs": [],
                 "stateMutability": "nonpayable",
                 "type": "function"
+            },
+            {
+                "anonymous": False,
+                "inputs": [
+                    {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+                    {"indexed": False, "internalType": "string", "name": "cid", "type": "string"},
+                    {"indexed": False, "internalType": "string", "name": "hash", "type": "string"}
+                ],
+                "name": "CIDStored",
+                "type": "event"
+            },
+            {
+                "anonymous": False,
+                "inputs": [
+                    {"indexed": True, "internalType": "address", "name": "user", "type": "address"},
+                    {"indexed": False, "internalType": "string", "name": "cid", "type": "string"}
+                ],
+                "name": "CIDRemoved",
+                "type": "event"
             }
         ]
         
@@ -76,25 +102,106 @@ class BlockchainService:
         # Load account
         private_key = os.getenv("PRIVATE_KEY")
         self.account = Account.from_key(private_key)
-    
+        # Every transaction this process signs is sent under this lock, so
+        # each reads the nonce after the previous one is in the pool
+        self._submit_lock = threading.Lock()
+
+    def _submit(self, function) -> str:
+        """
+        Sign and send a contract transaction from the platform account.
+        Blocking; call from a worker thread.
+
+        Returns:
+            str: The transaction hash
+        """
+        with self._submit_lock:
+            for attempt in range(NONCE_RETRIES + 1):
+                # Count pending transactions too, so back-to-back submissions get distinct nonces
+                nonce = self.w3.eth.get_transaction_count(self.account.address, "pending")
+                tx = function.build_transaction({
+                    'from': self.account.address,
+                    'nonce': nonce,
+                    'gas': 2000000,
+                    'gasPrice': self.w3.eth.gas_price
+                })
+                signed_tx = self.account.sign_transaction(tx)
+                try:
+                    return self.w3.eth.send_raw_transaction(signed_tx.raw_transaction).hex()
+                except Exception as e:
+                    # Another process signing with the same account used the nonce
+                    message = str(e).lower()
+                    if attempt == NONCE_RETRIES or not ("nonce" in message or "underpriced" in message):
+                        raise
+                    logging.warning(f"Nonce {nonce} was taken, resending: {str(e)}")
+
+    def submit_store_cid(self, cid: str, file_hash: str) -> str:
+        """
+        Sign and send a storeCID transaction without waiting for it to be mined.
+        Blocking; call from a worker thread.
+
+        Returns:
+            str: The transaction hash
+        """
+        return self._submit(self.contract.functions.storeCID(cid, file_hash))
+
+    def submit_remove_cid(self, cid: str) -> str:
+        """
+        Sign and send a removeCID transaction without waiting for it to be mined.
+        Blocking; call from a worker thread.
+
+        Returns:
+            str: The transaction hash
+        """
+        return self._submit(self.contract.functions.removeCID(self.account.address, cid))
+
+    def wait_for_receipt(self, tx_hash: str, timeout: float = 120) -> Dict[str, Any]:
+        """
+        Wait for a transaction to be mined. Blocking; call from a worker thread.
+
+        Raises:
+            web3.exceptions.TimeExhausted: If it is not mined within `timeout` seconds
+        """
+        return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+
+    def is_hash_stored(self, file_hash: str) -> bool:
+        """Whether a file hash is already anchored. Blocking; call from a worker thread."""
+        try:
+            return bool(self.contract.functions.getCIDByHash(file_hash).call())
+        except ContractLogicError:
+            # getCIDByHash reverts for unknown hashes
+            return False
+
+    def get_block_number(self) -> int:
+        """The latest block number. Blocking; call from a worker thread."""
+        return self.w3.eth.block_number
+
+    def get_ownership_events(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        """
+        CIDStored and CIDRemoved events in a block range, oldest first.
+        Blocking; call from a worker thread.
+
+        Returns:
+            List[Dict]: {"event", "user", "cid", "block_number"} per event
+        """
+        events = []
+        for event in (self.contract.events.CIDStored, self.contract.events.CIDRemoved):
+            for log in event.get_logs(from_block=from_block, to_block=to_block):
+                events.append({
+                    "event": log["event"],
+                    "user": log["args"]["user"],
+                    "cid": log["args"]["cid"],
+                    "block_number": log["blockNumber"],
+                    "log_index": log["logIndex"],
+                })
+        events.sort(key=lambda event: (event["block_number"], event["log_index"]))
+        return events
+
     async def store_cid(self, user: str, cid: str, file_hash: str) -> str:
         """Store a CID with its hash in the blockchain"""
         try:
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(self.account.address)
-            tx = self.contract.functions.storeCID(cid, file_hash).build_transaction({
-                'from': self.account.address,
-                'nonce': nonce,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price
-            })
-            
-            # Sign and send transaction
-            signed_tx = self.account.sign_transaction(tx)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            
-            # Wait for transaction receipt
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            # web3 calls block, so they run off the event loop
+            tx_hash = await asyncio.to_thread(self.submit_store_cid, cid, file_hash)
+            receipt = await asyncio.to_thread(self.wait_for_receipt, tx_hash)
             return receipt['transactionHash'].hex()
         
         except Exception as e:
@@ -114,7 +221,7 @@ class BlockchainService:
                 raise Exception("Invalid Ethereum address format")
             # Convert the address to checksum format
             checksum_address = self.w3.to_checksum_address(user.lower())
-            return self.contract.functions.verifyOwnership(checksum_address, cid).call()
+            return await asyncio.to_thread(self.contract.functions.verifyOwnership(checksum_address, cid).call)
         except ValueError as e:
             raise Exception(f"Invalid wallet address: {str(e)}")
         except Exception as e:
@@ -123,7 +230,8 @@ class BlockchainService:
     async def get_cid_by_hash(self, file_hash: str) -> str:
         """Get CID by its hash from the blockchain"""
         try:
-            cid = self.contract.functions.getCIDByHash(file_hash).call()
+            # eth_call blocks, so it runs off the event loop
+            cid = await asyncio.to_thread(self.contract.functions.getCIDByHash(file_hash).call)
             if not cid:
                 logging.error(f"CID not found in blockchain for hash '{file_hash}'")
                 raise Exception("File exists in metadata but not found in blockchain. The file may have been removed from the blockchain.")
@@ -138,21 +246,9 @@ class BlockchainService:
     async def remove_cid(self, user: str, cid: str) -> str:
         """Remove a CID from the blockchain using file hash verification"""
         try:
-            # Build transaction
-            nonce = self.w3.eth.get_transaction_count(self.account.address)
-            tx = self.contract.functions.removeCID(self.account.address, cid).build_transaction({
-                'from': self.account.address,
-                'nonce': nonce,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price
-            })
-            
-            # Sign and send transaction
-            signed_tx = self.account.sign_transaction(tx)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_tx.raw_transaction)
-            
-            # Wait for transaction receipt
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
+            # web3 calls block, so they run off the event loop
+            tx_hash = await asyncio.to_thread(self.submit_remove_cid, cid)
+            receipt = await asyncio.to_thread(self.wait_for_receipt, tx_hash)
             return receipt['transactionHash'].hex()
         
         except Exception as e:
@@ -272,4 +368,13 @@ class BlockchainService:
             logging.error(f"Error recording event in blockchain: {str(e)}")
             # Since blockchain recording is mandatory, we re-raise the exception
             # instead of returning a mock hash
-            raise Exception(f"Failed to record event in blockchain: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to record event in blockchain: {str(e)}")
+
+_blockchain_service = None
+
+def get_blockchain_service() -> BlockchainService:
+    """Get the shared BlockchainService, constructing it on first use."""
+    global _blockchain_service
+    if _blockchain_service is None:
+        _blockchain_service = BlockchainService()
+    return _blockchain_service
@@ -0,0 +1,105 @@
+import os
+import logging
+from typing import Any, Dict, List, Tuple
+from repositories import CidIndexRepository
+from services.blockchain import get_blockchain_service
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Hash -> CID entries held by each worker. The expiry bounds how long a
+# worker keeps resolving a file another worker removed from the chain.
+CID_CACHE_SIZE = int(os.getenv("CID_CACHE_SIZE", "50000"))
+CID_CACHE_TTL = float(os.getenv("CID_CACHE_TTL", "300"))
+
+# Query value that makes a lookup read the contract
+VERIFY_STRICT = "strict"
+
+SOURCE_UPLOAD = "upload"
+SOURCE_CHAIN = "chain"
+
+class CidResolver:
+    """
+    Resolves file hashes to CIDs without a contract call per request.
+
+    Lookups go to an in-process LRU, then to the cid_index collection, and
+    only on a miss in both to the contract, whose answer fills both tiers.
+    A hash stays mapped to the same CID once stored, so entries are only
+    removed when the file is removed from the chain. A strict lookup always
+    reads the contract and corrects the index from its answer. Entries
+    written at upload time are not yet known to be anchored; a lookup that
+    needs the anchor confirmed reads the contract once to upgrade them.
+    """
+
+    def __init__(self):
+        self.repository = CidIndexRepository()
+        self.cache = TTLCache("cid_index", max_size=CID_CACHE_SIZE, default_ttl=CID_CACHE_TTL)
+        self.index_hits = 0
+        self.chain_reads = 0
+
+    async def resolve(self, file_hash: str, strict: bool = False, anchored: bool = False) -> str:
+        """
+        Get the CID of a file hash
+
+        Args:
+            file_hash: The file hash
+            strict: Always read the contract
+            anchored: Only answer from entries the contract confirmed
+
+        Raises:
+            Exception: As BlockchainService.get_cid_by_hash, if the hash is
+            not on the chain and not indexed
+        """
+        if not strict:
+            entry = self.cache.get(file_hash)
+            if entry is None:
+                entry = await self.repository.get(file_hash)
+                if entry:
+                    self.index_hits += 1
+                    self.cache.set(file_hash, entry)
+            if entry and (not anchored or entry.get("source") == SOURCE_CHAIN):
+                return entry["cid"]
+
+        self.chain_reads += 1
+        try:
+            cid = await get_blockchain_service().get_cid_by_hash(file_hash)
+        except Exception as e:
+            if strict and "not found in blockchain" in str(e):
+                # The chain no longer knows the hash; neither should the index
+                await self.forget(file_hash)
+            raise
+        self.cache.set(file_hash, {"cid": cid, "source": SOURCE_CHAIN})
+        await self._record([(file_hash, cid)], SOURCE_CHAIN, overwrite=True)
+        return cid
+
+    async def record(self, file_hash: str, cid: str):
+        """Index the CID of a file that was just uploaded"""
+        await self.record_many([(file_hash, cid)])
+
+    async def record_many(self, pairs: List[Tuple[str, str]]):
+        # Content uploaded before may already be confirmed; keep that entry
+        await self._record(pairs, SOURCE_UPLOAD, overwrite=False)
+
+    async def _record(self, pairs: List[Tuple[str, str]], source: str, overwrite: bool):
+        try:
+            await self.repository.record_many(pairs, source, overwrite)
+        except Exception as e:
+            # The index is a cache; the chain stays the source of truth
+            logger.warning(f"Error indexing CIDs of {len(pairs)} files: {str(e)}")
+
+    async def forget(self, file_hash: str):
+        """Drop a hash removed from the chain from both tiers"""
+        self.cache.delete(file_hash)
+        await self.repository.remove(file_hash)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cache": self.cache.stats(), "index_hits": self.index_hits, "chain_reads": self.chain_reads}
+
+_cid_resolver = None
+
+def get_cid_resolver() -> CidResolver:
+    """Get the shared CidResolver, constructing it on first use."""
+    global _cid_resolver
+    if _cid_resolver is None:
+        _cid_resolver = CidResolver()
+    return _cid_resolver
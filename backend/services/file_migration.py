@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from models.file_metadata import FileMetadata
+from repositories import UserRepository, LoginIdentityRepository
+from services.metadata import get_metadata_service
+
+logger = logging.getLogger(__name__)
+
+# Users migrated per round trip
+MIGRATION_BATCH_SIZE = 100
+
+def _is_enterprise_user(user: Dict[str, Any]) -> bool:
+    return user.get("role") == "enterprise" or user.get("user_type") == "enterprise" or bool(user.get("enterprises"))
+
+async def _enterprise_of(user: Dict[str, Any], identity_repo: LoginIdentityRepository) -> Optional[str]:
+    """
+    The enterprise of an enterprise user without an enterprise_id: the one
+    enterprise their login identities name, or None if there is not exactly one
+    """
+    enterprise_ids = await identity_repo.enterprises_of(user["username"])
+    return enterprise_ids[0] if len(enterprise_ids) == 1 else None
+
+def _metadata_for(user: Dict[str, Any], entry: Dict[str, Any], enterprise_id: Optional[str] = None) -> FileMetadata:
+    """The file_metadata row for one embedded files entry"""
+    owner = {"username": user["username"]}
+    if enterprise_id:
+        owner["enterprise_id"] = enterprise_id
+    fields = {key: value for key, value in entry.items() if key in FileMetadata.__fields__ and key != "user"}
+    return FileMetadata(user=owner, **fields)
+
+async def drain_embedded_files(batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """
+    Move the legacy users.files arrays into file_metadata
+
+    Entries that already have a row keep the row, which is newer. An array
+    is only removed if it did not change while it was being copied, so the
+    migration is safe to run from several workers at once and to resume.
+    The files of an enterprise user whose enterprise cannot be resolved are
+    left in place and logged, since a row without it would not show up in
+    the enterprise's listing.
+
+    Returns:
+        int: The number of users migrated
+    """
+    user_repo = UserRepository()
+    identity_repo = LoginIdentityRepository()
+    metadata_service = get_metadata_service()
+    migrated = 0
+    skipped = set()
+
+    while True:
+        users = [user for user in await user_repo.find_with_embedded_files(batch_size + len(skipped)) if user["_id"] not in skipped]
+        if not users:
+            return migrated
+        for user in users:
+            if not user.get("username"):
+                skipped.add(user["_id"])
+                continue
+            enterprise_id = user.get("enterprise_id")
+            if not enterprise_id and _is_enterprise_user(user):
+                enterprise_id = await _enterprise_of(user, identity_repo)
+                if not enterprise_id:
+                    logger.warning(f"Cannot tell which enterprise the {len(user['files'])} embedded files of {user['username']} belong to; left in place")
+                    skipped.add(user["_id"])
+                    continue
+            metadatas = []
+            for entry in user["files"]:
+                try:
+                    metadatas.append(_metadata_for(user, entry, enterprise_id))
+                except Exception as e:
+                    logger.warning(f"Unreadable file entry of {user['username']}: {str(e)}")
+            if len(metadatas) != len(user["files"]):
+                # Keep the array so nothing is lost; it needs a manual look
+                skipped.add(user["_id"])
+                continue
+            await metadata_service.store_missing(metadatas)
+            if await user_repo.clear_embedded_files(user["_id"], len(user["files"])):
+                migrated += 1
+            else:
+                # Changed while it was copied; picked up again on the next run
+                skipped.add(user["_id"])
+        await asyncio.sleep(0)
+
+async def run_file_migration():
+    """Background startup task: drain embedded file lists, logging the outcome"""
+    try:
+        migrated = await drain_embedded_files()
+        if migrated:
+            logger.info(f"Moved the embedded file lists of {migrated} users to file_metadata")
+    except Exception as e:
+        logger.error(f"Error migrating embedded file lists: {str(e)}")
@@ -1,8 +1,55 @@
 import os
+import json
+import hashlib
+import aiohttp
 import requests
+from dataclasses import dataclass
+from aiohttp.payload import AsyncIterablePayload
 from fastapi import UploadFile
 from dotenv import load_dotenv
-from typing import Dict, Any
+from typing import Any, AsyncIterator, Dict, Optional
+
+# Bytes read from the upload and sent to IPFS at a time
+UPLOAD_CHUNK_SIZE = int(os.getenv("IPFS_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Seconds without data from the IPFS API before a request fails
+IPFS_READ_TIMEOUT = float(os.getenv("IPFS_READ_TIMEOUT", "300"))
+# Bytes read from the gateway and sent to the client at a time during downloads
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("IPFS_DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+
+@dataclass
+class UploadResult:
+    """Outcome of streaming a file to IPFS"""
+    cid: str
+    size: int
+    content_digest: str  # SHA-256 of the file content, hex encoded
+
+class GatewayStream:
+    """
+    An open response from the IPFS gateway, read chunk by chunk
+
+    The connection is released when the body has been read, when the
+    consumer stops iterating (e.g. the client disconnected), or on close().
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse):
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    @property
+    def content_length(self) -> Optional[int]:
+        length = self.headers.get("Content-Length")
+        return int(length) if length and length.isdigit() else None
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self.response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self.response.release()
 
 class IPFSService:
     def __init__(self):
@@ -13,35 +60,142 @@ class IPFSService:
         self.spawn_port = os.getenv("IPFS_SPAWN_PORT", "4001")
         self.api_url = f"http://{self.api_host}:{self.api_port}/api/v0"
         self.gateway_url = f"http://{self.api_host}:{self.gateway_port}/ipfs"
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session for the IPFS API, created inside the event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=IPFS_READ_TIMEOUT),
+                # Bounds how much of a download is buffered ahead of the client
+                read_bufsize=DOWNLOAD_CHUNK_SIZE
+            )
+        return self._session
+
+    async def close(self):
+        """Close the shared HTTP session (application shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def add_stream(self, file: UploadFile, pin: bool = True) -> UploadResult:
+        """
+        Stream a file to the IPFS add API chunk by chunk
+
+        The upload is read once: each chunk is hashed, counted and sent on,
+        so memory use does not depend on the file size.
+
+        Args:
+            file: The upload
+            pin: Pin the content. Unpinned content is removed by the node's
+                garbage collection unless pin() is called for its CID.
+
+        Returns:
+            UploadResult: The CID, size in bytes and SHA-256 content digest
+        """
+        digest = hashlib.sha256()
+        size = 0
+
+        async def chunks():
+            nonlocal size
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
 
-    async def upload_file(self, file: UploadFile) -> str:
-        """Upload a file to self-hosted IPFS and return the CID"""
         try:
-            files = {'file': (file.filename, await file.read())}
-            response = requests.post(f"{self.api_url}/add", files=files)
-            if response.status_code != 200:
-                raise Exception(f"Failed to upload to IPFS: {response.text}")
-            cid = response.json()["Hash"] if response.headers.get('Content-Type', '').startswith('application/json') else response.text.split(',')[1].split(':')[1].replace('"', '').strip()
-            return cid
+            await file.seek(0)
+            with aiohttp.MultipartWriter("form-data") as writer:
+                part = writer.append_payload(AsyncIterablePayload(chunks(), content_type="application/octet-stream"))
+                part.set_content_disposition("form-data", name="file", filename=file.filename or "file")
+
+                params = {"pin": "true" if pin else "false"}
+                async with self._get_session().post(f"{self.api_url}/add", params=params, data=writer) as response:
+                    body = await response.text()
+                    if response.status != 200:
+                        raise Exception(f"Failed to upload to IPFS: {body}")
+
+            # The add API answers with one JSON object per line; the last one
+            # describes the file
+            cid = None
+            for line in body.splitlines():
+                if line.strip():
+                    cid = json.loads(line).get("Hash", cid)
+            if not cid:
+                raise Exception(f"No CID in IPFS response: {body}")
+            return UploadResult(cid=cid, size=size, content_digest=digest.hexdigest())
         except Exception as e:
             raise Exception(f"Error uploading file to IPFS: {str(e)}")
         finally:
             await file.seek(0)
 
+    async def pin(self, cid: str):
+        """Pin content already added to the node, e.g. by add_stream(pin=False)"""
+        try:
+            async with self._get_session().post(f"{self.api_url}/pin/add", params={"arg": cid}) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to pin file in IPFS: {await response.text()}")
+        except Exception as e:
+            raise Exception(f"Error pinning file: {str(e)}")
+
+    async def add_bytes(self, data: bytes, filename: str, content_type: str = "application/octet-stream") -> str:
+        """Add a small in-memory document to IPFS and return its CID"""
+        try:
+            form = aiohttp.FormData()
+            form.add_field("file", data, filename=filename, content_type=content_type)
+            async with self._get_session().post(f"{self.api_url}/add", data=form) as response:
+                body = await response.text()
+                if response.status != 200:
+                    raise Exception(f"Failed to upload to IPFS: {body}")
+            return json.loads(body.splitlines()[-1])["Hash"]
+        except Exception as e:
+            raise Exception(f"Error uploading document to IPFS: {str(e)}")
+
+    async def upload_file(self, file: UploadFile) -> str:
+        """Upload a file to self-hosted IPFS and return the CID"""
+        return (await self.add_stream(file)).cid
+
     async def get_file_metadata(self, cid: str) -> Dict[str, Any]:
         """Get metadata for a file from self-hosted IPFS (not supported natively)"""
         return {"cid": cid}
 
-    async def get_file(self, cid: str) -> bytes:
-        """Get file content from self-hosted IPFS"""
+    async def open_stream(self, cid: str, headers: Optional[Dict[str, str]] = None) -> GatewayStream:
+        """
+        Start fetching a file from the self-hosted IPFS gateway
+
+        Only the response headers have been read when this returns; the
+        body is read as the caller iterates GatewayStream.iter_chunks().
+        """
         try:
-            url = f"{self.gateway_url}/{cid}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                raise Exception(f"Failed to get file from IPFS: {response.text}")
-            return response.content
+            response = await self._get_session().get(f"{self.gateway_url}/{cid}", headers=headers)
         except Exception as e:
             raise Exception(f"Error getting file from IPFS: {str(e)}")
+        if response.status >= 400:
+            try:
+                body = await response.text()
+            finally:
+                response.release()
+            raise Exception(f"Failed to get file from IPFS: {body}")
+        return GatewayStream(response)
+
+    async def get_size(self, cid: str) -> Optional[int]:
+        """Size in bytes of a file from the gateway's response headers, without its body"""
+        try:
+            async with self._get_session().head(f"{self.gateway_url}/{cid}") as response:
+                if response.status >= 400:
+                    raise Exception(f"Failed to get file size from IPFS: HTTP {response.status}")
+                length = response.headers.get("Content-Length")
+                return int(length) if length and length.isdigit() else None
+        except Exception as e:
+            raise Exception(f"Error getting file size from IPFS: {str(e)}")
+
+    async def get_file(self, cid: str) -> bytes:
+        """Get file content from self-hosted IPFS (the whole file, in memory)"""
+        stream = await self.open_stream(cid)
+        return b"".join([chunk async for chunk in stream.iter_chunks()])
 
     async def unpin_file(self, cid: str) -> bool:
         """Remove a file from self-hosted IPFS"""
@@ -67,4 +221,18 @@ class IPFSService:
         Returns:
             str: The public gateway URL
         """
-        return f"https://ipfs.io/ipfs/{cid}"
\ No newline at end of file
+        return f"https://ipfs.io/ipfs/{cid}"
+
+_ipfs_service = None
+
+def get_ipfs_service() -> IPFSService:
+    """Get the shared IPFSService, constructing it on first use."""
+    global _ipfs_service
+    if _ipfs_service is None:
+        _ipfs_service = IPFSService()
+    return _ipfs_service
+
+async def close_ipfs_service():
+    """Release the shared service's HTTP session, if it was created."""
+    if _ipfs_service is not None:
+        await _ipfs_service.close()
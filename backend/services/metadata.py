@@ -1,27 +1,17 @@
 import os
 import logging
 from datetime import datetime
-from typing import List, Dict, Optional, Union, Any
+from typing import List, Dict, Optional, Union, Any, AsyncIterator, Tuple
 from models.file_metadata import FileMetadata
-from utils.mongodb import get_mongo_connection
+from repositories import FileMetadataRepository
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 class MetadataService:
     def __init__(self):
-        # Get MongoDB connection
-        try:
-            self.client, self.db = get_mongo_connection()
-            # Use a dedicated collection for file metadata
-            self.metadata_collection = self.db['file_metadata']
-            # Create indexes if needed
-            self.metadata_collection.create_index([("user_id", 1), ("file_hash", 1)], unique=True)
-            self.metadata_collection.create_index([("enterprise_id", 1)])
-            logger.info("MetadataService connected to MongoDB successfully")
-        except Exception as e:
-            logger.error(f"Error connecting to MongoDB in MetadataService: {str(e)}")
-            raise
+        # Use a dedicated collection for file metadata; no I/O until first use
+        self.repository = FileMetadataRepository()
     
     async def store_metadata(self, metadata: FileMetadata):
         """
@@ -33,6 +23,49 @@ class MetadataService:
         Returns:
             bool: True if successful, False otherwise
         """
+        query, metadata_dict = self._metadata_document(metadata)
+        
+        # Use upsert to either update existing record or create new one
+        try:
+            result = await self.repository.upsert(query, metadata_dict)
+            logger.info(f"Stored metadata for file {metadata.file_hash}: {'Created' if result.upserted_id else 'Updated'}")
+            return True
+        except Exception as e:
+            logger.error(f"Error storing metadata: {str(e)}")
+            return False
+    
+    async def store_many(self, metadatas: List[FileMetadata]) -> bool:
+        """
+        Store the metadata of several files in one bulk write
+        
+        Args:
+            metadatas: The file metadata to store
+            
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            await self.repository.upsert_many([self._metadata_document(metadata) for metadata in metadatas])
+            logger.info(f"Stored metadata for {len(metadatas)} files")
+            return True
+        except Exception as e:
+            logger.error(f"Error storing metadata: {str(e)}")
+            return False
+    
+    async def store_missing(self, metadatas: List[FileMetadata]):
+        """
+        Store the metadata of files that have no row yet, leaving existing
+        rows untouched (used when importing older records)
+        """
+        await self.repository.insert_missing([self._metadata_document(metadata) for metadata in metadatas])
+    
+    def _metadata_document(self, metadata: FileMetadata):
+        """
+        Build the upsert query and document for a file's metadata
+        
+        Returns:
+            Tuple[Dict, Dict]: The query identifying the row and its fields
+        """
         # Convert metadata to dictionary
         metadata_dict = metadata.dict()
         
@@ -52,19 +85,7 @@ class MetadataService:
             query["user_id"] = user_id
             metadata_dict["user_type"] = "individual"
             metadata_dict["user_id"] = user_id
-        
-        # Use upsert to either update existing record or create new one
-        try:
-            result = self.metadata_collection.update_one(
-                query,
-                {"$set": metadata_dict},
-                upsert=True
-            )
-            logger.info(f"Stored metadata for file {metadata.file_hash}: {'Created' if result.upserted_id else 'Updated'}")
-            return True
-        except Exception as e:
-            logger.error(f"Error storing metadata: {str(e)}")
-            return False
+        return query, metadata_dict
     
     async def get_user_files(self, user: Union[str, Dict[str, Any]]) -> List[Dict]:
         """
@@ -77,30 +98,11 @@ class MetadataService:
             List[Dict]: List of file metadata
         """
         try:
-            # Create query based on user type
-            query = {}
-            if isinstance(user, dict):
-                # Enterprise user
-                if "enterprise_id" in user:
-                    query["enterprise_id"] = user["enterprise_id"]
-                if "username" in user:
-                    query["user_id"] = user["username"].lower()
-            else:
-                # B2C/Individual user
-                query["user_id"] = user.lower()
-                query["user_type"] = "individual"
-                
+            query = self._user_query(user)
             logger.debug(f"Querying files with filter: {query}")
             
             # Find all files for this user
-            cursor = self.metadata_collection.find(query)
-            
-            # Convert cursor to list and remove MongoDB _id
-            files = []
-            for file in cursor:
-                if '_id' in file:
-                    del file['_id']
-                files.append(file)
+            files = await self.repository.find_files(query)
                 
             logger.info(f"Found {len(files)} files for user {user}")
             return files
@@ -108,6 +110,104 @@ class MetadataService:
             logger.error(f"Error getting user files: {str(e)}")
             return []
     
+    async def list_user_files(
+        self,
+        user: Union[str, Dict[str, Any]],
+        sort: str = "upload_date",
+        direction: int = -1,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Get one page of a user's files
+        
+        Args:
+            user: Either a username string (B2C) or user dict with enterprise info
+            sort: Field to order by, one of FILE_SORT_FIELDS
+            direction: 1 for ascending, -1 for descending
+            limit: Page size
+            cursor: Cursor returned with the previous page
+            fields: Fields to return; all fields if omitted
+            
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The files and the cursor for the
+            next page (None on the last page)
+        """
+        return await self.repository.list_page(
+            self._user_query(user), sort, direction, limit, cursor=cursor, projection=self._projection(fields, sort)
+        )
+    
+    async def summarize_user_files(self, user: Union[str, Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Count a user's files and add up their sizes without listing them
+        
+        Returns:
+            Dict[str, int]: "count" and "total_size" in bytes
+        """
+        return await self.repository.summarize(self._user_query(user))
+    
+    async def stream_user_files(
+        self,
+        user: Union[str, Dict[str, Any]],
+        sort: str = "upload_date",
+        direction: int = -1,
+        limit: int = 0,
+        cursor: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Yield a user's files straight from the database cursor, in the same
+        order as list_user_files; limit 0 streams all of them
+        """
+        files = self.repository.iter_files(
+            self._user_query(user), sort, direction, cursor=cursor, projection=self._projection(fields, sort), limit=limit
+        )
+        async for file in files:
+            file.pop("_id", None)
+            yield file
+    
+    def _user_query(self, user: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """The filter selecting a user's files"""
+        query = {}
+        if isinstance(user, dict):
+            # Enterprise user
+            if "enterprise_id" in user:
+                query["enterprise_id"] = user["enterprise_id"]
+            if "username" in user:
+                query["user_id"] = user["username"].lower()
+        else:
+            # B2C/Individual user
+            query["user_id"] = user.lower()
+            query["user_type"] = "individual"
+        return query
+    
+    def _projection(self, fields: Optional[List[str]], sort: str) -> Optional[Dict[str, Any]]:
+        """Projection for a listing; the sort field is kept for the cursor"""
+        if not fields:
+            return None
+        projection = {field: 1 for field in fields}
+        projection[sort] = 1
+        return projection
+    
+    async def get_files_by_user_ids(self, user_ids: List[str]) -> Dict[str, List[Dict]]:
+        """
+        Get the files of several users with one query
+        
+        Args:
+            user_ids: Normalized usernames
+            
+        Returns:
+            Dict[str, List[Dict]]: File metadata per user id; users without files are absent
+        """
+        files_by_user = {}
+        try:
+            for file in await self.repository.find_files({"user_id": {"$in": list(user_ids)}}):
+                files_by_user.setdefault(file["user_id"], []).append(file)
+        except Exception as e:
+            logger.error(f"Error getting files for users: {str(e)}")
+        return files_by_user
+    
     async def get_file_metadata(self, user: Union[str, Dict[str, Any]], file_hash: str) -> Optional[Dict]:
         """
         Get file metadata for a specific file
@@ -136,12 +236,7 @@ class MetadataService:
             logger.debug(f"Querying file metadata with filter: {query}")
             
             # Find the file metadata
-            result = self.metadata_collection.find_one(query)
-            
-            if result and '_id' in result:
-                del result['_id']  # Remove MongoDB _id
-                
-            return result
+            return await self.repository.find_file(query)
         except Exception as e:
             logger.error(f"Error getting file metadata: {str(e)}")
             return None
@@ -174,8 +269,7 @@ class MetadataService:
             logger.debug(f"Removing file metadata with filter: {query}")
             
             # Delete the file metadata
-            result = self.metadata_collection.delete_one(query)
-            success = result.deleted_count > 0
+            success = await self.repository.remove(query)
             
             if success:
                 logger.info(f"Successfully removed metadata for file hash {file_hash}")
@@ -230,14 +324,7 @@ class MetadataService:
         """
         try:
             # Find all files for this enterprise
-            cursor = self.metadata_collection.find({"enterprise_id": enterprise_id})
-            
-            # Convert cursor to list and remove MongoDB _id
-            files = []
-            for file in cursor:
-                if '_id' in file:
-                    del file['_id']
-                files.append(file)
+            files = await self.repository.find_files({"enterprise_id": enterprise_id})
                 
             logger.info(f"Found {len(files)} files for enterprise {enterprise_id}")
             return files
@@ -257,17 +344,19 @@ class MetadataService:
         """
         try:
             # Find all files matching the query
-            cursor = self.metadata_collection.find(query)
-            
-            # Convert cursor to list and remove MongoDB _id
-            files = []
-            for file in cursor:
-                if '_id' in file:
-                    del file['_id']
-                files.append(file)
+            files = await self.repository.find_files(query)
                 
             logger.info(f"Found {len(files)} files matching query {query}")
             return files
         except Exception as e:
             logger.error(f"Error searching metadata: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+_metadata_service = None
+
+def get_metadata_service() -> MetadataService:
+    """Get the shared MetadataService, constructing it on first use."""
+    global _metadata_service
+    if _metadata_service is None:
+        _metadata_service = MetadataService()
+    return _metadata_service
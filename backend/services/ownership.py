@@ -0,0 +1,179 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from services.blockchain import get_blockchain_service
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# CIDs whose ownership answers each worker keeps
+OWNERSHIP_CACHE_SIZE = int(os.getenv("OWNERSHIP_CACHE_SIZE", "50000"))
+# Backstop expiry, in case the event watcher falls behind or is disabled
+OWNERSHIP_CACHE_TTL = float(os.getenv("OWNERSHIP_CACHE_TTL", "3600"))
+# Expiry of "not the owner" answers. A file is usually checked before its
+# anchor is mined, so these turn true soon and are kept only briefly.
+OWNERSHIP_NEGATIVE_TTL = float(os.getenv("OWNERSHIP_NEGATIVE_TTL", "15"))
+# How long an invalidation is remembered, so a contract read that started
+# before it is not cached; longer than any contract read takes
+OWNERSHIP_READ_WINDOW = 120
+# Set to "false" to rely on OWNERSHIP_CACHE_TTL alone
+OWNERSHIP_WATCHER_ENABLED = os.getenv("OWNERSHIP_WATCHER_ENABLED", "true").lower() != "false"
+# How often the watcher polls the contract's events
+OWNERSHIP_POLL_SECONDS = float(os.getenv("OWNERSHIP_POLL_SECONDS", "5"))
+# Most blocks read in one log query while catching up
+OWNERSHIP_MAX_BLOCK_RANGE = int(os.getenv("OWNERSHIP_MAX_BLOCK_RANGE", "1000"))
+# Share of cache hits re-checked against the chain to measure staleness
+OWNERSHIP_AUDIT_RATE = float(os.getenv("OWNERSHIP_AUDIT_RATE", "0.01"))
+
+class OwnershipCache:
+    """
+    Cached answers to the contract's verifyOwnership(address, cid).
+
+    Answers are cached per CID and address, negative ones only for
+    OWNERSHIP_NEGATIVE_TTL seconds. A watcher polls the contract's
+    CIDStored and CIDRemoved events and drops every cached answer for the
+    CIDs they name, so a removal stops being served within about one poll
+    interval. Invalidations are numbered and the latest number per CID is
+    remembered for OWNERSHIP_READ_WINDOW seconds; an answer whose read
+    started before an invalidation of its CID is not cached.
+
+    To measure how far the cache trails the chain, a sample of hits is
+    re-checked against the contract in the background and disagreements
+    are counted, alongside how many blocks the watcher is behind.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache("ownership", max_size=OWNERSHIP_CACHE_SIZE, default_ttl=OWNERSHIP_CACHE_TTL)
+        self._sequence = 0
+        self._invalidated = TTLCache("ownership_invalidations", max_size=OWNERSHIP_CACHE_SIZE, default_ttl=OWNERSHIP_READ_WINDOW)
+        self._watcher = None
+        self._audits = set()
+        self.chain_reads = 0
+        self.invalidations = 0
+        self.events_seen = 0
+        self.synced_block = None
+        self.head_block = None
+        self.synced_at = None
+        self.watch_errors = 0
+        self.audits = 0
+        self.stale_answers = 0
+
+    async def is_owner(self, address: str, cid: str, strict: bool = False) -> bool:
+        """
+        Whether the contract records `address` as the owner of `cid`
+
+        Args:
+            address: The wallet address
+            cid: The CID
+            strict: Read the contract even if an answer is cached
+        """
+        address = address.lower()
+        answers = None if strict else self.cache.get(cid)
+        answer = answers.get(address) if answers is not None else None
+        if answer is not None and (answer[1] is None or answer[1] > time.time()):
+            owned = answer[0]
+            if OWNERSHIP_AUDIT_RATE and random.random() < OWNERSHIP_AUDIT_RATE:
+                audit = asyncio.create_task(self._audit(address, cid, owned))
+                self._audits.add(audit)
+                audit.add_done_callback(self._audits.discard)
+            return owned
+
+        started = self._sequence
+        self.chain_reads += 1
+        owned = await get_blockchain_service().verify_ownership(address, cid)
+        # Only cache if no event for the CID arrived while we were reading
+        if (self._invalidated.get(cid) or 0) <= started:
+            answers = self.cache.get(cid) or {}
+            answers[address] = (owned, None if owned else time.time() + OWNERSHIP_NEGATIVE_TTL)
+            self.cache.set(cid, answers)
+        return owned
+
+    def invalidate(self, cid: str):
+        """Drop the cached answers for a CID whose ownership changed"""
+        self._sequence += 1
+        self._invalidated.set(cid, self._sequence)
+        self.cache.delete(cid)
+        self.invalidations += 1
+
+    async def _audit(self, address: str, cid: str, cached: bool):
+        try:
+            owned = await get_blockchain_service().verify_ownership(address, cid)
+        except Exception as e:
+            logger.debug(f"Ownership audit of {cid} failed: {str(e)}")
+            return
+        self.audits += 1
+        if owned != cached:
+            self.stale_answers += 1
+            logger.warning(f"Cached ownership of {cid} by {address} was stale ({cached}, chain says {owned})")
+            self.invalidate(cid)
+
+    async def _watch_forever(self):
+        blockchain = get_blockchain_service()
+        from_block = None
+        while True:
+            try:
+                self.head_block = await asyncio.to_thread(blockchain.get_block_number)
+                if from_block is None:
+                    # Nothing is cached yet, so earlier events cannot make it stale
+                    from_block = self.head_block + 1
+                    self.synced_block = self.head_block
+                    self.synced_at = time.time()
+                if from_block <= self.head_block:
+                    to_block = min(self.head_block, from_block + OWNERSHIP_MAX_BLOCK_RANGE - 1)
+                    events = await asyncio.to_thread(blockchain.get_ownership_events, from_block, to_block)
+                    for event in events:
+                        self.events_seen += 1
+                        self.invalidate(event["cid"])
+                    self.synced_block = to_block
+                    self.synced_at = time.time()
+                    from_block = to_block + 1
+                    if to_block < self.head_block:
+                        # Still catching up
+                        continue
+            except Exception as e:
+                self.watch_errors += 1
+                logger.error(f"Error reading ownership events: {str(e)}")
+            await asyncio.sleep(OWNERSHIP_POLL_SECONDS)
+
+    def start_watcher(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_forever())
+
+    async def stop_watcher(self):
+        tasks = [task for task in [self._watcher, *self._audits] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._watcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        lag_blocks: Optional[int] = None
+        if self.head_block is not None and self.synced_block is not None:
+            lag_blocks = self.head_block - self.synced_block
+        return {
+            "cache": self.cache.stats(),
+            "chain_reads": self.chain_reads,
+            "watcher_running": self._watcher is not None and not self._watcher.done(),
+            "head_block": self.head_block,
+            "synced_block": self.synced_block,
+            "lag_blocks": lag_blocks,
+            "seconds_since_sync": round(time.time() - self.synced_at, 3) if self.synced_at else None,
+            "events_seen": self.events_seen,
+            "invalidations": self.invalidations,
+            "watch_errors": self.watch_errors,
+            "audits": self.audits,
+            "stale_answers": self.stale_answers,
+            "stale_ratio": round(self.stale_answers / self.audits, 4) if self.audits else 0,
+        }
+
+_ownership_cache = None
+
+def get_ownership_cache() -> OwnershipCache:
+    """Get the shared OwnershipCache, constructing it on first use."""
+    global _ownership_cache
+    if _ownership_cache is None:
+        _ownership_cache = OwnershipCache()
+    return _ownership_cache
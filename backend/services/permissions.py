@@ -0,0 +1,84 @@
+import os
+import logging
+from typing import Any, Dict, List, Tuple
+from repositories import AccountRepository
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# How long a worker keeps the permissions_version it last read for a user.
+# A revocation made anywhere else (another worker, a script) takes effect
+# within this time.
+PERMISSION_CACHE_TTL = float(os.getenv("PERMISSION_CACHE_TTL", "60"))
+PERMISSION_CACHE_SIZE = int(os.getenv("PERMISSION_CACHE_SIZE", "10000"))
+
+class PermissionResolver:
+    """
+    Resolves account permissions for the RBAC decorator.
+
+    Tokens issued at login carry the account's permissions and its
+    permissions_version ("perm_version"). Every write to an account's
+    permissions increments that version. The resolver caches the current
+    (version, permissions) of each account for PERMISSION_CACHE_TTL seconds
+    and compares the token's version with it:
+
+    - the same version: the token's claims are current and answer the check
+    - a newer version: the token was issued after a change this worker has
+      not seen yet; its claims answer the check and replace the cached entry
+    - an older version: the token predates a change, e.g. a revocation, and
+      the cached permissions answer the check
+
+    The accounts collection is read only when a user has no cached entry,
+    at most once per account per TTL. Tokens without claims are checked
+    against the cached permissions.
+    """
+
+    def __init__(self):
+        self.repository = AccountRepository()
+        self.cache = TTLCache("permissions", max_size=PERMISSION_CACHE_SIZE, default_ttl=PERMISSION_CACHE_TTL)
+
+    async def current(self, user_id: str) -> Tuple[int, List[str]]:
+        """Get the current (permissions_version, permissions) of an account"""
+        entry = self.cache.get(user_id)
+        if entry is None:
+            account = await self.repository.get_permissions(user_id)
+            if account:
+                entry = (account.get("permissions_version", 0), list(account.get("permissions", [])))
+            else:
+                entry = (0, [])
+            self.cache.set(user_id, entry)
+        return entry
+
+    async def token_claims(self, user_id: str) -> Dict[str, Any]:
+        """Permission claims to embed in a new access token"""
+        version, permissions = await self.current(user_id)
+        return {"permissions": permissions, "perm_version": version}
+
+    async def has_permission(self, claims: Dict[str, Any], permission: str) -> bool:
+        """Check a permission for the holder of a verified token"""
+        user_id = claims.get("sub")
+        version, permissions = await self.current(user_id)
+
+        token_version = claims.get("perm_version")
+        token_permissions = claims.get("permissions")
+        if token_version is not None and token_permissions is not None and token_version >= version:
+            if token_version > version:
+                # The cached entry predates a change the token has seen
+                self.cache.set(user_id, (token_version, list(token_permissions)))
+            return permission in token_permissions
+
+        return permission in permissions
+
+    async def set_permissions(self, user_id: str, permissions: List[str]):
+        """Replace an account's permissions and revoke older tokens' claims"""
+        await self.repository.set_permissions(user_id, permissions)
+        self.cache.delete(user_id)
+
+_permission_resolver = None
+
+def get_permission_resolver() -> PermissionResolver:
+    """Get the shared PermissionResolver, constructing it on first use."""
+    global _permission_resolver
+    if _permission_resolver is None:
+        _permission_resolver = PermissionResolver()
+    return _permission_resolver
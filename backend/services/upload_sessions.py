@@ -0,0 +1,264 @@
+import os
+import uuid
+import asyncio
+import logging
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from repositories.upload_sessions import (
+    UploadSessionRepository, UPLOAD_OPEN, UPLOAD_FINALIZING, UPLOAD_COMPLETED
+)
+from services.uploads import store_upload
+
+logger = logging.getLogger(__name__)
+
+# Where chunks are spooled until the upload is finalized
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(tempfile.gettempdir(), "xinete-uploads"))
+# Chunk size used when the client does not ask for one, and the largest allowed
+UPLOAD_DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_DEFAULT_CHUNK_SIZE", str(8 * 1024 * 1024)))
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(64 * 1024 * 1024)))
+# Largest file a session may declare
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE", str(10 * 1024 * 1024 * 1024)))
+# Idle time after which an unfinished session and its spooled data are removed
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", str(24 * 3600)))
+# How often expired sessions are swept
+UPLOAD_SWEEP_SECONDS = float(os.getenv("UPLOAD_SWEEP_SECONDS", "300"))
+# Longest a chunk write may take; a write by a worker that died stops
+# blocking the finalize after this long
+UPLOAD_WRITE_LEASE_SECONDS = float(os.getenv("UPLOAD_WRITE_LEASE_SECONDS", "900"))
+
+def _chunk_length(session: Dict[str, Any], index: int) -> int:
+    """Expected length of a chunk; the last one may be short"""
+    return min(session["chunk_size"], session["size"] - index * session["chunk_size"])
+
+def _missing_chunks(session: Dict[str, Any]) -> List[int]:
+    received = set(session.get("received", []))
+    return [index for index in range(session["chunk_count"]) if index not in received]
+
+class UploadSessionService:
+    """
+    Resumable uploads: a client creates a session, PUTs chunks at offsets in
+    any order and in parallel, checks progress, and finalizes.
+
+    Chunks are written into a preallocated spool file on local disk, so
+    sessions must be served by workers that share UPLOAD_SESSION_DIR.
+    Every chunk write is registered on the session before it touches the
+    spool file, and finalizing waits until none is in progress, then
+    streams the spool file through the regular upload pipeline.
+    """
+
+    def __init__(self):
+        self.repository = UploadSessionRepository()
+        self._sweeper = None
+
+    def _path(self, upload_id: str) -> str:
+        return os.path.join(UPLOAD_SESSION_DIR, f"{upload_id}.part")
+
+    def _expires_at(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL)
+
+    def progress(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a session"""
+        missing = _missing_chunks(session)
+        received_bytes = session["size"] - sum(_chunk_length(session, index) for index in missing)
+        return {
+            "upload_id": session["upload_id"],
+            "filename": session["filename"],
+            "status": session["status"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"],
+            "chunk_count": session["chunk_count"],
+            "received_bytes": received_bytes,
+            "missing_offsets": [index * session["chunk_size"] for index in missing],
+            "expires_at": session["expires_at"],
+            "result": session.get("result"),
+        }
+
+    async def create(self, user: Dict[str, Any], filename: str, size: int, content_type: str = None, chunk_size: int = None) -> Dict[str, Any]:
+        chunk_size = chunk_size or UPLOAD_DEFAULT_CHUNK_SIZE
+        if size <= 0 or size > UPLOAD_MAX_SIZE:
+            raise HTTPException(status_code=400, detail=f"Size must be between 1 and {UPLOAD_MAX_SIZE} bytes")
+        if chunk_size <= 0 or chunk_size > UPLOAD_MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=400, detail=f"Chunk size must be between 1 and {UPLOAD_MAX_CHUNK_SIZE} bytes")
+
+        upload_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        session = {
+            "upload_id": upload_id,
+            "user_id": user["username"].lower(),
+            # The claims the finalized file's metadata is stored under
+            "user": {key: user[key] for key in ("username", "enterprise_id", "role") if key in user},
+            "filename": filename,
+            "content_type": content_type,
+            "size": size,
+            "chunk_size": chunk_size,
+            "chunk_count": -(-size // chunk_size),
+            "received": [],
+            "status": UPLOAD_OPEN,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": self._expires_at(),
+        }
+
+        # Preallocate the spool file so chunks can be written at any offset
+        def allocate():
+            os.makedirs(UPLOAD_SESSION_DIR, exist_ok=True)
+            with open(self._path(upload_id), "wb") as spool:
+                spool.truncate(size)
+
+        await asyncio.to_thread(allocate)
+        await self.repository.create(session)
+        session.pop("_id", None)
+        return self.progress(session)
+
+    async def get(self, upload_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+        session = await self.repository.get_for_user(upload_id, user["username"].lower())
+        if not session:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        return session
+
+    async def write_chunk(self, upload_id: str, user: Dict[str, Any], offset: int, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Write one chunk from the request body stream into the spool file
+
+        The body is written as it arrives, so memory use is bounded by the
+        size of the pieces the server reads, not the chunk size.
+        """
+        # Registering the write also checks the session is open, atomically
+        # with respect to a finalize claiming it
+        writer_id = uuid.uuid4().hex
+        session = await self.repository.begin_write(upload_id, user["username"].lower(), writer_id, UPLOAD_WRITE_LEASE_SECONDS)
+        if not session:
+            session = await self.get(upload_id, user)
+            raise HTTPException(status_code=409, detail=f"Upload session is {session['status']}")
+
+        index = None
+        written = 0
+        try:
+            if offset < 0 or offset >= session["size"] or offset % session["chunk_size"]:
+                raise HTTPException(status_code=400, detail=f"Offset must be a multiple of {session['chunk_size']} below {session['size']}")
+            index = offset // session["chunk_size"]
+            expected = _chunk_length(session, index)
+            fd = await asyncio.to_thread(os.open, self._path(upload_id), os.O_WRONLY)
+            try:
+                async for data in body:
+                    if written + len(data) > expected:
+                        raise HTTPException(status_code=400, detail=f"Chunk at offset {offset} must be {expected} bytes")
+                    await asyncio.to_thread(os.pwrite, fd, data, offset + written)
+                    written += len(data)
+                if written != expected:
+                    raise HTTPException(status_code=400, detail=f"Chunk at offset {offset} must be {expected} bytes, got {written}")
+            finally:
+                await asyncio.to_thread(os.close, fd)
+        except BaseException:
+            # A failed rewrite of a received chunk leaves it partially overwritten
+            await self.repository.end_write(upload_id, writer_id, index if written else None)
+            raise
+
+        session = await self.repository.add_chunk(upload_id, index, writer_id, self._expires_at())
+        if not session:
+            # Only possible once the write's lease ran out
+            raise HTTPException(status_code=409, detail="Upload session is no longer open")
+        return self.progress(session)
+
+    async def finalize(self, upload_id: str, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Store the assembled file through the regular upload pipeline"""
+        session = await self.get(upload_id, user)
+        if session["status"] == UPLOAD_COMPLETED:
+            return session["result"]
+        missing = _missing_chunks(session)
+        if missing:
+            raise HTTPException(status_code=409, detail=f"{len(missing)} chunks are missing")
+
+        claimed = await self.repository.claim_for_finalize(upload_id, session["user_id"], self._expires_at())
+        if not claimed:
+            session = await self.get(upload_id, user)
+            if session["status"] == UPLOAD_OPEN:
+                raise HTTPException(status_code=409, detail="Chunks are still being written; retry once they complete")
+            raise HTTPException(status_code=409, detail="Upload session is already being finalized")
+        session = claimed
+        # A failed write may have dropped a chunk since the check above
+        missing = _missing_chunks(session)
+        if missing:
+            await self.repository.set_status(upload_id, UPLOAD_OPEN)
+            raise HTTPException(status_code=409, detail=f"{len(missing)} chunks are missing")
+
+        path = self._path(upload_id)
+        try:
+            spool = await asyncio.to_thread(open, path, "rb")
+            try:
+                upload = UploadFile(
+                    spool,
+                    size=session["size"],
+                    filename=session["filename"],
+                    headers=Headers({"content-type": session["content_type"] or "application/octet-stream"}),
+                )
+                result = await store_upload(upload, session["user"])
+            finally:
+                await asyncio.to_thread(spool.close)
+        except Exception as e:
+            # Leave the session open so the client can retry the finalize
+            await self.repository.set_status(upload_id, UPLOAD_OPEN)
+            if isinstance(e, HTTPException):
+                raise
+            raise HTTPException(status_code=500, detail=str(e))
+
+        await self.repository.set_status(upload_id, UPLOAD_COMPLETED, {"result": result})
+        await self._remove_spool(upload_id)
+        return result
+
+    async def abort(self, upload_id: str, user: Dict[str, Any]):
+        session = await self.get(upload_id, user)
+        if session["status"] == UPLOAD_FINALIZING:
+            raise HTTPException(status_code=409, detail="Upload session is being finalized")
+        await self._remove_spool(upload_id)
+        await self.repository.remove(upload_id)
+
+    async def _remove_spool(self, upload_id: str):
+        try:
+            await asyncio.to_thread(os.remove, self._path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    async def sweep_expired(self) -> int:
+        """Remove expired sessions and their spooled data"""
+        removed = 0
+        while True:
+            expired = await self.repository.find_expired(datetime.utcnow())
+            if not expired:
+                return removed
+            for session in expired:
+                await self._remove_spool(session["upload_id"])
+                await self.repository.remove(session["upload_id"])
+                removed += 1
+
+    async def _sweep_forever(self):
+        while True:
+            try:
+                removed = await self.sweep_expired()
+                if removed:
+                    logger.info(f"Removed {removed} expired upload sessions")
+            except Exception as e:
+                logger.error(f"Error sweeping upload sessions: {str(e)}")
+            await asyncio.sleep(UPLOAD_SWEEP_SECONDS)
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+_upload_session_service = None
+
+def get_upload_session_service() -> UploadSessionService:
+    """Get the shared UploadSessionService, constructing it on first use."""
+    global _upload_session_service
+    if _upload_session_service is None:
+        _upload_session_service = UploadSessionService()
+    return _upload_session_service
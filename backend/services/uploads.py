@@ -0,0 +1,220 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import UploadFile
+from services.ipfs import get_ipfs_service, UploadResult
+from services.metadata import get_metadata_service
+from services.anchoring import enqueue_anchor
+from services.cid_resolver import get_cid_resolver
+from models.file_metadata import FileMetadata as StoredFileMetadata
+from repositories import FileMetadataRepository
+from repositories.anchor_jobs import ANCHOR_PENDING
+
+logger = logging.getLogger(__name__)
+
+# Files of one batch pinned to IPFS at the same time
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "8"))
+# Most files accepted in one batch
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "500"))
+
+file_metadata_repo = FileMetadataRepository()
+
+async def add_upload(file: UploadFile) -> Tuple[UploadResult, Optional[Dict[str, Any]]]:
+    """
+    Stream an upload to IPFS, pinning it only if its content is new
+
+    The file is read once: it is sent to IPFS unpinned while its content
+    digest is computed, and pinned once the digest shows no earlier upload
+    stored the same content. A duplicate is left unpinned for the node's
+    garbage collection to drop.
+
+    Returns:
+        Tuple: The upload result, and the metadata row of the earlier upload
+        of the same content, if any
+    """
+    upload = await get_ipfs_service().add_stream(file, pin=False)
+    existing = await file_metadata_repo.find_by_content_digest(upload.content_digest)
+    if not existing:
+        await get_ipfs_service().pin(upload.cid)
+    return upload, existing
+
+async def store_upload(file: UploadFile, current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store an uploaded file for a user: pin it, record its metadata and queue
+    its on-chain anchor
+
+    Content that was uploaded before, by anyone, is not pinned or anchored
+    again; the user gets a metadata row pointing at the existing CID and
+    anchor job.
+
+    Returns:
+        Dict: The upload response for the file
+    """
+    upload, existing = await add_upload(file)
+    size = upload.size
+    content_digest = upload.content_digest
+    if existing:
+        cid = existing["cid"]
+        file_hash = existing["file_hash"]
+        logger.info(f"Content of {file.filename} already stored as {cid}; not pinned again")
+    else:
+        cid = upload.cid
+        file_hash = hashlib.sha256(cid.encode()).hexdigest()
+
+    # Anchoring happens in the background; the transaction hash is filled in once submitted
+    tx_hash = ""
+    anchor_status = ANCHOR_PENDING
+
+    # Create metadata object
+    metadata = StoredFileMetadata(
+        filename=file.filename,
+        user=current_user,  # Pass the entire user object
+        size=size,
+        upload_date=datetime.now(),
+        content_type=file.content_type,
+        file_hash=file_hash,
+        transaction_hash=tx_hash,
+        cid=cid,
+        content_digest=content_digest,
+        anchor_status=anchor_status
+    )
+
+    # Store metadata using our service - will handle different user types
+    success = await get_metadata_service().store_metadata(metadata)
+    if not success:
+        logger.warning(f"Failed to store metadata for file {file_hash}")
+    # Downloads resolve the hash from the index instead of the contract
+    await get_cid_resolver().record(file_hash, cid)
+
+    # Queue the on-chain anchor only after the metadata row exists to receive its status
+    job = await enqueue_anchor(cid, file_hash, current_user.get("username"))
+    if job.get("status") != anchor_status:
+        # The same content was anchored before; carry its progress over to this row
+        anchor_status = job["status"]
+        tx_hash = job.get("tx_hash") or tx_hash
+        metadata.anchor_status = anchor_status
+        metadata.transaction_hash = tx_hash
+        await file_metadata_repo.set_anchor_status(file_hash, anchor_status, tx_hash)
+
+    return {
+        "status": "success",
+        "filename": file.filename,
+        "upload_date": metadata.upload_date,
+        "size": metadata.size,
+        "file_hash": file_hash,
+        "transaction_hash": tx_hash,
+        "cid": cid,
+        "content_digest": content_digest,
+        "anchor_status": anchor_status,
+        "deduplicated": existing is not None
+    }
+
+async def store_batch(files: List[UploadFile], current_user: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Store many uploaded files for a user with a single on-chain anchor
+
+    Files are pinned concurrently (UPLOAD_BATCH_CONCURRENCY at a time).
+    Their metadata is written in one bulk operation, and a JSON manifest
+    listing every stored file's CID and content digest is pinned and
+    anchored as one job, so the whole batch costs one transaction. A file
+    that fails does not fail the batch.
+
+    Returns:
+        Dict: The manifest, its anchor status and a result per file
+    """
+    slots = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+    async def pin(file: UploadFile) -> Dict[str, Any]:
+        async with slots:
+            try:
+                upload, existing = await add_upload(file)
+                if existing:
+                    return {"file": file, "cid": existing["cid"], "file_hash": existing["file_hash"],
+                            "size": upload.size, "content_digest": upload.content_digest, "deduplicated": True}
+                return {"file": file, "cid": upload.cid, "file_hash": hashlib.sha256(upload.cid.encode()).hexdigest(),
+                        "size": upload.size, "content_digest": upload.content_digest, "deduplicated": False}
+            except Exception as e:
+                logger.error(f"Error storing {file.filename} in batch: {str(e)}")
+                return {"file": file, "error": str(e)}
+
+    pinned = await asyncio.gather(*(pin(file) for file in files))
+    stored = [entry for entry in pinned if "error" not in entry]
+    if not stored:
+        return {
+            "status": "error",
+            "files": [{"filename": entry["file"].filename, "status": "error", "error": entry["error"]} for entry in pinned],
+        }
+
+    # One manifest covers the batch; anchoring it anchors every file it lists
+    upload_date = datetime.now()
+    manifest = {
+        "type": "xinete-upload-batch",
+        "uploaded_by": current_user.get("username"),
+        "upload_date": upload_date.isoformat(),
+        "files": [
+            {"filename": entry["file"].filename, "cid": entry["cid"], "file_hash": entry["file_hash"],
+             "content_digest": entry["content_digest"], "size": entry["size"]}
+            for entry in stored
+        ],
+    }
+    manifest_bytes = json.dumps(manifest, sort_keys=True).encode()
+    manifest_cid = await get_ipfs_service().add_bytes(manifest_bytes, "manifest.json", "application/json")
+    manifest_hash = hashlib.sha256(manifest_cid.encode()).hexdigest()
+
+    metadatas = [
+        StoredFileMetadata(
+            filename=entry["file"].filename,
+            user=current_user,
+            size=entry["size"],
+            upload_date=upload_date,
+            content_type=entry["file"].content_type,
+            file_hash=entry["file_hash"],
+            transaction_hash="",
+            cid=entry["cid"],
+            content_digest=entry["content_digest"],
+            anchor_status=ANCHOR_PENDING,
+            manifest_cid=manifest_cid,
+            manifest_hash=manifest_hash
+        )
+        # A file repeated within the batch gets one row
+        for entry in {entry["file_hash"]: entry for entry in stored}.values()
+    ]
+    if not await get_metadata_service().store_many(metadatas):
+        logger.warning(f"Failed to store metadata for batch {manifest_cid}")
+    await get_cid_resolver().record_many(
+        [(metadata.file_hash, metadata.cid) for metadata in metadatas] + [(manifest_hash, manifest_cid)]
+    )
+
+    # Queue the manifest's anchor only after the rows it updates exist
+    job = await enqueue_anchor(manifest_cid, manifest_hash, current_user.get("username"))
+    anchor_status = job.get("status", ANCHOR_PENDING)
+    tx_hash = job.get("tx_hash") or ""
+
+    results = []
+    for entry in pinned:
+        if "error" in entry:
+            results.append({"filename": entry["file"].filename, "status": "error", "error": entry["error"]})
+            continue
+        results.append({
+            "status": "success",
+            "filename": entry["file"].filename,
+            "upload_date": upload_date,
+            "size": entry["size"],
+            "file_hash": entry["file_hash"],
+            "cid": entry["cid"],
+            "content_digest": entry["content_digest"],
+            "deduplicated": entry["deduplicated"]
+        })
+
+    return {
+        "status": "success" if len(stored) == len(pinned) else "partial",
+        "manifest_cid": manifest_cid,
+        "manifest_hash": manifest_hash,
+        "transaction_hash": tx_hash,
+        "anchor_status": anchor_status,
+        "files": results
+    }
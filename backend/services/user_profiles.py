@@ -0,0 +1,63 @@
+import os
+import logging
+from typing import Any, Dict, Optional
+from repositories import UserRepository
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# How long a cached profile may be served; bounds staleness across workers
+USER_PROFILE_CACHE_TTL = float(os.getenv("USER_PROFILE_CACHE_TTL", "60"))
+USER_PROFILE_CACHE_SIZE = int(os.getenv("USER_PROFILE_CACHE_SIZE", "5000"))
+
+# The profile never includes the embedded files array or the password
+PROFILE_PROJECTION = {"files": 0, "password": 0}
+
+class UserProfileService:
+    """
+    Cached lookup of the user profile resolved on every authenticated request.
+
+    Entries expire after USER_PROFILE_CACHE_TTL seconds. Each username also
+    has a generation number that invalidate() increments; a profile read
+    that started before an invalidation is not cached, so a write in this
+    worker is visible to the next request.
+    """
+
+    def __init__(self):
+        self.repository = UserRepository()
+        self.cache = TTLCache("user_profiles", max_size=USER_PROFILE_CACHE_SIZE, default_ttl=USER_PROFILE_CACHE_TTL)
+        self._generations = {}
+
+    async def get_profile(self, username: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the projected profile of a (normalized) username
+
+        Returns:
+            Optional[Dict]: A copy of the profile, or None if the user does not exist
+        """
+        generation = self._generations.get(username, 0)
+        cached = self.cache.get(username)
+        if cached is not None and cached[0] == generation:
+            return dict(cached[1])
+
+        profile = await self.repository.get_by_username(username, PROFILE_PROJECTION)
+        if profile is None:
+            return None
+        # Only cache if the user was not written while we were reading
+        if self._generations.get(username, 0) == generation:
+            self.cache.set(username, (generation, profile))
+        return dict(profile)
+
+    def invalidate(self, username: str):
+        """Drop the cached profile after the user document is written"""
+        self._generations[username] = self._generations.get(username, 0) + 1
+        self.cache.delete(username)
+
+_user_profile_service = None
+
+def get_user_profile_service() -> UserProfileService:
+    """Get the shared UserProfileService, constructing it on first use."""
+    global _user_profile_service
+    if _user_profile_service is None:
+        _user_profile_service = UserProfileService()
+    return _user_profile_service
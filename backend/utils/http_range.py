@@ -0,0 +1,161 @@
+"""
+HTTP Range and conditional request helpers for file downloads.
+
+Files are addressed by CID, so their content never changes: the CID is a
+strong ETag, and responses can be cached as immutable. Range requests are
+answered with 206 Partial Content, a single range as a plain body and
+several ranges as multipart/byteranges (RFC 9110, section 14).
+"""
+
+import os
+import uuid
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# Cache-Control sent with downloads; the content behind a CID is immutable
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, max-age=31536000, immutable")
+# More ranges than this in one request are ignored and the whole file is sent
+MAX_RANGES = int(os.getenv("DOWNLOAD_MAX_RANGES", "16"))
+
+class RangeNotSatisfiable(Exception):
+    """No requested range overlaps the file (answer 416)"""
+
+def etag_for(cid: str) -> str:
+    return f'"{cid}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists the ETag (weak comparison)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a Range header against a file size
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: Inclusive (start, end) byte ranges,
+        sorted and with overlapping ranges merged, or None if the header is
+        absent, malformed, not in bytes or asks for too many ranges, in
+        which case the whole file is sent
+
+    Raises:
+        RangeNotSatisfiable: If no range overlaps the file, which is always
+        the case for an empty file
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = spec.split(",")
+    if len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, dash, last = part.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first == "":
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0 or size == 0:
+                    # An empty file has no last bytes to send
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and start > end):
+            return None
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def content_range(start: int, end: int, size: int) -> str:
+    return f"bytes {start}-{end}/{size}"
+
+def unsatisfied_range(size: int) -> str:
+    return f"bytes */{size}"
+
+async def byte_slice(chunks: AsyncIterator[bytes], start: int, length: int) -> AsyncIterator[bytes]:
+    """Yield `length` bytes from offset `start` of a stream (for upstreams that ignore Range)"""
+    position = 0
+    async for chunk in chunks:
+        chunk_end = position + len(chunk)
+        if chunk_end > start and length > 0:
+            piece = chunk[max(start - position, 0):]
+            piece = piece[:length]
+            length -= len(piece)
+            yield piece
+        position = chunk_end
+        if length <= 0:
+            break
+
+class MultipartByteranges:
+    """
+    A multipart/byteranges body whose parts are streamed one after another
+
+    `open_part(start, end)` returns the bytes of one inclusive range as an
+    async iterator; only one part is open at a time.
+    """
+
+    def __init__(
+        self,
+        ranges: List[Tuple[int, int]],
+        size: int,
+        content_type: str,
+        open_part: Callable[[int, int], Awaitable[AsyncIterator[bytes]]],
+    ):
+        self.ranges = ranges
+        self.size = size
+        self.content_type = content_type
+        self.open_part = open_part
+        self.boundary = uuid.uuid4().hex
+
+    @property
+    def media_type(self) -> str:
+        return f"multipart/byteranges; boundary={self.boundary}"
+
+    def _part_header(self, start: int, end: int) -> bytes:
+        return (
+            f"--{self.boundary}\r\n"
+            f"Content-Type: {self.content_type}\r\n"
+            f"Content-Range: {content_range(start, end, self.size)}\r\n\r\n"
+        ).encode()
+
+    def _closing(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_length(self) -> int:
+        length = len(self._closing())
+        for start, end in self.ranges:
+            length += len(self._part_header(start, end)) + (end - start + 1) + 2
+        return length
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for start, end in self.ranges:
+            yield self._part_header(start, end)
+            async for chunk in await self.open_part(start, end):
+                yield chunk
+            yield b"\r\n"
+        yield self._closing()
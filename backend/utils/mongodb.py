@@ -1,104 +1,344 @@
 """
 MongoDB connection utility for the Xinete platform.
 This module provides a consistent way to connect to MongoDB across all routes.
+
+A single MongoClient is created lazily the first time any caller asks for it and
+is then shared by every route, service and middleware in the process, so a
+uvicorn worker holds exactly one connection pool. Async request handlers use
+the Motor client from get_async_client(), which shares the same settings.
 """
 
 import os
-from pymongo import MongoClient
+import logging
+import threading
+from pymongo import MongoClient, monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
 from urllib.parse import urlparse
+from utils.query_monitor import query_monitor_listener
+
+logger = logging.getLogger(__name__)
+
+# Database used by the application - we now know it's "xinetee" explicitly
+DEFAULT_DB_NAME = "xinetee"
+
+# Connection pool configuration
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
 
 def extract_db_name_from_uri(uri):
     """
     Parse MongoDB URI to extract database name, handling cases with
     authentication credentials and query parameters properly.
-    
+
     Returns the database name or a default value if not found
     """
     default_db = "xinete_storage"
-    
+
     if not uri:
         return default_db
-        
+
     try:
         # Parse the URI
         parsed = urlparse(uri)
-        
+
         # Extract path and remove leading slash
         path = parsed.path
         if path.startswith('/'):
             path = path[1:]
-            
+
         # If path has query parameters, extract just the DB name
         if '?' in path:
             path = path.split('?')[0]
-            
+
         # Return the extracted database name or default
         return path if path else default_db
     except Exception as e:
         print(f"Error parsing MongoDB URI: {e}")
         return default_db
 
-def get_mongo_connection():
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events so pool usage can be reported."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "pools_created": 0,
+            "pools_cleared": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checkins": 0,
+        }
+
+    def _incr(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+        stats["checked_out"] = stats["checkouts"] - stats["checkins"]
+        return stats
+
+    def pool_created(self, event):
+        self._incr("pools_created")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._incr("checkouts")
+
+    def connection_checked_in(self, event):
+        self._incr("checkins")
+
+# Process-wide client registry
+_client = None
+_async_client = None
+# Options the current Motor client was created with
+_async_client_options = None
+# Motor clients replaced while requests may still use them; closed at shutdown
+_retired_async_clients = []
+_collections = {}
+_async_collections = {}
+_resolved_candidate = None
+_registry_lock = threading.Lock()
+_pool_stats = PoolStatsListener()
+
+def _pool_options():
+    return {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [_pool_stats, query_monitor_listener],
+    }
+
+def _connection_candidates():
     """
-    Get a MongoDB connection with proper authentication.
-    Returns a tuple of (client, db)
+    Connection settings to try in order: the configured connection string,
+    explicit credentials against the default host, then a basic connection.
     """
     # Get MongoDB connection string from environment
     MONGODB_URL = os.getenv("MONGODB_URL", os.getenv("MONGO_URI", "mongodb://localhost:27017/xinete_storage"))
     MONGODB_USERNAME = os.getenv("MONGODB_USERNAME", "admin")
     MONGODB_PASSWORD = os.getenv("MONGODB_PASSWORD", "@dminXinetee@123")
-    MONGODB_DB = os.getenv("MONGODB_DB", os.getenv("MONGO_DB", "xinetee"))
 
-    # Connect to MongoDB with authentication
-    try:
-        # Use the combined approach to ensure authentication works
-        print(f"Connecting to MongoDB with authentication")
-        
-        # Direct connection with embedded auth is most reliable
+    return [
+        ("connection string", {
+            "host": MONGODB_URL,
+            "connectTimeoutMS": 5000,
+            "serverSelectionTimeoutMS": 5000,
+        }),
+        ("explicit auth", {
+            "host": 'mongodb://100.123.165.22:27017/',
+            "username": MONGODB_USERNAME,
+            "password": MONGODB_PASSWORD,
+            "authSource": 'admin',  # Specify the authentication database
+            "connectTimeoutMS": 5000,
+            "serverSelectionTimeoutMS": 5000,
+        }),
+        ("basic connection", {
+            "host": "mongodb://100.123.165.22:27017/",
+        }),
+    ]
+
+def _connect():
+    """
+    Create a MongoClient with proper authentication, trying the configured
+    connection string first and falling back to explicit credentials.
+    """
+    global _resolved_candidate
+    print(f"Connecting to MongoDB with authentication")
+
+    candidates = _connection_candidates()
+    for index, (label, options) in enumerate(candidates):
+        client = MongoClient(**options, **_pool_options())
+        if index == len(candidates) - 1:
+            # Last resort - basic connection without a ping
+            _resolved_candidate = options
+            return client
         try:
-            # First try using the connection string directly
-            client = MongoClient(MONGODB_URL, connectTimeoutMS=5000, serverSelectionTimeoutMS=5000)
             # Quick test
             client.admin.command('ping')
-            print("Connected to MongoDB using connection string")
+            print(f"Connected to MongoDB using {label}")
+            _resolved_candidate = options
+            return client
         except Exception as e:
-            print(f"Connection with string failed: {str(e)}, trying with explicit auth")
-            
-            try:
-                # Try using explicit auth with MongoClient
-                client = MongoClient(
-                    host=f'mongodb://100.123.165.22:27017/',
-                    username=MONGODB_USERNAME,
-                    password=MONGODB_PASSWORD,
-                    authSource='admin',  # Specify the authentication database
-                    connectTimeoutMS=5000,
-                    serverSelectionTimeoutMS=5000
-                )
-                # Quick test
-                client.admin.command('ping')
-                print("Connected to MongoDB using explicit auth")
-            except Exception as auth_err:
-                print(f"Explicit auth failed: {str(auth_err)}, falling back to basic connection")
-                # Last resort - basic connection
-                client = MongoClient("mongodb://100.123.165.22:27017/")
-
-        # Get database reference - we now know it's "xinetee" explicitly
-        db_name = "xinetee"  # Hard-coded based on your environment variables
-        print(f"Using database: {db_name}")
-        db = client[db_name]
-        
-        # Test connection
-        client.admin.command('ping')
-        print("Successfully connected to MongoDB")
-        return client, db
-    except Exception as e:
-        print(f"Failed to connect to MongoDB: {str(e)}")
-        raise
+            print(f"MongoDB connection using {label} failed: {str(e)}")
+            client.close()
+
+def get_client():
+    """
+    Get the shared MongoClient, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _registry_lock:
+            if _client is None:
+                try:
+                    _client = _connect()
+                    print(f"Using database: {DEFAULT_DB_NAME}")
+                except Exception as e:
+                    print(f"Failed to connect to MongoDB: {str(e)}")
+                    raise
+    return _client
+
+def get_database(name=None):
+    """
+    Get a database handle from the shared client.
+    """
+    return get_client()[name or DEFAULT_DB_NAME]
+
+def get_collection(name, db_name=None):
+    """
+    Get a cached collection handle from the shared client.
+    """
+    key = (db_name or DEFAULT_DB_NAME, name)
+    collection = _collections.get(key)
+    if collection is None:
+        collection = get_database(db_name)[name]
+        _collections[key] = collection
+    return collection
+
+def get_async_client():
+    """
+    Get the shared Motor client for use inside async request handlers.
+
+    The Motor client reuses the connection settings that the synchronous
+    client resolved, or the configured connection string if none has been
+    resolved yet. It does not perform any I/O until first used.
+    """
+    global _async_client, _async_client_options
+    if _async_client is None:
+        with _registry_lock:
+            if _async_client is None:
+                options = _resolved_candidate or _connection_candidates()[0][1]
+                _async_client = AsyncIOMotorClient(**options, **_pool_options())
+                _async_client_options = options
+    return _async_client
+
+async def connect_async():
+    """
+    Resolve working connection settings without blocking the event loop and
+    create the shared Motor client from them. Used by application startup.
+
+    Requests served before startup finishes may already have created a
+    client. It is kept if it uses the resolved settings; otherwise it is
+    replaced but not closed, since their operations may still be running,
+    and is closed with the others at shutdown.
+    """
+    global _async_client, _async_client_options, _resolved_candidate
+    if _async_client is not None and _resolved_candidate is not None:
+        return _async_client
+
+    candidates = _connection_candidates()
+    for index, (label, options) in enumerate(candidates):
+        client = AsyncIOMotorClient(**options, **_pool_options())
+        try:
+            if index < len(candidates) - 1:
+                await client.admin.command('ping')
+            logger.info(f"Connected to MongoDB using {label}")
+        except Exception as e:
+            logger.warning(f"MongoDB connection using {label} failed: {str(e)}")
+            client.close()
+            continue
+        with _registry_lock:
+            _resolved_candidate = options
+            if _async_client is not None and _async_client_options == options:
+                client.close()
+                return _async_client
+            if _async_client is not None:
+                _retired_async_clients.append(_async_client)
+                _async_collections.clear()
+            _async_client = client
+            _async_client_options = options
+        return client
+
+def get_async_database(name=None):
+    """
+    Get an async database handle from the shared Motor client.
+    """
+    return get_async_client()[name or DEFAULT_DB_NAME]
+
+def get_async_collection(name, db_name=None):
+    """
+    Get a cached async collection handle from the shared Motor client.
+    """
+    key = (db_name or DEFAULT_DB_NAME, name)
+    collection = _async_collections.get(key)
+    if collection is None:
+        collection = get_async_database(db_name)[name]
+        _async_collections[key] = collection
+    return collection
+
+def get_pool_stats():
+    """
+    Get connection pool statistics for the shared client.
+    """
+    stats = _pool_stats.snapshot()
+    stats["connected"] = _client is not None
+    stats["async_connected"] = _async_client is not None
+    stats["max_pool_size"] = MONGODB_MAX_POOL_SIZE
+    stats["min_pool_size"] = MONGODB_MIN_POOL_SIZE
+    return stats
+
+def close_mongo_connection():
+    """
+    Close the shared clients. The next call to get_client() or
+    get_async_client() reconnects.
+    """
+    global _client, _async_client, _async_client_options
+    with _registry_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            _collections.clear()
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
+            _async_client_options = None
+            _async_collections.clear()
+        for client in _retired_async_clients:
+            client.close()
+        _retired_async_clients.clear()
+
+def get_mongo_connection():
+    """
+    Get a MongoDB connection with proper authentication.
+    Returns a tuple of (client, db)
+    """
+    client = get_client()
+    return client, client[DEFAULT_DB_NAME]
 
 def get_users_collection():
     """
     Get the users collection with the proper connection.
     """
-    client, db = get_mongo_connection()
     users_collection_name = os.getenv("MONGO_USERS_COLLECTION", "users")
-    return db[users_collection_name]
+    return get_collection(users_collection_name)
@@ -0,0 +1,81 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token encoding the sort value and id of the
+last document of a page. The next page is fetched with a range query on the
+(sort field, id) pair, so its cost does not grow with the page number the
+way skip() does.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+
+def _encode_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, datetime):
+        return {"t": "dt", "v": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return {"t": "oid", "v": str(value)}
+    return {"t": "raw", "v": value}
+
+def _decode_value(encoded: Dict[str, Any]) -> Any:
+    kind = encoded.get("t")
+    if kind == "dt":
+        return datetime.fromisoformat(encoded["v"])
+    if kind == "oid":
+        return ObjectId(encoded["v"])
+    return encoded.get("v")
+
+def encode_cursor(sort_value: Any, doc_id: Any) -> str:
+    """Encode the (sort value, id) of the last document of a page"""
+    payload = json.dumps([_encode_value(sort_value), _encode_value(doc_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        HTTPException 400: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return _decode_value(sort_value), _decode_value(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def keyset_query(query: Dict[str, Any], sort_field: str, direction: int, cursor: Optional[str], id_field: str = "id") -> Dict[str, Any]:
+    """
+    Restrict a query to documents after the cursor position
+
+    Args:
+        query: The base filter
+        sort_field: Primary sort field (e.g. "timestamp")
+        direction: 1 for ascending, -1 for descending
+        cursor: Cursor returned with the previous page, or None for the first page
+        id_field: Unique tie-breaker field
+
+    Returns:
+        Dict: The filter for the next page
+    """
+    if not cursor:
+        return query
+
+    sort_value, doc_id = decode_cursor(cursor)
+    op = "$gt" if direction > 0 else "$lt"
+    after_cursor = {"$or": [
+        {sort_field: {op: sort_value}},
+        {sort_field: sort_value, id_field: {op: doc_id}}
+    ]}
+    return {"$and": [query, after_cursor]} if query else after_cursor
+
+def next_cursor(documents: List[Dict[str, Any]], limit: int, sort_field: str, id_field: str = "id") -> Optional[str]:
+    """Build the cursor for the page after `documents`, or None on the last page"""
+    if not documents or len(documents) < limit:
+        return None
+    last = documents[-1]
+    return encode_cursor(last.get(sort_field), last.get(id_field))
@@ -0,0 +1,65 @@
+"""
+Password hashing for the Xinete platform.
+
+Passwords are hashed with bcrypt through passlib. bcrypt is deliberately
+CPU-heavy, so hashing and verification run on a small dedicated thread pool
+(bcrypt releases the GIL) instead of the event loop. The pool is bounded, so
+a burst of logins can use at most PASSWORD_HASH_WORKERS cores and the rest
+of the worker's endpoints stay responsive.
+
+Records created before hashing was introduced still hold the plaintext
+password. They are recognised because passlib cannot identify them as a
+hash, are compared in constant time, and are rehashed on the next successful
+login. Hashes made with a different cost than BCRYPT_ROUNDS are also
+rehashed on login.
+"""
+
+import os
+import hmac
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+
+# bcrypt cost factor; each increment doubles the time per hash
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads available for hashing in each worker process
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+
+def is_password_hash(stored: str) -> bool:
+    """Whether a stored password is a hash rather than legacy plaintext"""
+    try:
+        return pwd_context.identify(stored) is not None
+    except Exception:
+        return False
+
+async def hash_password(password: str) -> str:
+    """Hash a password off the event loop"""
+    return await _run(pwd_context.hash, password)
+
+async def verify_password(password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password against a stored hash or legacy plaintext value
+
+    Returns:
+        Tuple[bool, Optional[str]]: Whether the password matches, and a new
+        hash to store when the record should be upgraded (legacy plaintext or
+        an outdated cost), otherwise None
+    """
+    if not stored:
+        return False, None
+
+    if not is_password_hash(stored):
+        # Legacy plaintext record
+        if not hmac.compare_digest(password.encode(), stored.encode()):
+            return False, None
+        return True, await hash_password(password)
+
+    return await _run(pwd_context.verify_and_update, password, stored)
@@ -0,0 +1,210 @@
+"""
+Per-route MongoDB command instrumentation for the Xinete platform.
+
+A pymongo CommandListener attributes every command to the HTTP request that
+issued it through a context variable set by request middleware. Each route
+template accumulates its request count, command count, time spent in the
+database, the commands it issues and its slowest commands, which makes N+1
+query patterns and slow queries visible. Commands slower than SLOW_QUERY_MS
+are also written to a dedicated "xinete.slow_queries" logger.
+
+Motor runs pymongo on executor threads with a copy of the caller's context,
+so commands issued from async handlers are attributed correctly.
+"""
+
+import os
+import heapq
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from pymongo import monitoring
+
+# Commands slower than this are logged to the slow query log
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# Optional file the slow query log is written to, in addition to the root handlers
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE", "")
+# Number of slowest commands kept per route
+SLOWEST_COMMANDS_PER_ROUTE = int(os.getenv("SLOWEST_COMMANDS_PER_ROUTE", "5"))
+
+slow_query_logger = logging.getLogger("xinete.slow_queries")
+if SLOW_QUERY_LOG_FILE:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG_FILE)
+    _handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    slow_query_logger.addHandler(_handler)
+
+# Commands that only reflect driver housekeeping
+_IGNORED_COMMANDS = {"ping", "hello", "ismaster", "isMaster", "saslStart", "saslContinue", "endSessions", "killCursors"}
+
+def _shape(value: Any) -> Any:
+    """Replace the literal values of a filter with "?" so it can be logged"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(item) for item in value] if any(isinstance(item, dict) for item in value) else "?"
+    return "?"
+
+def _describe(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    """Summarise a command without the values it carries"""
+    collection = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    description = {"command": command_name, "collection": collection}
+    if "filter" in command:
+        description["filter"] = _shape(command["filter"])
+    elif command.get("updates"):
+        description["filter"] = _shape(command["updates"][0].get("q", {}))
+    elif command.get("deletes"):
+        description["filter"] = _shape(command["deletes"][0].get("q", {}))
+    if "sort" in command:
+        description["sort"] = dict(command["sort"])
+    if "pipeline" in command:
+        description["pipeline"] = [next(iter(stage), None) for stage in command["pipeline"]]
+    return description
+
+class RequestQueries:
+    """Commands issued while handling one request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.commands = 0
+        self.db_ms = 0.0
+        self.by_command = {}
+        self.slowest = []
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, key, description: Dict[str, Any]):
+        with self._lock:
+            self._pending[key] = description
+
+    def finished(self, key, duration_ms: float, failed: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            description = self._pending.pop(key, None)
+            if description is None:
+                return None
+            self.commands += 1
+            self.db_ms += duration_ms
+            label = f"{description['command']}:{description['collection']}"
+            self.by_command[label] = self.by_command.get(label, 0) + 1
+            entry = dict(description, ms=round(duration_ms, 3), failed=failed)
+            self.slowest.append(entry)
+            return entry
+
+class RouteStats:
+    """Aggregated command statistics for one route template"""
+
+    def __init__(self):
+        self.requests = 0
+        self.commands = 0
+        self.db_ms = 0.0
+        self.request_ms = 0.0
+        self.max_commands = 0
+        self.by_command = {}
+        self._slowest = []
+        self._counter = 0
+
+    def add(self, queries: RequestQueries, request_ms: float):
+        self.requests += 1
+        self.commands += queries.commands
+        self.db_ms += queries.db_ms
+        self.request_ms += request_ms
+        self.max_commands = max(self.max_commands, queries.commands)
+        for label, count in queries.by_command.items():
+            self.by_command[label] = self.by_command.get(label, 0) + count
+        for entry in queries.slowest:
+            # The counter breaks ties so entries are never compared directly
+            self._counter += 1
+            item = (entry["ms"], self._counter, entry)
+            if len(self._slowest) < SLOWEST_COMMANDS_PER_ROUTE:
+                heapq.heappush(self._slowest, item)
+            else:
+                heapq.heappushpop(self._slowest, item)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "commands": self.commands,
+            "commands_per_request": round(self.commands / self.requests, 2) if self.requests else 0,
+            "max_commands_per_request": self.max_commands,
+            "db_ms": round(self.db_ms, 3),
+            "db_ms_per_request": round(self.db_ms / self.requests, 3) if self.requests else 0,
+            "request_ms_per_request": round(self.request_ms / self.requests, 3) if self.requests else 0,
+            "by_command": dict(sorted(self.by_command.items(), key=lambda item: -item[1])),
+            "slowest": [entry for _, _, entry in sorted(self._slowest, reverse=True)],
+        }
+
+# Request currently being handled in this context
+_current_request: ContextVar[Optional[RequestQueries]] = ContextVar("mongo_request_queries", default=None)
+
+_route_stats = {}
+_route_lock = threading.Lock()
+
+class QueryMonitorListener(monitoring.CommandListener):
+    """Attributes MongoDB commands to the request that issued them"""
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        queries = _current_request.get()
+        if queries is None:
+            return
+        queries.started((event.connection_id, event.request_id), _describe(event.command_name, event.command))
+
+    def _finished(self, event, failed: bool):
+        duration_ms = event.duration_micros / 1000
+        queries = _current_request.get()
+        if queries is None:
+            if duration_ms >= SLOW_QUERY_MS and event.command_name not in _IGNORED_COMMANDS:
+                slow_query_logger.warning(f"Slow MongoDB command ({duration_ms:.1f}ms) outside a request: {event.command_name}")
+            return
+        entry = queries.finished((event.connection_id, event.request_id), duration_ms, failed)
+        if entry is not None and duration_ms >= SLOW_QUERY_MS:
+            slow_query_logger.warning(f"Slow MongoDB command ({duration_ms:.1f}ms) in {queries.method} {queries.path}: {entry}")
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+query_monitor_listener = QueryMonitorListener()
+
+def begin_request(method: str, path: str):
+    """Start collecting commands for the current request; returns a reset token"""
+    queries = RequestQueries(method, path)
+    return queries, _current_request.set(queries)
+
+def end_request(queries: RequestQueries, token, route: str, request_ms: float):
+    """Fold the commands of a finished request into its route's statistics"""
+    _current_request.reset(token)
+    # Keep only the slowest commands of the request before aggregating
+    queries.slowest = heapq.nlargest(SLOWEST_COMMANDS_PER_ROUTE, queries.slowest, key=lambda entry: entry["ms"])
+    key = f"{queries.method} {route}"
+    with _route_lock:
+        stats = _route_stats.get(key)
+        if stats is None:
+            stats = _route_stats[key] = RouteStats()
+        stats.add(queries, request_ms)
+
+async def query_monitor_middleware(request, call_next):
+    """HTTP middleware that attributes MongoDB commands to route templates"""
+    queries, token = begin_request(request.method, request.url.path)
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        # The router stores the matched route in the shared scope
+        route = request.scope.get("route")
+        end_request(queries, token, getattr(route, "path", "<unmatched>"), (time.perf_counter() - start) * 1000)
+
+def get_route_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-route command statistics, busiest routes first"""
+    with _route_lock:
+        snapshot = {key: stats.as_dict() for key, stats in _route_stats.items()}
+    return dict(sorted(snapshot.items(), key=lambda item: -item[1]["db_ms"]))
+
+def reset_route_stats():
+    """Clear the collected statistics"""
+    with _route_lock:
+        _route_stats.clear()
@@ -0,0 +1,63 @@
+"""
+Request-scoped context for the Xinete platform.
+
+Middleware creates one RequestContext per HTTP request and stores it in a
+context variable. The authentication dependencies fill in the verified token
+claims, the resolved user and the enterprise id as they run, and any code
+running inside the request can read them with get_request_context() without
+the Request object being passed around.
+"""
+
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+@dataclass
+class RequestContext:
+    """Data resolved once per request"""
+    request_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    method: Optional[str] = None
+    path: Optional[str] = None
+    claims: Optional[Dict[str, Any]] = None
+    user: Optional[Dict[str, Any]] = None
+    enterprise_id: Optional[str] = None
+
+    @property
+    def username(self) -> Optional[str]:
+        if self.user and self.user.get("username"):
+            return self.user["username"]
+        return self.claims.get("sub") if self.claims else None
+
+    def set_claims(self, claims: Dict[str, Any]):
+        self.claims = claims
+        if claims.get("enterprise_id"):
+            self.enterprise_id = claims["enterprise_id"]
+
+    def set_user(self, user: Dict[str, Any]):
+        self.user = user
+        if not self.enterprise_id and user.get("enterprise_id"):
+            self.enterprise_id = user["enterprise_id"]
+
+_request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+def get_request_context() -> RequestContext:
+    """
+    Get the context of the current request
+
+    Outside a request (startup, background tasks) a fresh, detached context
+    is created so callers never need to check for None.
+    """
+    context = _request_context.get()
+    if context is None:
+        context = RequestContext()
+        _request_context.set(context)
+    return context
+
+async def request_context_middleware(request, call_next):
+    """HTTP middleware that creates the context for each request"""
+    token = _request_context.set(RequestContext(method=request.method, path=request.url.path))
+    try:
+        return await call_next(request)
+    finally:
+        _request_context.reset(token)
@@ -0,0 +1,93 @@
+"""
+Startup orchestration for the Xinete platform.
+
+Independent startup steps run concurrently and each one is timed. Steps that
+have not finished when the startup budget runs out keep running in the
+background, so a worker becomes ready without waiting for slow dependencies.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class StartupReport:
+    """Timing breakdown of the application startup phase"""
+
+    def __init__(self, budget_seconds: float):
+        self.budget_seconds = budget_seconds
+        self.steps = {}
+        self.ready_seconds = None
+        self.background_tasks = set()
+        self._started = time.perf_counter()
+
+    def record(self, name: str, status: str, seconds: float, error: str = None, issues: List = None):
+        entry = {"status": status, "seconds": round(seconds, 4)}
+        if error:
+            entry["error"] = error
+        if issues:
+            entry["issues"] = issues
+        self.steps[name] = entry
+
+    def mark_ready(self):
+        self.ready_seconds = round(time.perf_counter() - self._started, 4)
+
+    def as_dict(self) -> Dict:
+        return {
+            "budget_seconds": self.budget_seconds,
+            "ready_seconds": self.ready_seconds,
+            "steps": dict(self.steps),
+        }
+
+async def run_startup_steps(steps: Dict[str, Callable[[], Awaitable]], budget_seconds: float) -> StartupReport:
+    """
+    Run startup steps concurrently within a time budget
+
+    Args:
+        steps: Mapping of step name to a coroutine function with no arguments.
+            A step that completes but returns a non-empty list of issues is
+            marked "degraded" with the issues in its entry.
+        budget_seconds: How long to wait before declaring the worker ready
+
+    Returns:
+        StartupReport: Per-step timings; unfinished steps are marked "pending"
+        and update their entry when they complete
+    """
+    report = StartupReport(budget_seconds)
+
+    async def _timed(name, step):
+        start = time.perf_counter()
+        try:
+            issues = await step()
+            if issues:
+                report.record(name, "degraded", time.perf_counter() - start, issues=issues)
+                logger.warning(f"Startup step '{name}' completed with {len(issues)} issue(s)")
+            else:
+                report.record(name, "ok", time.perf_counter() - start)
+        except Exception as e:
+            report.record(name, "failed", time.perf_counter() - start, str(e))
+            logger.error(f"Startup step '{name}' failed: {str(e)}")
+
+    tasks = {name: asyncio.create_task(_timed(name, step)) for name, step in steps.items()}
+    _, pending = await asyncio.wait(tasks.values(), timeout=budget_seconds)
+
+    for name, task in tasks.items():
+        if task in pending:
+            report.record(name, "pending", budget_seconds)
+            report.background_tasks.add(task)
+            task.add_done_callback(report.background_tasks.discard)
+            logger.warning(f"Startup step '{name}' exceeded the {budget_seconds}s budget, continuing in background")
+
+    report.mark_ready()
+    breakdown = ", ".join(f"{name}={entry['seconds']}s ({entry['status']})" for name, entry in report.steps.items())
+    logger.info(f"Startup ready in {report.ready_seconds}s: {breakdown}")
+    return report
+
+async def cancel_background_steps(report: StartupReport):
+    """Cancel startup steps that are still running (used at shutdown)"""
+    for task in list(report.background_tasks):
+        task.cancel()
+    if report.background_tasks:
+        await asyncio.gather(*report.background_tasks, return_exceptions=True)
@@ -0,0 +1,41 @@
+"""
+JWT verification shared by the auth dependencies and the RBAC decorator.
+
+Dashboards poll several endpoints per second with the same token, so the
+verified claims are cached by the token's SHA-256 digest until the token's
+own exp claim. A cached token has already passed signature verification;
+the raw token is never stored.
+"""
+
+import os
+import hashlib
+import time
+from typing import Any, Dict
+import jwt
+from utils.cache import TTLCache
+
+SECRET_KEY = os.getenv("SECRET_KEY", os.getenv("JWT_SECRET"))
+ALGORITHM = "HS256"
+
+# Maximum number of verified tokens kept per worker
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+token_cache = TTLCache("jwt_claims", max_size=TOKEN_CACHE_SIZE)
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """
+    Verify a JWT and return its claims
+
+    Raises:
+        jwt.PyJWTError: If the token is invalid or expired
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        exp = payload.get("exp")
+        # Tokens without an expiry are verified every time
+        if exp is not None and exp > time.time():
+            token_cache.set(key, payload, expires_at=exp)
+    # Callers get their own copy so they cannot alter the cached claims
+    return dict(payload)
@@ -4,8 +4,12 @@ import { ethers } from 'ethers';
 import FileUpload from './FileUpload';
 import { FiDownload, FiTrash2 } from 'react-icons/fi';
 
+// Files requested per page; more are loaded on demand
+const FILES_PAGE_SIZE = 50;
+
 function Dashboard() {
   const [files, setFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState('');
   const { token, isConnected, userAddress } = useContext(AuthContext);
 
@@ -126,14 +130,17 @@ function Dashboard() {
     }
   };
 
-  const fetchFiles = async () => {
+  // Fetches the first page of files, or the page after `cursor` to append
+  const fetchFiles = async (cursor = null) => {
     if (!token) {
       setError('Authentication token is missing');
       return;
     }
 
     try {
-      const response = await fetch(`${import.meta.env.VITE_API_URL}/storage/files`, {
+      const params = new URLSearchParams({ limit: String(FILES_PAGE_SIZE) });
+      if (cursor) params.set('cursor', cursor);
+      const response = await fetch(`${import.meta.env.VITE_API_URL}/storage/files?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`,
           'X-Wallet-Address': userAddress
@@ -146,7 +153,9 @@ function Dashboard() {
       }
 
       const data = await response.json();
-      setFiles(data.files);
+      const page = data.files || [];
+      setFiles(cursor ? (previous) => [...previous, ...page] : page);
+      setNextCursor(data.next_cursor || null);
       setError('');
     } catch (err) {
       setError('Error fetching files: ' + err.message);
@@ -156,7 +165,7 @@ function Dashboard() {
   return (
     <div className="space-y-6">
       <div className="space-y-6">
-      <FileUpload onUploadSuccess={fetchFiles} />
+      <FileUpload onUploadSuccess={() => fetchFiles()} />
       <div className="bg-white dark:bg-gray-800 rounded-lg shadow-md p-6">
         <h2 className="text-xl font-semibold mb-4 text-gray-900 dark:text-white">Your Files</h2>
         {error && (
@@ -197,6 +206,14 @@ function Dashboard() {
             </div>
           ))}
         </div>
+        {nextCursor && (
+          <button
+            onClick={() => fetchFiles(nextCursor)}
+            className="mt-4 w-full px-4 py-2 text-sm text-blue-600 hover:text-blue-700 dark:text-blue-400 dark:hover:text-blue-300 border dark:border-gray-700 rounded-lg"
+          >
+            Load more
+          </button>
+        )}
       </div>
       </div>
     </div>
@@ -35,23 +35,25 @@ function EnterpriseDashboard() {
         const data = await response.json();
         setEnterpriseData(data);
         
-        // Fetch files
-        const filesResponse = await fetch(`${import.meta.env.VITE_API_URL}/storage/files`, {
-          headers: {
-            'Authorization': `Bearer ${token}`
-          }
-        });
+        // The five most recent files (the listing is newest first) and the
+        // totals, which the server computes without listing every file
+        const headers = { 'Authorization': `Bearer ${token}` };
+        const [filesResponse, summaryResponse] = await Promise.all([
+          fetch(`${import.meta.env.VITE_API_URL}/storage/files?limit=5`, { headers }),
+          fetch(`${import.meta.env.VITE_API_URL}/storage/files/summary`, { headers })
+        ]);
 
         if (filesResponse.ok) {
           const filesData = await filesResponse.json();
-          setRecentFiles(filesData.slice(0, 5)); // Get the 5 most recent files
-          
-          // Calculate total storage
-          const totalBytes = filesData.reduce((sum, file) => sum + (file.size || 0), 0);
-          const totalStorage = (totalBytes / (1024 * 1024)).toFixed(2); // Convert to MB
+          setRecentFiles(filesData.files || []);
+        }
+
+        if (summaryResponse.ok) {
+          const summary = await summaryResponse.json();
+          const totalStorage = (summary.total_size / (1024 * 1024)).toFixed(2); // Convert to MB
           
           setStats({
-            totalFiles: filesData.length,
+            totalFiles: summary.count,
             totalStorage,
             products: data.productCount || 0,
             batches: data.batchCount || 0